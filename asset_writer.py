@@ -0,0 +1,121 @@
+"""
+后台异步资产写入
+PNG 编码 (zlib) 在线程池中进行: Pillow 编码时释放 GIL，多个文件可以并行编码，并与下一阶段的模型推理重叠。
+每个阶段产出一张图就立即提交，run_stages 在读取某个文件前用 ready() 等待它写完，退出时等待全部写入并抛出首个错误。
+
+stage 完成标记 (then 回调) 在对应文件落盘之后执行，并且同一目录 (group) 内按提交顺序串行执行，
+保证 .checkpoint.json 不会先于图片写入，也不会因为完成顺序不同而相互覆盖。
+"""
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+# zlib 压缩策略 (Pillow 的 compress_type)。rle 对深度图 / 遮罩这类大片平坦区域又快又小
+PNG_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+
+def png_options(compress_level=6, strategy="default"):
+    """Image.save(format="PNG") 的压缩参数"""
+    return {"compress_level": int(compress_level), "compress_type": PNG_STRATEGIES[strategy]}
+
+
+class AssetWriter:
+    """
+    save: save(image, path) 形式的同步写入函数 (例如 depthflow_generator.save_image_atomic)
+    workers=0 时退化为同步写入，便于调试
+    """
+
+    def __init__(self, save, workers=2):
+        self.save = save
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset-writer") if workers else None
+        self._pending = {}      # path -> future
+        self._by_dir = {}       # 目录 -> 该目录最近一次提交的 future
+        self._lock = threading.Lock()
+        self._then_lock = threading.Lock()
+        self.stats = {"files": 0, "encode_seconds": 0.0, "wait_seconds": 0.0}
+
+    def _run(self, save, image, path, then, previous):
+        start = time.perf_counter()
+        save(image, path)
+        with self._lock:
+            self.stats["files"] += 1
+            self.stats["encode_seconds"] += time.perf_counter() - start
+        # 同目录内按提交顺序完成 (previous 先提交，FIFO 线程池中不会死锁)；
+        # 没有回调的写入也要等待，否则链条在此断开，后面的回调可能先于前面的回调执行
+        if previous is not None:
+            previous.result()
+        if then is not None:
+            with self._then_lock:
+                then()
+
+    def submit(self, image, path, then=None, save=None, group=None):
+        """
+        提交一张图片的写入；then 在文件落盘后调用 (用于记录阶段完成)
+        save 可替换本次使用的写入函数 (例如 intermediate_store.save_array 写 .npy)
+        group: then 回调的排序范围，默认为文件所在目录；子目录中的文件可指定为输出目录，
+               使该输出目录之后的阶段标记等待它落盘
+        """
+        path = Path(path)
+        save = save or self.save
+        group = Path(group) if group is not None else path.parent
+        if self._pool is None:
+            self._run(save, image, path, then, None)
+            return None
+
+        with self._lock:
+            previous = self._by_dir.get(group)
+            future = self._pool.submit(self._run, save, image, path, then, previous)
+            self._pending[path] = future
+            self._by_dir[group] = future
+        return future
+
+    def ready(self, path):
+        """等待 path 的写入 (若仍在进行) 完成，返回 path，供后续阶段从磁盘读取"""
+        path = Path(path)
+        with self._lock:
+            future = self._pending.get(path)
+        if future is not None:
+            start = time.perf_counter()
+            future.result()
+            self.stats["wait_seconds"] += time.perf_counter() - start
+        return path
+
+    def wait(self):
+        """等待所有已提交的写入，有失败时抛出第一个异常"""
+        with self._lock:
+            futures = list(self._pending.values())
+        start = time.perf_counter()
+        wait(futures)
+        self.stats["wait_seconds"] += time.perf_counter() - start
+        for f in futures:
+            f.result()
+        with self._lock:
+            for path in [p for p, f in self._pending.items() if f.done()]:
+                del self._pending[path]
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def summary(self):
+        return (f"💾 Asset writer: {self.stats['files']} files, encode {self.stats['encode_seconds']:.1f}s "
+                f"on {self.workers or 1} thread(s), main thread waited {self.stats['wait_seconds']:.1f}s")
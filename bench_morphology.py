@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Rim Mask 形态学基准测试
+对比旧路径 (缩小到 1024 px + PIL MaxFilter/MinFilter + 双线性放大) 与
+新路径 (原分辨率 van Herk/Gil-Werman) 在不同分辨率和半径下的耗时，并校验新路径与 PIL 结果一致。
+
+用法: python bench_morphology.py [--sizes 1024 2048 4096] [--percents 0.01 0.02 0.04 0.08] [--repeat 3]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from mask_morphology import dilate, erode, rim_mask
+
+
+def legacy_rim_mask(mask_pil, image_size, max_parallax_percent=0.04):
+    """旧版 get_smart_inpaint_mask: 缩小到 1024 px 处理后再放大"""
+    w, h = image_size
+    process_max_dim = 1024
+    scale_factor = 1.0
+
+    if max(w, h) > process_max_dim:
+        scale_factor = process_max_dim / max(w, h)
+        process_w = int(w * scale_factor)
+        process_h = int(h * scale_factor)
+        mask_processing = mask_pil.resize((process_w, process_h), Image.Resampling.NEAREST)
+    else:
+        process_w, process_h = w, h
+        mask_processing = mask_pil
+
+    offset_px = int(min(process_w, process_h) * max_parallax_percent)
+    mask_dilated = mask_processing.filter(ImageFilter.MaxFilter(size=offset_px * 2 + 1))
+    safe_zone_radius = int(offset_px * 1.5)
+    mask_eroded = mask_processing.filter(ImageFilter.MinFilter(size=safe_zone_radius * 2 + 1))
+
+    arr_dilated = np.array(mask_dilated).astype(np.float32)
+    arr_eroded = np.array(mask_eroded).astype(np.float32)
+    arr_final = np.clip(arr_dilated - arr_eroded, 0, 255)
+    if np.sum(arr_eroded) < 100:
+        arr_final = arr_dilated
+
+    result = Image.fromarray(arr_final.astype(np.uint8), mode="L")
+    if scale_factor != 1.0:
+        result = result.resize((w, h), Image.Resampling.BILINEAR)
+    return result
+
+
+def synthetic_mask(long_edge):
+    """4:3 画幅，中心放一个椭圆主体加一个小矩形"""
+    w, h = long_edge, long_edge * 3 // 4
+    mask = Image.new("L", (w, h), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse([w * 0.3, h * 0.2, w * 0.7, h * 0.9], fill=255)
+    draw.rectangle([w * 0.05, h * 0.05, w * 0.15, h * 0.2], fill=255)
+    return mask
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_against_pil():
+    """小尺寸上与 PIL MaxFilter/MinFilter 逐像素比较"""
+    rng = np.random.default_rng(0)
+    arr = (rng.random((97, 131)) > 0.7).astype(np.uint8) * 255
+    pil = Image.fromarray(arr, mode="L")
+    for r in (1, 2, 5, 9):
+        size = 2 * r + 1
+        assert np.array_equal(dilate(arr, r), np.array(pil.filter(ImageFilter.MaxFilter(size)))), f"dilate r={r}"
+        assert np.array_equal(erode(arr, r), np.array(pil.filter(ImageFilter.MinFilter(size)))), f"erode r={r}"
+    print("✅ van Herk/Gil-Werman output matches PIL MaxFilter/MinFilter")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rim-mask morphology paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096], help="Long-edge resolutions")
+    parser.add_argument("--percents", type=float, nargs="+", default=[0.01, 0.02, 0.04, 0.08],
+                        help="max_parallax_percent values (radius = short edge * percent)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, best time is reported")
+    parser.add_argument("--json", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    check_against_pil()
+
+    results = []
+    print(f"\n{'size':>11} {'pct':>6} {'radius':>7} {'legacy (s)':>11} {'vHGW full-res (s)':>18} {'speedup':>8}")
+    for long_edge in args.sizes:
+        mask = synthetic_mask(long_edge)
+        arr = np.asarray(mask)
+        for pct in args.percents:
+            t_old = timed(lambda: legacy_rim_mask(mask, mask.size, pct), args.repeat)
+            t_new = timed(lambda: rim_mask(arr, pct), args.repeat)
+            radius = int(min(mask.size) * pct)
+            row = {"width": mask.width, "height": mask.height, "percent": pct, "radius": radius,
+                   "legacy_s": t_old, "vhgw_s": t_new, "speedup": t_old / t_new}
+            results.append(row)
+            print(f"{mask.width:>5}x{mask.height:<5} {pct:>6.2f} {radius:>7} {t_old:>11.4f} {t_new:>18.4f} "
+                  f"{row['speedup']:>7.1f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+流水线分阶段基准测试
+每个阶段一个用例: estimate_depth / generate_mask / get_smart_inpaint_mask / generate_background (sd 与 pyramid) /
+PNG 导出，在 512 / 2048 / 4096 长边的合成输入上运行。
+深度、分割、SD 模型替换为随机初始化的小型替身 (结构与输出格式与真实模型一致)，无需权重即可离线运行；
+测得的是流水线自身 (预处理、插值、形态学、修补调度、编码) 的开销，而不是真实模型的推理时间。
+
+每个用例记录: 墙钟时间、CPU 时间 (取 repeat 次的中位数)、运行期间的峰值 RSS、tracemalloc 峰值 (单独一次运行，
+避免追踪开销计入时间) 与分配器统计: CUDA 可用时取 torch.cuda 分配器的峰值，CPU 上记录 RSS 的峰值增量与
+运行结束后仍保留的增量，以及 tracemalloc 峰值，"source" 字段注明数值来源。
+结果写入 JSON；指定 --baseline 时与基线逐项比较，超出 --threshold 的用例视为回归并以退出码 1 结束。
+
+用法: python bench_pipeline.py [--sizes 512 2048 4096] [--repeat 3] [-o bench.json] [--baseline base.json --threshold 0.2]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import depthflow_generator as g
+from model_registry import MODEL_REGISTRY
+
+DEFAULT_SIZES = (512, 2048, 4096)
+# 回归判定使用的指标，以及低于该绝对差值时视为噪声
+GATED_METRICS = {"wall_s": 0.01, "tracemalloc_peak_mb": 1.0}
+
+
+# === 替身模型 ===
+
+def _standin_classes():
+    """torch 延迟导入，替身类在首次使用时定义"""
+    torch = g._import_torch()
+    nn = torch.nn
+
+    class DepthProcessor:
+        """与 Depth Anything 处理器一致: 短边缩放到 518，长宽取 14 的倍数，ImageNet 归一化"""
+        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+        def __call__(self, images=None, return_tensors="pt"):
+            ims = images if isinstance(images, list) else [images]
+            arrs = []
+            for im in ims:
+                scale = 518 / min(im.size)
+                size = (max(round(im.width * scale / 14), 1) * 14, max(round(im.height * scale / 14), 1) * 14)
+                arr = np.asarray(im.convert("RGB").resize(size, Image.Resampling.BICUBIC), dtype=np.float32) / 255.0
+                arrs.append((arr - self.mean) / self.std)
+            return {"pixel_values": torch.from_numpy(np.stack(arrs)).permute(0, 3, 1, 2).contiguous()}
+
+    class DepthModel(nn.Module):
+        """下采样 14 倍的卷积编码器 + 上采样头，输出 predicted_depth (B, H, W)"""
+
+        def __init__(self):
+            super().__init__()
+            self.encoder = nn.Sequential(
+                nn.Conv2d(3, 32, 14, stride=14), nn.GELU(),
+                nn.Conv2d(32, 64, 3, padding=1), nn.GELU(),
+                nn.Conv2d(64, 64, 3, padding=1), nn.GELU(),
+            )
+            self.head = nn.Conv2d(64, 1, 3, padding=1)
+
+        def forward(self, pixel_values=None):
+            x = self.head(self.encoder(pixel_values))
+            x = nn.functional.interpolate(x, size=pixel_values.shape[-2:], mode="bilinear", align_corners=False)
+            return types.SimpleNamespace(predicted_depth=torch.relu(x[:, 0]))
+
+    class SegModel(nn.Module):
+        """RMBG 风格输出: [[mask (B, 1, H, W)], ...]，值域 0-1"""
+
+        def __init__(self):
+            super().__init__()
+            self.body = nn.Sequential(
+                nn.Conv2d(3, 16, 4, stride=4), nn.ReLU(),
+                nn.Conv2d(16, 16, 3, padding=1), nn.ReLU(),
+                nn.Conv2d(16, 1, 3, padding=1),
+            )
+
+        def forward(self, x):
+            y = self.body(x)
+            y = nn.functional.interpolate(y, size=x.shape[-2:], mode="bilinear", align_corners=False)
+            return [[torch.sigmoid(y)]]
+
+    class InpaintPipe:
+        """SD 修补管线替身: 每个推理步跑一次小 UNet 式卷积，接口与 StableDiffusionInpaintPipeline.__call__ 一致"""
+
+        def __init__(self):
+            self.unet = nn.Sequential(nn.Conv2d(4, 32, 3, padding=1), nn.SiLU(), nn.Conv2d(32, 3, 3, padding=1))
+            self.components = {"unet": self.unet}
+
+        def __call__(self, prompt=None, negative_prompt=None, image=None, mask_image=None, height=None, width=None,
+                     num_inference_steps=25, guidance_scale=7.5, strength=1.0):
+            x = torch.from_numpy(np.stack([np.asarray(im.convert("RGB"), dtype=np.float32) / 255.0 for im in image]))
+            m = torch.from_numpy(np.stack([np.asarray(mk.convert("L"), dtype=np.float32) / 255.0 for mk in mask_image]))
+            x, m = x.permute(0, 3, 1, 2), m[:, None]
+            with torch.no_grad():
+                for _ in range(num_inference_steps):
+                    x = x + 0.1 * m * torch.tanh(self.unet(torch.cat([x, m], dim=1)))
+            out = (x.clamp(0, 1).permute(0, 2, 3, 1).numpy() * 255.0 + 0.5).astype(np.uint8)
+            return types.SimpleNamespace(images=[Image.fromarray(a, mode="RGB") for a in out])
+
+    return DepthProcessor, DepthModel, SegModel, InpaintPipe
+
+
+def install_standins(seed=0):
+    """把 depthflow_generator 的模型加载函数替换为随机初始化的替身"""
+    torch = g._import_torch()
+    torch.manual_seed(seed)
+    DepthProcessor, DepthModel, SegModel, InpaintPipe = _standin_classes()
+    depth, seg, pipe = DepthModel().eval(), SegModel().eval(), InpaintPipe()
+    g._load_depth_utils = lambda: (depth, DepthProcessor())
+    g._load_seg_model = lambda: seg
+    g._load_inpainting_pipe = lambda: pipe
+    MODEL_REGISTRY.clear()
+
+
+# === 合成输入 ===
+
+def synthetic_scene(long_edge):
+    """4:3 画幅: 渐变背景 + 椭圆主体 + 噪声纹理，返回 (RGB 图, 主体遮罩)"""
+    w, h = long_edge, long_edge * 3 // 4
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    rng = np.random.default_rng(long_edge)
+    rgb = np.stack([xx / w, yy / h, 0.5 + 0.5 * np.sin(xx / 37.0) * np.cos(yy / 23.0)], axis=-1)
+    rgb = np.clip(rgb * 200 + rng.normal(0, 8, rgb.shape), 0, 255).astype(np.uint8)
+    image = Image.fromarray(rgb, mode="RGB")
+
+    mask = Image.new("L", (w, h), 0)
+    ImageDraw.Draw(mask).ellipse([w * 0.35, h * 0.25, w * 0.65, h * 0.95], fill=255)
+    image.paste(Image.new("RGB", (w, h), (220, 60, 40)), (0, 0), mask)
+    return image, mask
+
+
+# === 测量 ===
+
+def _current_rss():
+    """当前 RSS (字节)，Linux 读 /proc，其它平台退回 ru_maxrss"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class RssSampler:
+    """后台线程每 interval 秒采样一次 RSS，记录用例运行期间的峰值"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start = self.peak = _current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end = _current_rss()
+        self.peak = max(self.peak, self.end)
+
+
+def _allocator_stats(torch, rss, traced_peak):
+    """CUDA 上为 torch.cuda 分配器峰值；CPU 上 torch 不提供分配器统计，改记进程 RSS 增量与 tracemalloc 峰值"""
+    if torch is None or not torch.cuda.is_available():
+        return {"source": "rss+tracemalloc",
+                "rss_start_mb": rss.start / 1024 ** 2,
+                "rss_peak_delta_mb": (rss.peak - rss.start) / 1024 ** 2,
+                "rss_retained_delta_mb": (rss.end - rss.start) / 1024 ** 2,
+                "tracemalloc_peak_mb": traced_peak / 1024 ** 2}
+    return {"source": "torch.cuda",
+            "max_allocated_mb": torch.cuda.max_memory_allocated() / 1024 ** 2,
+            "max_reserved_mb": torch.cuda.max_memory_reserved() / 1024 ** 2,
+            "num_alloc_retries": torch.cuda.memory_stats().get("num_alloc_retries", 0)}
+
+
+def measure(fn, repeat):
+    """运行 fn repeat 次 (stdout 静默)，再在 tracemalloc 下运行一次，返回指标 dict"""
+    torch = g.torch
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+    walls, cpus = [], []
+    with RssSampler() as rss, contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            w0, c0 = time.perf_counter(), time.process_time()
+            fn()
+            walls.append(time.perf_counter() - w0)
+            cpus.append(time.process_time() - c0)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        fn()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "wall_s": statistics.median(walls),
+        "wall_min_s": min(walls),
+        "cpu_s": statistics.median(cpus),
+        "peak_rss_mb": rss.peak / 1024 ** 2,
+        "rss_growth_mb": (rss.peak - rss.start) / 1024 ** 2,
+        "tracemalloc_peak_mb": traced_peak / 1024 ** 2,
+        "allocator": _allocator_stats(torch, rss, traced_peak),
+    }
+
+
+def build_cases(image, mask, out_dir, steps):
+    """每个阶段一个零参数可调用对象；模型在计时前已加载 (见 warm_models)"""
+    rim = g.get_smart_inpaint_mask(mask, image.size)
+    depth = g.estimate_depth(image)
+
+    def export_pngs():
+        g.save_image_atomic(image, out_dir / "image.png")
+        g.save_image_atomic(depth, out_dir / "depth.png")
+        g.save_image_atomic(rim, out_dir / "subject_mask.png")
+
+    return {
+        "estimate_depth": lambda: g.estimate_depth(image),
+        "generate_mask": lambda: g.generate_mask(image),
+        "get_smart_inpaint_mask": lambda: g.get_smart_inpaint_mask(mask, image.size),
+        "generate_background[sd]": lambda: g.generate_background(image, mask, "bench", steps, backend="sd"),
+        "generate_background[pyramid]": lambda: g.generate_background(image, mask, "bench", steps,
+                                                                      backend="pyramid"),
+        "png_export": export_pngs,
+    }
+
+
+def warm_models():
+    with contextlib.redirect_stdout(io.StringIO()):
+        g.get_depth_utils()
+        g.get_seg_model()
+        g.get_inpainting_pipe()
+
+
+def compare(results, baseline, threshold):
+    """返回回归列表 [(用例, 指标, 基线值, 当前值, 比例)]"""
+    regressions = []
+    for case, metrics in results.items():
+        base = baseline.get(case)
+        if not base:
+            continue
+        for metric, noise in GATED_METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if not old or new is None or new - old <= noise:
+                continue
+            ratio = new / old
+            if ratio > 1.0 + threshold:
+                regressions.append((case, metric, old, new, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmark with stand-in models.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Long-edge resolutions")
+    parser.add_argument("--cases", nargs="+", default=None, help="Only run cases whose name starts with these")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (median is reported)")
+    parser.add_argument("--steps", type=int, default=4, help="Inference steps for the SD stand-in")
+    parser.add_argument("-o", "--output", default=None, help="Write results as JSON")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative increase over the baseline before a case counts as a regression")
+    args = parser.parse_args()
+
+    install_standins()
+    warm_models()
+    torch = g.torch
+    print(f"⚙️ torch {torch.__version__} on {g.DEVICE}, {torch.get_num_threads()} threads, {os.cpu_count()} CPUs")
+
+    results = {}
+    print(f"\n{'case':<38} {'wall (s)':>9} {'cpu (s)':>9} {'peak RSS':>10} {'traced':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for long_edge in args.sizes:
+            image, mask = synthetic_scene(long_edge)
+            with contextlib.redirect_stdout(io.StringIO()):
+                cases = build_cases(image, mask, Path(tmp), args.steps)
+            for name, fn in cases.items():
+                if args.cases and not any(name.startswith(c) for c in args.cases):
+                    continue
+                key = f"{name}@{long_edge}"
+                results[key] = m = measure(fn, args.repeat)
+                print(f"{key:<38} {m['wall_s']:>9.3f} {m['cpu_s']:>9.3f} {m['peak_rss_mb']:>8.0f}MB "
+                      f"{m['tracemalloc_peak_mb']:>8.0f}MB")
+
+    report = {
+        "meta": {"python": platform.python_version(), "torch": torch.__version__, "device": g.DEVICE,
+                 "cpus": os.cpu_count(), "torch_threads": torch.get_num_threads(), "repeat": args.repeat,
+                 "platform": platform.platform()},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for case, metric, old, new, ratio in regressions:
+            print(f"❌ {case} {metric}: {old:.3f} -> {new:.3f} ({ratio - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+入口脚本启动耗时基准
+在全新子进程中分别测量 `python <script> --help` 与 `import <module>` 的耗时 (取多次最小值)，
+并检查导入后 torch / transformers / diffusers 是否已被加载。
+用于确认重型依赖只在需要推理的阶段才导入。
+
+用法: python bench_startup.py [--repeat 5] [--json startup.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.absolute()
+ENTRY_POINTS = ["depthflow_generator", "generate_mobile_assets"]
+HEAVY_MODULES = ["torch", "transformers", "diffusers"]
+
+_PROBE = (
+    "import sys; sys.path.insert(0, {base!r}); import {module}; "
+    "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+
+def _best_of(cmd, repeat):
+    """运行 repeat 次取最短耗时，返回 (秒, stdout 最后一行)；失败时返回 (None, stderr 最后一行)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=BASE_DIR)
+        best = min(best, time.perf_counter() - start)
+        if proc.returncode != 0:
+            return None, (proc.stderr.strip().splitlines() or ["failed"])[-1]
+    return best, (proc.stdout.strip().splitlines() or [""])[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure entry-point startup time.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    baseline, _ = _best_of([sys.executable, "-c", "pass"], args.repeat)
+    print(f"🐍 Interpreter startup: {baseline:.3f}s")
+
+    results = {"interpreter": baseline}
+    for module in ENTRY_POINTS:
+        help_time, _ = _best_of([sys.executable, str(BASE_DIR / f"{module}.py"), "--help"], args.repeat)
+        probe = _PROBE.format(base=str(BASE_DIR), module=module, heavy=HEAVY_MODULES)
+        import_time, loaded = _best_of([sys.executable, "-c", probe], args.repeat)
+        results[module] = {"help": help_time, "import": import_time, "heavy_loaded": loaded}
+
+        fmt = lambda t: "failed" if t is None else f"{t:.3f}s"
+        status = f"❌ {loaded}" if import_time is None else f"heavy modules loaded: {loaded or 'none'}"
+        print(f"📊 {module:<24} --help {fmt(help_time):>8}   import {fmt(import_time):>8}   {status}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
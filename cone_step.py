@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+离线锥步进 (cone-step) 图生成
+为 depth.png / depth_bg.png 预计算每个纹素的保守锥比 c: 以该纹素表面点为顶点、向上张开的圆锥内没有任何深度遮挡，
+着色器的 RayMarch 在射线高度 rayH > d(uv) 时可以一次前进 c * (rayH - d(uv)) 个纹素，而不是固定的 1/steps。
+
+计算方法 (纯 NumPy，按块并行):
+  对一组递增的半径 r_i，用 van Herk/Gil-Werman 最大值滤波求出 r_i 方形邻域内的最大深度 M_i，
+  切比雪夫距离在 (r_{i-1}, r_i] 内的遮挡点至少相距 r_{i-1}+1 个纹素，因此
+      c <= (r_{i-1} + 1) / (M_i - d)
+  超过 max_radius 的纹素深度不超过 1，再取 c <= max_radius / (1 - d)。所有约束取最小值，结果严格保守。
+深度优先读取 .intermediate/ 中的 float32 深度 (见 intermediate_store.py)，缺失时读 8 位 PNG。
+着色器采样的是截断量化的 8 位纹理，两者相差不到一个量化步长 (1/255)，
+因此每个深度差都加上 QUANT_MARGIN，锥比对浮点深度与 8 位纹理同时保守。
+
+编码: v = floor(255 * sqrt(min(c, S) / S))，S = scale_texels，存为 8 位 PNG (depth_cone.png / depth_bg_cone.png)。
+着色器解码: c_texels = S * v * v；换算到 uv 时除以纹理尺寸。参数写入 cone_step.json。
+
+用法: python cone_step.py <asset_dir> [--max-radius 64] [--workers N]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from intermediate_store import load_array, store_path
+from mask_morphology import dilate
+
+CONE_META = "cone_step.json"
+CONE_SOURCES = {"depth": "depth_cone.png", "depth_bg": "depth_bg_cone.png"}
+QUANT_MARGIN = 1.0 / 255.0
+
+
+def cone_radii(max_radius, growth=1.25):
+    """1, 2, 3, ... 逐步按 growth 倍增长到 max_radius 的半径序列"""
+    radii = [1]
+    while radii[-1] < max_radius:
+        radii.append(min(max(radii[-1] + 1, int(radii[-1] * growth)), max_radius))
+    return radii
+
+
+def _unit_depth(depth):
+    """uint8 (0-255) 或 float32 ([0, 1]) 深度 -> float32 [0, 1]"""
+    if depth.dtype == np.uint8:
+        return depth.astype(np.float32) / 255.0
+    return np.asarray(depth, dtype=np.float32)
+
+
+def cone_ratios(depth, max_radius, margin=QUANT_MARGIN):
+    """
+    对一块深度 (已含 max_radius 宽的边缘) 计算保守锥比，单位: 纹素 / 单位深度
+    depth: uint8 (0-255) 或 float32 ([0, 1])；margin: 加到每个深度差上的余量
+    """
+    d = _unit_depth(depth)
+    cone = max_radius / (np.maximum(1.0 - d, 0.0) + margin)
+
+    dilated = depth
+    prev = 0
+    for r in cone_radii(max_radius):
+        dilated = dilate(dilated, r - prev)
+        # 邻域包含中心，diff >= 0；余量使同一量化档内的邻居也受约束
+        diff = _unit_depth(dilated) - d + margin
+        with np.errstate(divide="ignore"):
+            bound = np.where(diff > 0, (prev + 1) / diff, np.inf)
+        np.minimum(cone, bound, out=cone)
+        prev = r
+    return cone
+
+
+def build_cone_map(depth, max_radius=64, tile=512, workers=None):
+    """
+    整图锥比 (float32)，按 tile x tile 分块 (每块带 max_radius 的边缘) 在线程池中并行计算。
+    depth: uint8 或 float32 深度 (可以是内存映射)。
+    NumPy 的大数组运算会释放 GIL，线程即可利用多核且无需拷贝整图到子进程。
+    """
+    h, w = depth.shape
+    out = np.empty((h, w), dtype=np.float32)
+    boxes = [(x0, y0, min(x0 + tile, w), min(y0 + tile, h))
+             for y0 in range(0, h, tile) for x0 in range(0, w, tile)]
+
+    def run(box):
+        x0, y0, x1, y1 = box
+        hx0, hy0 = max(x0 - max_radius, 0), max(y0 - max_radius, 0)
+        hx1, hy1 = min(x1 + max_radius, w), min(y1 + max_radius, h)
+        cone = cone_ratios(np.asarray(depth[hy0:hy1, hx0:hx1]), max_radius)
+        out[y0:y1, x0:x1] = cone[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(run, boxes))
+    return out
+
+
+def encode_cone_map(cone, scale_texels):
+    """sqrt 编码并向下取整量化，解码值不会大于真实锥比"""
+    v = np.sqrt(np.clip(cone / scale_texels, 0.0, 1.0))
+    return np.floor(v * 255.0).astype(np.uint8)
+
+
+def decode_cone_map(encoded, scale_texels):
+    v = encoded.astype(np.float32) / 255.0
+    return scale_texels * v * v
+
+
+def _float_depth(asset_dir, source):
+    """.intermediate/ 中与 PNG 同尺寸的 float32 深度，缺失时返回 None"""
+    path = store_path(asset_dir, source)
+    if not path.exists():
+        return None
+    with Image.open(asset_dir / f"{source}.png") as im:
+        w, h = im.size
+    arr = load_array(path)
+    return arr if arr.shape == (h, w) and arr.dtype == np.float32 else None
+
+
+def export_cone_maps(asset_dir, max_radius=64, workers=None):
+    """为资产目录中的 depth / depth_bg 生成锥步进图，并写入 cone_step.json"""
+    asset_dir = Path(asset_dir)
+    scale = float(2 * max_radius)
+    meta = {"encoding": "sqrt", "scale_texels": scale, "max_radius": max_radius, "maps": {}, "sources": {}}
+
+    for source, target in CONE_SOURCES.items():
+        src = asset_dir / f"{source}.png"
+        if not src.exists():
+            continue
+        depth = _float_depth(asset_dir, source)
+        meta["sources"][source] = "png" if depth is None else "float32"
+        if depth is None:
+            depth = np.asarray(Image.open(src).convert("L"))
+        cone = build_cone_map(depth, max_radius, workers=workers)
+        tmp = asset_dir / f".{target}.tmp"
+        Image.fromarray(encode_cone_map(cone, scale), mode="L").save(tmp, format="PNG")
+        os.replace(tmp, asset_dir / target)
+        meta["maps"][source] = target
+
+    with open(asset_dir / CONE_META, "w") as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate cone-step maps for an asset directory.")
+    parser.add_argument("asset_dir", help="Directory containing depth.png / depth_bg.png")
+    parser.add_argument("--max-radius", type=int, default=64, help="Search radius in texels")
+    parser.add_argument("--workers", type=int, default=None, help="Worker threads (default: all cores)")
+    args = parser.parse_args()
+
+    meta = export_cone_maps(args.asset_dir, args.max_radius, args.workers)
+    print(f"✅ Cone-step maps written: {', '.join(meta['maps'].values()) or 'none (no depth maps found)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+分块深度估计的辅助函数 (纯 NumPy)
+大图被切成带重叠的块分别推理，每块先按最小二乘对齐到低分辨率全局深度的尺度与偏移，
+再用羽化权重在重叠区混合，消除接缝。模型的显存 / 内存峰值只取决于块大小。
+"""
+import numpy as np
+
+
+def plan_tiles(width, height, tile_size, overlap):
+    """
+    返回覆盖整张图的块列表 [(x0, y0, x1, y1), ...]
+    块之间至少重叠 overlap 像素，块起点在轴上均匀分布，首尾两块贴齐图像边缘。
+    """
+    def axis_starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(tile_size - overlap, 1)
+        count = int(np.ceil((length - tile_size) / stride)) + 1
+        return [int(round(v)) for v in np.linspace(0, length - tile_size, count)]
+
+    tiles = []
+    for y0 in axis_starts(height):
+        for x0 in axis_starts(width):
+            tiles.append((x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)))
+    return tiles
+
+
+def feather_weights(tile_w, tile_h, overlap, left, top, right, bottom):
+    """
+    块的混合权重: 与相邻块重叠的边缘在 overlap 像素内从 0 线性升到 1，
+    贴着图像边界的边保持 1。left/top/right/bottom 表示该边是否有相邻块。
+    """
+    ramp = max(int(overlap), 1)
+
+    def axis(n, lo, hi):
+        w = np.ones(n, dtype=np.float32)
+        r = min(ramp, n)
+        edge = (np.arange(r, dtype=np.float32) + 0.5) / r
+        if lo:
+            w[:r] = np.minimum(w[:r], edge)
+        if hi:
+            w[n - r:] = np.minimum(w[n - r:], edge[::-1])
+        return w
+
+    return np.outer(axis(tile_h, top, bottom), axis(tile_w, left, right))
+
+
+def fit_scale_shift(src, ref, weights=None):
+    """
+    求 a, b 使 a * src + b 在最小二乘意义下逼近 ref。
+    单目深度模型输出的是相对深度，各块之间只差一个仿射变换。
+    """
+    src = src.astype(np.float64).ravel()
+    ref = ref.astype(np.float64).ravel()
+    w = np.ones_like(src) if weights is None else weights.astype(np.float64).ravel()
+
+    sw = w.sum()
+    if sw <= 0:
+        return 1.0, 0.0
+    mean_s = (w * src).sum() / sw
+    mean_r = (w * ref).sum() / sw
+    var_s = (w * (src - mean_s) ** 2).sum()
+    if var_s < 1e-12:
+        return 1.0, float(mean_r - mean_s)
+    a = (w * (src - mean_s) * (ref - mean_r)).sum() / var_s
+    return float(a), float(mean_r - a * mean_s)
+
+
+class TileAccumulator:
+    """按块累加加权深度，最后除以权重和得到无缝的整图深度"""
+
+    def __init__(self, width, height, overlap):
+        self.width, self.height = width, height
+        self.overlap = overlap
+        self.acc = np.zeros((height, width), dtype=np.float32)
+        self.weight = np.zeros((height, width), dtype=np.float32)
+
+    def add(self, box, depth, reference):
+        """depth / reference: 该块尺寸 (y1-y0, x1-x0) 的块预测与全局参考深度"""
+        x0, y0, x1, y1 = box
+        a, b = fit_scale_shift(depth, reference)
+        w = feather_weights(x1 - x0, y1 - y0, self.overlap,
+                            x0 > 0, y0 > 0, x1 < self.width, y1 < self.height)
+        self.acc[y0:y1, x0:x1] += w * (a * depth + b)
+        self.weight[y0:y1, x0:x1] += w
+
+    def result(self):
+        return self.acc / np.maximum(self.weight, 1e-6)
@@ -3,62 +3,232 @@ import sys
 import argparse
 import json
 import gc
+import glob
+import itertools
+import shutil
 import numpy as np
-import torch
-import torch.nn.functional as F
 from pathlib import Path
-from PIL import Image, ImageFilter
-
-# ==========================================
-# 🚑 兼容性补丁：修复 PyTorch 2.1.2 兼容性
-# ==========================================
-try:
-    import torch.utils._pytree as _pytree
-
-    if not hasattr(_pytree, "register_pytree_node") and hasattr(_pytree, "_register_pytree_node"):
-        _pytree.register_pytree_node = _pytree._register_pytree_node
-except:
-    pass
-
-# 引入模型库
-from transformers import AutoModelForDepthEstimation, AutoImageProcessor, AutoModelForImageSegmentation
-from diffusers import StableDiffusionInpaintPipeline
+from PIL import Image
+
+# torch / transformers / diffusers 导入耗时数秒，推迟到真正需要推理的阶段 (见 _import_torch 与各 _load_*)；
+# 配置、遮罩运算、导出等轻量路径在未安装 torch 时也可以使用
+torch = None
+F = None
+
+from model_registry import MODEL_REGISTRY
+from stage_cache import StageCache
+from depth_tiling import plan_tiles, TileAccumulator
+from guided_upsample import guided_upsample
+from mask_morphology import rim_mask
+from occlusion_mask import occlusion_mask, max_offset
+from inpainting import plan_roi_crops, crop_process_size, paste_feathered, pyramid_fill
+from texture_bundle import export_bundle
+from cone_step import export_cone_maps
+from lod_tiers import export_lod_tiers
+from tracing import TRACER, span, nbytes
+from inference_modes import parse_mode, prepare_model, prepare_input, inference_context
+from asset_writer import AssetWriter, PNG_STRATEGIES, png_options
+import stage_pipeline
+from intermediate_store import INTERMEDIATE_DIR, store_path, save_array, load_array, depth_to_image, mask_to_image
 
 # === 路径配置 ===
 BASE_DIR = Path(__file__).parent.absolute()
 MODEL_DIR = BASE_DIR / "models"
 OUTPUT_DIR = BASE_DIR / "output"
+CACHE_DIR = Path(os.environ.get("DEPTHFLOW_CACHE_DIR", BASE_DIR / "cache"))
 
-# 检查本地模型
+# 本地模型路径 (首次加载对应模型时才检查是否存在)
 PATH_DEPTH = MODEL_DIR / "depth_anything_v2"
 PATH_SEG = MODEL_DIR / "rmbg_1_4"
 PATH_SD = MODEL_DIR / "sd_inpainting"
 
-if not PATH_DEPTH.exists() or not PATH_SEG.exists() or not PATH_SD.exists():
-    print(f"❌ Error: Local models not found in {MODEL_DIR}")
-    sys.exit(1)
-
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"⚙️ Running on device: {DEVICE} (Torch: {torch.__version__})")
+# 推理设备，首次导入 torch 时确定
+DEVICE = None
+# 深度 / 分割模型单次前向的默认批大小
+DEFAULT_BATCH_SIZE = 4
+# 深度 / 分割模型的推理模式 (见 inference_modes.py)，例如 "inference+channels_last+bf16"
+INFERENCE_MODE = "fp32"
+
+# 分块深度估计: 长边超过 DEPTH_TILE_SIZE 的图片分块推理 (0 表示关闭)
+DEPTH_TILE_SIZE = 0
+DEPTH_TILE_OVERLAP = 128
+# 深度放大方式: "guided" (以原图为引导的快速导向滤波) 或 "bicubic"
+DEPTH_UPSAMPLE = "guided"
+
+# SD 修补参数 (同时参与阶段缓存键的计算)
+NEGATIVE_PROMPT = "bad quality, distorted, ugly, text, watermark, foreground object, person, clothes, skin"
+SD_STEPS = 25
+SD_GUIDANCE = 7.5
+MAX_PARALLAX_PERCENT = 0.04
+# 修补遮罩来源: "rim" 由分割遮罩外扩 / 内缩 MAX_PARALLAX_PERCENT 得到；
+# "depth" 由深度不连续与 config.json 的视差参数推导 (见 occlusion_mask.py)，不需要分割模型
+INPAINT_MASK_SOURCE = "rim"
+# "depth" 来源下覆盖每轴最大相机偏移 (None 时使用 App 的拖动范围，见 occlusion_mask.max_offset)
+OCCLUSION_MAX_OFFSET = None
+# 是否运行分割模型生成 subject_mask.png；关闭时写入全零遮罩 (只能与 "depth" 来源一起使用)
+SUBJECT_MASK = True
+# 修补方式: "roi" 只修补 Rim Mask 周围的裁剪区域，"full" 整图修补
+# ROI 裁剪总面积超过画面 ROI_MAX_AREA_RATIO 时退回整图；INPAINT_BATCH_SIZE 为同尺寸裁剪的批大小
+INPAINT_MODE = "roi"
+ROI_MAX_AREA_RATIO = 0.6
+INPAINT_BATCH_SIZE = 2
+# 修补后端: "sd" (Stable Diffusion)、"pyramid" (多尺度 push-pull 快速填充) 或 "auto"
+# auto: GPU 上用 SD；CPU 上修补面积不超过画面 AUTO_FAST_MAX_AREA 时用 pyramid，否则仍用 SD
+INPAINT_BACKEND = "auto"
+AUTO_FAST_MAX_AREA = 0.15
+
+# 写入 config.json 的视差参数 (着色器的 height / zoom / focus)，"depth" 修补遮罩据此推导
+CONFIG_HEIGHT = 0.20
+CONFIG_ZOOM = 1.0
+CONFIG_FOCUS = 0.0
+
+# 是否额外导出 GPU 直传纹理包 (scene.dftb，见 texture_bundle.py)
+EXPORT_BUNDLE = False
+BUNDLE_MIPS = True
+
+# 是否为 depth / depth_bg 预计算锥步进图 (见 cone_step.py)
+EXPORT_CONE_MAPS = False
+CONE_MAX_RADIUS = 64
+
+# 是否额外导出 16 位深度 (depth16.png / depth_bg16.png)；depth.png 始终为 8 位
+EXPORT_DEPTH16 = False
+# 运行结束后是否保留 .intermediate/ 下的浮点深度与遮罩 (.npy，见 intermediate_store.py)。
+# 默认删除: 它们只在一次运行内部 (以及中断后续跑时) 使用，之后的读取方都会退回 8 位 PNG
+KEEP_INTERMEDIATES = False
+
+# 额外生成的 LOD 档次 (长边像素，见 lod_tiers.py)，为空则只输出全分辨率
+LOD_TIERS = ()
+
+# 推理内部流水线的队列长度 (见 stage_pipeline.py)，0 为串行执行
+# run_stages 的深度 / 分割步骤各是一条连续的流水线，图片解码也在预处理线程中进行
+PIPELINE_DEPTH = 2
+
+# PNG 写入: 后台编码线程数 (0 为同步写入)、zlib 压缩级别 (0-9，Pillow 默认 6) 与压缩策略 (见 asset_writer.py)
+WRITE_WORKERS = 2
+PNG_COMPRESS_LEVEL = 6
+PNG_STRATEGY = "default"
+
+# 阶段结果缓存，默认关闭，由 enable_stage_cache() 或命令行开启
+STAGE_CACHE = None
 
 
 # === 辅助函数 ===
+def _import_torch():
+    """首次调用时导入 torch 并确定 DEVICE，之后直接返回"""
+    global torch, F, DEVICE
+    if torch is not None:
+        return torch
+    import torch as _torch
+    import torch.nn.functional as _F
+
+    # ==========================================
+    # 🚑 兼容性补丁：修复 PyTorch 2.1.2 兼容性
+    # ==========================================
+    try:
+        import torch.utils._pytree as _pytree
+
+        if not hasattr(_pytree, "register_pytree_node") and hasattr(_pytree, "_register_pytree_node"):
+            _pytree.register_pytree_node = _pytree._register_pytree_node
+    except:
+        pass
+
+    torch, F = _torch, _F
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"⚙️ Running on device: {DEVICE} (Torch: {torch.__version__})")
+    return torch
+
+
+def get_device():
+    _import_torch()
+    return DEVICE
+
+
 def cleanup():
     gc.collect()
-    if torch.cuda.is_available():
+    if torch is not None and torch.cuda.is_available():
         torch.cuda.empty_cache()
 
 
+def enable_stage_cache(cache_dir=CACHE_DIR, size_gb=2.0):
+    global STAGE_CACHE
+    STAGE_CACHE = StageCache(cache_dir, max_bytes=int(size_gb * 1024 ** 3))
+    return STAGE_CACHE
+
+
+def cached_stage(stage, inputs, model_path, params, compute):
+    """
+    对一组输入查询阶段缓存，只把未命中的条目交给 compute 批量计算。
+    inputs: [(PIL 或 ndarray, ...), ...] 每项是该阶段依赖的图像 / 数组元组
+    compute: 接收未命中的 inputs 子列表，返回等长的结果列表
+    """
+    if STAGE_CACHE is None:
+        return compute(inputs)
+
+    with span("cache.lookup", stage=stage) as sp:
+        keys = [STAGE_CACHE.make_key(stage, imgs, model_path, params) for imgs in inputs]
+        results = [STAGE_CACHE.get(stage, k) for k in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        sp.set(items=len(inputs), misses=len(missing))
+    if missing:
+        for i, r in zip(missing, compute([inputs[i] for i in missing])):
+            STAGE_CACHE.put(keys[i], r)
+            results[i] = r
+    return results
+
+
+def cached_stream(stage, items, model_path, params, on_result):
+    """
+    流式版 cached_stage: items 为 (key, 图像) 的可迭代对象，逐项查询缓存，
+    命中的结果直接交给 on_result(key, result)，未命中的 (key, 图像) 继续产出给模型。
+    返回 (未命中项的生成器, deliver)；模型结果交给 deliver(key, result)，写入缓存后再调用 on_result。
+    """
+    if STAGE_CACHE is None:
+        return iter(items), on_result
+
+    cache_keys = {}
+
+    def misses():
+        for key, image in items:
+            with span("cache.lookup", stage=stage) as sp:
+                cache_key = STAGE_CACHE.make_key(stage, [image], model_path, params)
+                result = STAGE_CACHE.get(stage, cache_key)
+                sp.set(hit=result is not None)
+            if result is not None:
+                on_result(key, result)
+            else:
+                cache_keys[key] = cache_key
+                yield key, image
+
+    def deliver(key, result):
+        STAGE_CACHE.put(cache_keys.pop(key), result)
+        on_result(key, result)
+
+    return misses(), deliver
+
+
 # === 模型加载 (纯本地) ===
+# 模型由 MODEL_REGISTRY 常驻缓存，同一批次内每个模型只加载一次
 
-def get_depth_utils():
+def _require_model(path):
+    if not path.exists():
+        raise FileNotFoundError(f"Local model not found: {path} (expected under {MODEL_DIR})")
+
+
+def _load_depth_utils():
+    from transformers import AutoModelForDepthEstimation, AutoImageProcessor
+
+    _require_model(PATH_DEPTH)
     print(f"Loading Depth Model from: {PATH_DEPTH.name}")
     processor = AutoImageProcessor.from_pretrained(PATH_DEPTH, local_files_only=True)
     model = AutoModelForDepthEstimation.from_pretrained(PATH_DEPTH, local_files_only=True).to(DEVICE)
+    model.eval()
     return model, processor
 
 
-def get_seg_model():
+def _load_seg_model():
+    from transformers import AutoModelForImageSegmentation
+
+    _require_model(PATH_SEG)
     print(f"Loading Seg Model from: {PATH_SEG.name}")
     model = AutoModelForImageSegmentation.from_pretrained(PATH_SEG, trust_remote_code=True, local_files_only=True).to(
         DEVICE)
@@ -66,7 +236,10 @@ def get_seg_model():
     return model
 
 
-def get_inpainting_pipe():
+def _load_inpainting_pipe():
+    from diffusers import StableDiffusionInpaintPipeline
+
+    _require_model(PATH_SD)
     print(f"Loading SD Pipeline from: {PATH_SD.name}")
     pipe = StableDiffusionInpaintPipeline.from_pretrained(
         PATH_SD,
@@ -80,49 +253,233 @@ def get_inpainting_pipe():
     return pipe
 
 
+KEY_DEPTH = f"depth:{PATH_DEPTH}"
+KEY_SEG = f"seg:{PATH_SEG}"
+KEY_SD = f"sd:{PATH_SD}"
+
+
+def _mode_key(key):
+    """不同推理模式转换出的模型分别缓存"""
+    return key if not parse_mode(INFERENCE_MODE) else f"{key}@{INFERENCE_MODE}"
+
+
+def _load_depth_prepared():
+    model, processor = _load_depth_utils()
+    return prepare_model(model, INFERENCE_MODE, DEVICE), processor
+
+
+def _load_seg_prepared():
+    return prepare_model(_load_seg_model(), INFERENCE_MODE, DEVICE)
+
+
+def get_depth_utils():
+    with span("model.get", model="depth"):
+        _import_torch()
+        return MODEL_REGISTRY.get(_mode_key(KEY_DEPTH), _load_depth_prepared)
+
+
+def get_seg_model():
+    with span("model.get", model="seg"):
+        _import_torch()
+        return MODEL_REGISTRY.get(_mode_key(KEY_SEG), _load_seg_prepared)
+
+
+def get_inpainting_pipe():
+    with span("model.get", model="sd"):
+        _import_torch()
+        return MODEL_REGISTRY.get(KEY_SD, _load_inpainting_pipe)
+
+
 # === 核心逻辑 ===
 
-def estimate_depth(image_pil):
-    """生成深度图"""
-    model, processor = get_depth_utils()
+def _depth_to_array(depth, image_pil, upsample=None):
+    """
+    把单张 predicted_depth (h, w) 放大回原图尺寸并归一化为 [0, 1] 的 float32 数组 (不量化)
+    upsample="guided": 只把低分辨率深度传回 CPU，以原图为引导做快速导向滤波，按行分条输出
+    upsample="bicubic": 在设备上双三次插值到全分辨率后再传回 CPU
+    """
+    upsample = upsample or DEPTH_UPSAMPLE
+    w, h = image_pil.size
 
-    if image_pil.mode != "RGB":
-        image_pil = image_pil.convert("RGB")
+    if upsample == "guided":
+        with span("cpu_transfer", shape=tuple(depth.shape), bytes=nbytes(depth)):
+            depth_lr = depth.float().cpu().numpy()
+        with span("depth.upsample", mode="guided", size=(w, h)):
+            return guided_upsample(depth_lr, image_pil, dtype=np.float32)
 
-    inputs = processor(images=image_pil, return_tensors="pt").to(DEVICE)
-    with torch.no_grad():
-        depth = model(**inputs).predicted_depth
+    with span("depth.upsample", mode="bicubic", size=(w, h)):
+        depth = F.interpolate(depth[None, None], size=(h, w), mode="bicubic", align_corners=False)
+        depth_min, depth_max = depth.min(), depth.max()
+        depth_norm = (depth - depth_min) / (depth_max - depth_min)
+    with span("cpu_transfer", shape=tuple(depth_norm.shape), bytes=nbytes(depth_norm)):
+        return depth_norm.cpu().numpy()[0, 0]
 
-    h, w = image_pil.size[::-1]
-    depth = torch.nn.functional.interpolate(
-        depth.unsqueeze(1), size=(h, w), mode="bicubic", align_corners=False
-    )
 
-    depth_min, depth_max = depth.min(), depth.max()
-    depth_norm = (depth - depth_min) / (depth_max - depth_min)
-    depth_uint8 = (depth_norm * 255.0).cpu().numpy().astype(np.uint8)[0, 0]
+def _depth_units(processor, items, batch_size):
+    """
+    深度模型的预处理，逐批产出 (keys, pixel_values)，pixel_values 已在 DEVICE 上。
+    处理器保持长宽比，输出尺寸随图片比例变化，只有同尺寸张量才能拼 batch，因此分桶:
+    各尺寸的桶在整个输入中保持打开，凑满 batch_size 立即产出，结尾再产出各桶的余数。
+    items 为 (key, 图像) 的可迭代对象，可以是惰性生成器；调用方按长宽比排序输入可以让桶尽快凑满、少占内存。
+    """
+    def emit(items):
+        pixel_values = prepare_input(torch.cat([pv for _, pv in items]).to(DEVICE), INFERENCE_MODE)
+        return [idx for idx, _ in items], pixel_values
+
+    buckets = {}
+    for idx, im in items:
+        with span("depth.preprocess", images=1):
+            pixel_values = processor(images=im, return_tensors="pt")["pixel_values"]
+        bucket = buckets.setdefault(tuple(pixel_values.shape[-2:]), [])
+        bucket.append((idx, pixel_values))
+        if len(bucket) == batch_size:
+            yield emit(bucket)
+            bucket.clear()
+
+    for bucket in buckets.values():
+        if bucket:
+            yield emit(bucket)
+
+
+def _infer_depth(model, unit):
+    indices, pixel_values = unit
+    with span("depth.inference", shape=tuple(pixel_values.shape), bytes=nbytes(pixel_values)), \
+            inference_context(INFERENCE_MODE, DEVICE):
+        return indices, model(pixel_values=pixel_values).predicted_depth.float()
+
+
+def _predict_raw_depth(images, batch_size):
+    """对一组 RGB 图像做批量前向 (串行)，返回模型输出分辨率的原始深度列表 (torch, 在 DEVICE 上)"""
+    model, processor = get_depth_utils()
+
+    results = [None] * len(images)
+    for unit in _depth_units(processor, enumerate(images), batch_size):
+        indices, depth = _infer_depth(model, unit)
+        for idx, d in zip(indices, depth):
+            results[idx] = d
+    return results
+
+
+def estimate_depth(images, batch_size=DEFAULT_BATCH_SIZE, tile_size=None, tile_overlap=None, as_array=False):
+    """
+    生成深度图
+    images 可以是单张 PIL 图像 (返回单张) 或列表 (返回列表，顺序与输入一致)。
+    默认返回 8 位灰度 PIL 图像；as_array=True 时返回 [0, 1] float32 数组，由调用方在导出时量化。
+    不同尺寸的图片按预处理后的张量尺寸分桶，同一桶内按 batch_size 批量前向。
+    预处理、前向与放大回原图尺寸按批组成流水线 (见 stage_pipeline.py)，批次之间相互重叠。
+    tile_size > 0 且图像长边超过 tile_size 时改用分块推理 (见 estimate_depth_tiled)。
+    """
+    single = isinstance(images, Image.Image)
+    images = [images] if single else list(images)
+    images = [im if im.mode == "RGB" else im.convert("RGB") for im in images]
+    tile_size = DEPTH_TILE_SIZE if tile_size is None else tile_size
+    tile_overlap = DEPTH_TILE_OVERLAP if tile_overlap is None else tile_overlap
+
+    results = [None] * len(images)
+    whole = [i for i, im in enumerate(images) if not tile_size or max(im.size) <= tile_size]
+    for i in range(len(images)):
+        if i not in whole:
+            results[i] = estimate_depth_tiled(images[i], tile_size, tile_overlap, batch_size, as_array=True)
+
+    if whole:
+        # 按长宽比排序，使预处理后同尺寸的图片相邻，在整个输入范围内凑批
+        order = sorted(whole, key=lambda i: images[i].width / images[i].height)
+        depth_stream(((i, images[i]) for i in order), results.__setitem__, batch_size)
 
-    del model, processor, inputs, depth
     cleanup()
+    if not as_array:
+        results = [depth_to_image(d) for d in results]
+    return results[0] if single else results
 
-    return Image.fromarray(depth_uint8, mode="L")
 
+def depth_stream(items, on_result, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    流式深度估计 (整图，不分块): 预处理、前向与放大组成一条连续的流水线
+    items: (key, PIL 图像) 的可迭代对象，在预处理线程中惰性求值，解码等读取开销因此与推理重叠
+    on_result(key, depth): 在后处理线程中交付 [0, 1] float32 深度
+    模型在第一项到达时才加载，items 为空 (例如全部命中缓存) 时不加载。
+    """
+    guides = {}  # key -> 原图，放大时作为引导，后处理后即释放
 
-def generate_mask(image_pil):
-    """RMBG-1.4 分割"""
-    model = get_seg_model()
+    def units():
+        it = iter(items)
+        first = next(it, None)
+        if first is None:
+            return
+        _, processor = get_depth_utils()
 
-    orig_w, orig_h = image_pil.size
-    input_size = (1024, 1024)
+        def rgb():
+            for key, im in itertools.chain([first], it):
+                guides[key] = im if im.mode == "RGB" else im.convert("RGB")
+                yield key, guides[key]
+
+        yield from _depth_units(processor, rgb(), batch_size)
 
-    im_tensor = image_pil.resize(input_size, Image.BILINEAR)
-    im_arr = np.array(im_tensor).astype(np.float32) / 255.0
-    im_arr = (im_arr - 0.5) / 0.5
-    im_tensor = torch.from_numpy(im_arr).permute(2, 0, 1).unsqueeze(0).float().to(DEVICE)
+    def post(out):
+        keys, depth = out
+        for key, d in zip(keys, depth):
+            on_result(key, _depth_to_array(d, guides.pop(key)))
 
-    with torch.no_grad():
-        preds = model(im_tensor)
+    stage_pipeline.run_pipeline("depth", units(), lambda u: _infer_depth(get_depth_utils()[0], u), post,
+                                PIPELINE_DEPTH)
 
+
+def estimate_depth_tiled(image_pil, tile_size=1024, overlap=128, batch_size=DEFAULT_BATCH_SIZE, as_array=False,
+                         upsample=None):
+    """
+    分块深度估计 (适用于 4K 以上的大图)
+    1. 整图低分辨率推理一次，作为全局参考
+    2. 切成带重叠的块，按 batch_size 批量推理，每块按 upsample (默认 DEPTH_UPSAMPLE，与整图路径相同)
+       放大到块尺寸，guided 模式以该块的原图为引导，再按最小二乘对齐到参考深度的尺度与偏移
+    3. 在重叠区用羽化权重混合，消除接缝
+    模型的内存峰值由块大小决定，与原图尺寸无关。裁块预处理、前向与对齐累加组成流水线。
+    """
+    upsample = upsample or DEPTH_UPSAMPLE
+    w, h = image_pil.size
+    model, processor = get_depth_utils()
+    global_depth = _predict_raw_depth([image_pil], 1)[0]
+    gh, gw = global_depth.shape
+
+    tiles = plan_tiles(w, h, tile_size, overlap)
+    print(f"🧩 Tiled depth: {len(tiles)} tiles of {tile_size}px (overlap {overlap}px)")
+    acc = TileAccumulator(w, h, overlap)
+
+    def units():
+        return _depth_units(processor, ((i, image_pil.crop(box)) for i, box in enumerate(tiles)), batch_size)
+
+    def post(out):
+        indices, depth = out
+        for box, d in zip((tiles[i] for i in indices), depth):
+            x0, y0, x1, y1 = box
+            if upsample == "guided":
+                # 块内归一化到 [0, 1] 不影响结果: 下面的仿射对齐会重新求尺度与偏移
+                with span("depth.upsample", mode="guided", size=(x1 - x0, y1 - y0)):
+                    tile = guided_upsample(d.float().cpu().numpy(), image_pil.crop(box), dtype=np.float32)
+            else:
+                with span("depth.upsample", mode="bicubic", size=(x1 - x0, y1 - y0)):
+                    tile = F.interpolate(d[None, None], size=(y1 - y0, x1 - x0), mode="bicubic",
+                                         align_corners=False)[0, 0].cpu().numpy()
+
+            # 参考深度: 全局深度中对应区域放大到块尺寸
+            gx0, gx1 = x0 * gw / w, x1 * gw / w
+            gy0, gy1 = y0 * gh / h, y1 * gh / h
+            ref_crop = global_depth[int(gy0):max(int(np.ceil(gy1)), int(gy0) + 1),
+                                    int(gx0):max(int(np.ceil(gx1)), int(gx0) + 1)]
+            ref = F.interpolate(ref_crop[None, None], size=(y1 - y0, x1 - x0), mode="bilinear", align_corners=False)
+
+            acc.add(box, tile, ref[0, 0].cpu().numpy())
+
+    stage_pipeline.run_pipeline("depth_tile", units(), lambda u: _infer_depth(model, u), post, PIPELINE_DEPTH)
+
+    with span("depth.tile_blend", tiles=len(tiles)):
+        depth = acc.result()
+    depth_min, depth_max = depth.min(), depth.max()
+    depth_norm = ((depth - depth_min) / max(depth_max - depth_min, 1e-6)).astype(np.float32)
+    return depth_norm if as_array else depth_to_image(depth_norm)
+
+
+def _unwrap_seg_output(preds):
+    """RMBG 的输出可能是嵌套 list / tuple 或带 pred / logits 字段的对象"""
     while isinstance(preds, (list, tuple)):
         preds = preds[0]
 
@@ -130,75 +487,233 @@ def generate_mask(image_pil):
         preds = preds.pred
     elif hasattr(preds, 'logits'):
         preds = preds.logits
+    return preds
+
+
+def _seg_to_array(pred, size):
+    """把单张分割输出 (1, h, w) 插值回原图尺寸并二值化为 uint8 (0 / 255)"""
+    orig_w, orig_h = size
+    with span("mask.interpolate", size=size):
+        pred = F.interpolate(pred[None], size=(orig_h, orig_w), mode='bilinear', align_corners=False)
+        binary = pred[0][0] > (0.5 if pred.max() <= 1.0 else 0)
+
+    with span("cpu_transfer", shape=tuple(binary.shape), bytes=nbytes(binary)):
+        result = binary.cpu().numpy()
 
-    preds = F.interpolate(preds, size=(orig_h, orig_w), mode='bilinear', align_corners=False)
+    return result.astype(np.uint8) * 255
 
-    result = (preds[0][0] > 0).cpu().numpy()
-    if preds.max() <= 1.0:
-        result = (preds[0][0] > 0.5).cpu().numpy()
 
-    mask_pil = Image.fromarray((result * 255).astype('uint8')).convert("L")
+def generate_mask(images, batch_size=DEFAULT_BATCH_SIZE, as_array=False):
+    """
+    RMBG-1.4 分割
+    images 可以是单张 PIL 图像或列表；输入统一缩放到 1024x1024，按 batch_size 批量前向。
+    默认返回 "L" 模式 PIL 遮罩；as_array=True 时返回 uint8 (0 / 255) 数组。
+    缩放归一化、前向与插值二值化按批组成流水线 (见 mask_stream)。
+    """
+    single = isinstance(images, Image.Image)
+    images = [images] if single else list(images)
+
+    results = [None] * len(images)
+    mask_stream(enumerate(images), results.__setitem__, batch_size)
 
-    del model, im_tensor, preds
     cleanup()
-    return mask_pil
+    if not as_array:
+        results = [mask_to_image(m) for m in results]
+    return results[0] if single else results
+
+
+def mask_stream(items, on_result, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    流式分割: items 为 (key, PIL 图像) 的可迭代对象，在预处理线程中惰性求值；
+    on_result(key, mask) 在后处理线程中交付 uint8 (0 / 255) 遮罩。模型在第一批到达推理线程时才加载。
+    """
+    _import_torch()
+    input_size = (1024, 1024)
+
+    def units():
+        it = iter(items)
+        while True:
+            chunk = list(itertools.islice(it, batch_size))
+            if not chunk:
+                return
+            with span("mask.preprocess", images=len(chunk)):
+                im_arr = np.stack([
+                    np.array(im.convert("RGB").resize(input_size, Image.BILINEAR)).astype(np.float32) / 255.0
+                    for _, im in chunk
+                ])
+                im_arr = (im_arr - 0.5) / 0.5
+                im_tensor = torch.from_numpy(im_arr).permute(0, 3, 1, 2).float().to(DEVICE)
+                im_tensor = prepare_input(im_tensor, INFERENCE_MODE)
+            # 后处理只需要原图尺寸，原图随即可以释放
+            yield [(key, im.size) for key, im in chunk], im_tensor
+
+    def infer(unit):
+        chunk, im_tensor = unit
+        model = get_seg_model()
+        with span("mask.inference", shape=tuple(im_tensor.shape), bytes=nbytes(im_tensor)), \
+                inference_context(INFERENCE_MODE, DEVICE):
+            return chunk, _unwrap_seg_output(model(im_tensor)).float()
+
+    def post(out):
+        chunk, preds = out
+        for (key, size), pred in zip(chunk, preds):
+            on_result(key, _seg_to_array(pred, size))
+
+    stage_pipeline.run_pipeline("mask", units(), infer, post, PIPELINE_DEPTH)
 
 
 def get_smart_inpaint_mask(mask_pil, image_size, max_parallax_percent=0.04):
     """
-    计算智能修补遮罩 (Rim Mask) - 性能优化版
-    先缩小处理再放大，解决大分辨率下 PIL MaxFilter 卡死的问题
+    计算智能修补遮罩 (Rim Mask)
+    直接在原分辨率上做 van Herk/Gil-Werman 形态学 (每像素 O(1))，
+    不再缩小处理后双线性放大，环形边界保持清晰。
+    mask_pil 也可以是 uint8 (0 / 255) 数组 (例如 .intermediate/ 中的内存映射)，尺寸一致时不复制。
     """
     w, h = image_size
+    if isinstance(mask_pil, np.ndarray) and mask_pil.shape != (h, w):
+        mask_pil = mask_to_image(mask_pil)
+    if isinstance(mask_pil, Image.Image):
+        if mask_pil.size != (w, h):
+            mask_pil = mask_pil.resize((w, h), Image.Resampling.NEAREST)
+        mask_pil = mask_pil.convert("L")
+
+    mask_arr = np.asarray(mask_pil, dtype=np.uint8)
+    with span("mask.rim", size=image_size):
+        return Image.fromarray(rim_mask(mask_arr, max_parallax_percent), mode="L")
 
-    # === 关键优化 ===
-    # 将处理分辨率限制在 1024 像素以内
-    # PIL 的 MaxFilter 算法复杂度随半径平方增长，缩小处理可提速百倍
-    process_max_dim = 1024
-    scale_factor = 1.0
-
-    if max(w, h) > process_max_dim:
-        scale_factor = process_max_dim / max(w, h)
-        process_w = int(w * scale_factor)
-        process_h = int(h * scale_factor)
-        # 使用 Nearest 缩放遮罩以保持二值特性
-        mask_processing = mask_pil.resize((process_w, process_h), Image.Resampling.NEAREST)
-    else:
-        process_w, process_h = w, h
-        mask_processing = mask_pil
 
-    # 在缩小后的尺寸上计算偏移量
-    offset_px = int(min(process_w, process_h) * max_parallax_percent)
+def get_occlusion_inpaint_mask(depth, config, max_offset=None):
+    """
+    计算去遮挡修补遮罩: 只覆盖相机在配置允许的偏移范围内可能揭示的近侧背景 (见 occlusion_mask.py)
+    depth: float32 [0, 1] 数组 (可以是 .intermediate/ 中的内存映射) 或 8 位深度图
+    """
+    if isinstance(depth, Image.Image):
+        depth = np.asarray(depth.convert("L"), dtype=np.float32) / 255.0
+    with span("mask.occlusion", size=depth.shape[::-1]):
+        return Image.fromarray(occlusion_mask(depth, config, offset=max_offset), mode="L")
 
-    # 1. 外扩 (Dilation)
-    mask_dilated = mask_processing.filter(ImageFilter.MaxFilter(size=offset_px * 2 + 1))
 
-    # 2. 内缩 (Erosion)
-    safe_zone_radius = int(offset_px * 1.5)
-    mask_eroded = mask_processing.filter(ImageFilter.MinFilter(size=safe_zone_radius * 2 + 1))
+def _sd_inpaint(images, masks, prompt, num_inference_steps):
+    """批量 SD 修补，images / masks 为同尺寸 (8 的倍数) 的 PIL 列表"""
+    pipe = get_inpainting_pipe()
+    w, h = images[0].size
+    n = len(images)
+    with span("sd.inference", batch=n, size=(w, h), steps=num_inference_steps):
+        return pipe(
+            prompt=[prompt] * n,
+            negative_prompt=[NEGATIVE_PROMPT] * n,
+            image=images,
+            mask_image=masks,
+            height=h,
+            width=w,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=SD_GUIDANCE,
+            strength=1.0  # 100% 重绘遮罩区域
+        ).images
+
+
+def _inpaint_full_frame(image_pil, smart_mask, prompt, num_inference_steps):
+    """整图缩放到最高 1024 后修补，再放大回原尺寸"""
+    w, h = image_pil.size
 
-    # 3. 计算环形区域
-    arr_dilated = np.array(mask_dilated).astype(np.float32)
-    arr_eroded = np.array(mask_eroded).astype(np.float32)
+    # 缩放至 8 的倍数 (最高 1024)
+    process_w = 1024 if w > 1024 else (w // 8) * 8
+    process_h = 1024 if h > 1024 else (h // 8) * 8
 
-    arr_final = arr_dilated - arr_eroded
-    arr_final = np.clip(arr_final, 0, 255)
+    with span("pil.resize", size=(process_w, process_h)):
+        img_in = image_pil.resize((process_w, process_h), Image.Resampling.LANCZOS)
+        mask_in = smart_mask.resize((process_w, process_h), Image.Resampling.NEAREST)
 
-    # 特殊情况处理
-    if np.sum(arr_eroded) < 100:
-        arr_final = arr_dilated
+    result = _sd_inpaint([img_in], [mask_in], prompt, num_inference_steps)[0]
 
-    result = Image.fromarray(arr_final.astype(np.uint8), mode="L")
+    # 恢复原始尺寸
+    with span("pil.resize", size=(w, h)):
+        return result.resize((w, h), Image.Resampling.LANCZOS)
 
-    # === 恢复原始尺寸 ===
-    if scale_factor != 1.0:
-        # 放大回去，使用 Bilinear 让边缘稍微平滑一点点
-        result = result.resize((w, h), Image.Resampling.BILINEAR)
 
+def _inpaint_roi(image_pil, smart_mask, boxes, prompt, num_inference_steps):
+    """
+    只对 Rim Mask 连通区域的裁剪框修补: 原分辨率推理 (长边超过 1024 时才缩小)，
+    同尺寸裁剪成批送入管线，结果羽化贴回原图
+    """
+    buckets = {}
+    for box in boxes:
+        buckets.setdefault(crop_process_size(box), []).append(box)
+
+    result = image_pil.copy()
+    for size, items in buckets.items():
+        for start in range(0, len(items), INPAINT_BATCH_SIZE):
+            chunk = items[start:start + INPAINT_BATCH_SIZE]
+            with span("pil.resize", size=size, crops=len(chunk)):
+                crops = [image_pil.crop(box).resize(size, Image.Resampling.LANCZOS) for box in chunk]
+                masks = [smart_mask.crop(box).resize(size, Image.Resampling.NEAREST) for box in chunk]
+            for box, patch in zip(chunk, _sd_inpaint(crops, masks, prompt, num_inference_steps)):
+                with span("inpaint.paste", box=box):
+                    patch = patch.resize((box[2] - box[0], box[3] - box[1]), Image.Resampling.LANCZOS)
+                    paste_feathered(result, patch, box)
     return result
 
-def generate_background(image_pil, mask_pil, prompt):
-    """SD Inpainting (智能边缘修补版)"""
+
+def _inpaint_pyramid(image_pil, smart_mask, boxes):
+    """经典快速填充: 有 ROI 裁剪框时逐框处理，否则整图处理"""
+    with span("inpaint.pyramid", crops=len(boxes)):
+        if not boxes:
+            return pyramid_fill(image_pil, smart_mask)
+
+        result = image_pil.copy()
+        for box in boxes:
+            result.paste(pyramid_fill(image_pil.crop(box), smart_mask.crop(box)), box[:2])
+        return result
+
+
+def select_inpaint_backend(inpaint_area_ratio, backend=None):
+    """根据设备与修补面积选择修补后端"""
+    backend = backend or INPAINT_BACKEND
+    if backend != "auto":
+        return backend
+    if get_device() == "cpu" and inpaint_area_ratio <= AUTO_FAST_MAX_AREA:
+        return "pyramid"
+    return "sd"
+
+
+def get_inpaint_mask(image_size, mask_pil=None, max_parallax_percent=MAX_PARALLAX_PERCENT,
+                     depth=None, config=None, max_offset=None):
+    """
+    最终的修补遮罩 ("L" 模式，原图尺寸): 给出 depth 时为去遮挡遮罩，否则为主体遮罩的 Rim Mask
+    """
+    w, h = image_size
+    if depth is not None:
+        print("🧠 Calculating disocclusion inpaint mask from depth...")
+        max_offset = OCCLUSION_MAX_OFFSET if max_offset is None else max_offset
+        smart_mask = get_occlusion_inpaint_mask(depth, config or {}, max_offset)
+        if smart_mask.size != (w, h):
+            smart_mask = smart_mask.resize((w, h), Image.Resampling.NEAREST)
+        return smart_mask
+
+    print("🧠 Calculating parallax-aware inpaint mask...")
+    # 计算智能遮罩
+    return get_smart_inpaint_mask(mask_pil, (w, h), max_parallax_percent=max_parallax_percent)
+
+
+def inpaint_area_ratio(smart_mask):
+    mask_arr = np.asarray(smart_mask)
+    return np.count_nonzero(mask_arr > 128) / mask_arr.size
+
+
+def generate_background(image_pil, mask_pil, prompt, num_inference_steps=SD_STEPS,
+                        max_parallax_percent=MAX_PARALLAX_PERCENT, inpaint_mode=None, backend=None,
+                        depth=None, config=None, max_offset=None, smart_mask=None):
+    """
+    SD Inpainting (智能边缘修补版)
+    mask_pil: 主体遮罩，PIL 图像或 uint8 数组
+    depth / config: 给出时改用深度不连续推导的去遮挡遮罩 (get_occlusion_inpaint_mask)，mask_pil 可为 None
+    max_offset: 去遮挡遮罩的每轴最大相机偏移，默认 OCCLUSION_MAX_OFFSET
+    smart_mask: 已经算好的修补遮罩 (get_inpaint_mask)，给出时忽略 mask_pil / depth
+    inpaint_mode="roi": 只裁剪 Rim Mask 周围区域以原分辨率修补 (裁剪总面积过大时退回整图)
+    inpaint_mode="full": 整图缩放到 1024 修补
+    backend: "sd" / "pyramid" / "auto"，见 select_inpaint_backend
+    """
+    inpaint_mode = inpaint_mode or INPAINT_MODE
 
     # 强制 RGB
     if image_pil.mode != "RGB":
@@ -206,56 +721,422 @@ def generate_background(image_pil, mask_pil, prompt):
 
     w, h = image_pil.size
 
-    print("🧠 Calculating parallax-aware inpaint mask...")
-    # 计算智能遮罩
-    smart_mask = get_smart_inpaint_mask(mask_pil, (w, h), max_parallax_percent=0.04)
+    if smart_mask is None:
+        smart_mask = get_inpaint_mask((w, h), mask_pil, max_parallax_percent, depth, config, max_offset)
 
     # 检查是否需要修补
-    mask_arr = np.array(smart_mask)
-    inpaint_area_ratio = np.sum(mask_arr > 128) / mask_arr.size
-    print(f"ℹ️ Inpaint Area Ratio: {inpaint_area_ratio:.1%}")
+    mask_arr = np.asarray(smart_mask)
+    area_ratio = inpaint_area_ratio(smart_mask)
+    print(f"ℹ️ Inpaint Area Ratio: {area_ratio:.1%}")
 
-    if inpaint_area_ratio < 0.001:
+    if area_ratio < 0.001:
         print("⚡ Subject is static or too small, skipping inpainting.")
         return image_pil
 
-    pipe = get_inpainting_pipe()
-
-    # 缩放至 8 的倍数 (最高 1024)
-    process_w = 1024 if w > 1024 else (w // 8) * 8
-    process_h = 1024 if h > 1024 else (h // 8) * 8
+    boxes = plan_roi_crops(mask_arr) if inpaint_mode == "roi" else []
+    roi_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes) / (w * h)
+    if roi_area > ROI_MAX_AREA_RATIO:
+        boxes = []
+
+    backend = select_inpaint_backend(area_ratio, backend)
+    if backend == "pyramid":
+        print("🎨 Generating background (pyramid fill)...")
+        result = _inpaint_pyramid(image_pil, smart_mask, boxes)
+    elif boxes:
+        print(f"🎨 Generating background (ROI Inpainting, {len(boxes)} crops, {roi_area:.1%} of frame)...")
+        result = _inpaint_roi(image_pil, smart_mask, boxes, prompt, num_inference_steps)
+    else:
+        print("🎨 Generating background (Rim Inpainting)...")
+        result = _inpaint_full_frame(image_pil, smart_mask, prompt, num_inference_steps)
 
-    img_in = image_pil.resize((process_w, process_h), Image.Resampling.LANCZOS)
-    mask_in = smart_mask.resize((process_w, process_h), Image.Resampling.NEAREST)
-
-    print("🎨 Generating background (Rim Inpainting)...")
-    result = pipe(
-        prompt=prompt,
-        negative_prompt="bad quality, distorted, ugly, text, watermark, foreground object, person, clothes, skin",
-        image=img_in,
-        mask_image=mask_in,
-        num_inference_steps=25,
-        guidance_scale=7.5,
-        strength=1.0  # 100% 重绘遮罩区域
-    ).images[0]
-
-    del pipe
     cleanup()
 
-    # 恢复原始尺寸
-    result = result.resize((w, h), Image.Resampling.LANCZOS)
-
     # === 关键步骤：合成 ===
     # 仅替换 smart_mask 覆盖的区域 (边缘)，保留原始背景和物体深层中心
     # 这样可以防止背景闪烁，并解决大物体修补困难的问题
-    final_comp = Image.composite(result, image_pil, smart_mask)
+    with span("inpaint.composite"):
+        final_comp = Image.composite(result, image_pil, smart_mask)
 
     return final_comp
 
 
 # === 主流程 ===
 
-def main(input_path, output_dir, prompt):
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def collect_inputs(input_spec):
+    """把 --input 解析为图片列表：单个文件、目录 (非递归) 或 glob 模式"""
+    spec = str(input_spec)
+    if any(ch in spec for ch in "*?["):
+        files = sorted(Path(p) for p in glob.glob(spec, recursive=True))
+    elif Path(spec).is_dir():
+        files = sorted(Path(spec).iterdir())
+    else:
+        files = [Path(spec)]
+    return [f for f in files if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS]
+
+
+def write_config(output_path, resolution):
+    config = {
+        "height": CONFIG_HEIGHT,
+        "steady": 0.0,
+        "focus": CONFIG_FOCUS,
+        "zoom": CONFIG_ZOOM,
+        "isometric": 0.0,
+        "offset_x": 0.0,
+        "offset_y": 0.0,
+        "resolution": resolution
+    }
+    tmp = output_path / ".config.json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(config, f, indent=4)
+    os.replace(tmp, output_path / "config.json")
+
+
+# === 断点续跑 ===
+# 每个阶段完成后立即原子写入输出目录，并在 .checkpoint.json 中记录输入签名与阶段参数。
+# --resume 时跳过签名与参数都一致、产物齐全的阶段；某阶段重算后，其后续阶段自动失效。
+
+CHECKPOINT_FILE = ".checkpoint.json"
+STAGE_ORDER = ["depth", "mask", "background", "depth_bg"]
+STAGE_FILES = {
+    "depth": ["image.png", "config.json", "depth.png"],
+    "mask": ["subject_mask.png"],
+    "background": ["image_bg.png"],
+    "depth_bg": ["depth_bg.png"],
+    "cone_maps": ["cone_step.json"],
+    "bundle": ["scene.dftb"],
+    "lod_tiers": ["lod_manifest.json"],
+}
+# 可选导出 (_export_extras) 读取全部主阶段的产物，彼此独立: 任一主阶段重算后全部失效
+EXTRA_STAGES = ["cone_maps", "bundle", "lod_tiers"]
+
+
+def save_image_atomic(image_pil, path):
+    """先写临时文件再原子替换，进程中途被杀也不会留下半个 PNG"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with span("png.encode", file=path.name, size=image_pil.size) as sp:
+        image_pil.save(tmp, format="PNG", **png_options(PNG_COMPRESS_LEVEL, PNG_STRATEGY))
+        os.replace(tmp, path)
+        sp.set(bytes=path.stat().st_size)
+
+
+def save_depth_atomic(depth, path, bits=8):
+    """float32 [0, 1] 深度在写入线程中量化并保存为 8 / 16 位 PNG"""
+    save_image_atomic(depth_to_image(depth, bits), path)
+
+
+def _input_signature(input_file):
+    st = Path(input_file).stat()
+    return f"{Path(input_file).resolve()}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _read_checkpoint(output_path):
+    try:
+        return json.loads((output_path / CHECKPOINT_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def stage_done(output_path, input_file, stage, params):
+    checkpoint = _read_checkpoint(output_path)
+    if checkpoint.get("input") != _input_signature(input_file):
+        return False
+    if checkpoint.get("stages", {}).get(stage) != params:
+        return False
+    return all((output_path / name).exists() for name in STAGE_FILES[stage])
+
+
+def mark_stage_done(output_path, input_file, stage, params):
+    signature = _input_signature(input_file)
+    checkpoint = _read_checkpoint(output_path)
+    if checkpoint.get("input") != signature:
+        checkpoint = {"input": signature, "stages": {}}
+
+    stages = checkpoint.setdefault("stages", {})
+    if stage in STAGE_ORDER:
+        for later in STAGE_ORDER[STAGE_ORDER.index(stage) + 1:] + EXTRA_STAGES:
+            stages.pop(later, None)
+    stages[stage] = params
+
+    tmp = output_path / f"{CHECKPOINT_FILE}.tmp"
+    tmp.write_text(json.dumps(checkpoint, indent=4))
+    os.replace(tmp, output_path / CHECKPOINT_FILE)
+
+
+def _chunks(items, size, stage=None, progress=None):
+    """按 size 分块；progress(stage, done, total) 在每块开始前与全部结束后调用 (可在其中抛异常以取消)"""
+    for start in range(0, len(items), size):
+        if progress is not None:
+            progress(stage, start, len(items))
+        yield items[start:start + size]
+    if progress is not None:
+        progress(stage, len(items), len(items))
+
+
+def run_stages(jobs, prompt, batch_size=DEFAULT_BATCH_SIZE, resume=False, progress=None):
+    """
+    按阶段分组执行: 全部前景深度 → 全部分割 → 全部修补 → 全部背景深度
+    jobs: [(input_file, output_path), ...]
+    每个阶段的结果立即写入对应输出目录，下一阶段再从磁盘读回，
+    因此内存中同一时刻最多只有 batch_size 张图片，而每个模型在整个批次中只需加载一次。
+    PNG 编码交给后台 AssetWriter，与后续推理重叠；阶段检查点在文件落盘后才记录，函数返回前等待全部写入完成。
+    resume=True 时跳过已有检查点的阶段，被中断的批次从中断处继续。
+    progress: 可选回调 progress(stage, done, total)，在每个分块前后调用 (见 job_service.py)。
+    """
+    stage_pipeline.reset()
+    writer = AssetWriter(save_image_atomic, WRITE_WORKERS)
+    with writer:
+        _run_stages(jobs, prompt, batch_size, resume, writer, progress)
+    print(writer.summary())
+    _export_extras(jobs, resume)
+    if not KEEP_INTERMEDIATES:
+        for _, output_path in jobs:
+            shutil.rmtree(output_path / INTERMEDIATE_DIR, ignore_errors=True)
+
+    if stage_pipeline.STATS:
+        print(stage_pipeline.summary())
+    print(MODEL_REGISTRY.summary())
+    if STAGE_CACHE is not None:
+        print(STAGE_CACHE.summary())
+    if TRACER.enabled:
+        print(TRACER.summary())
+
+
+def _run_stages(jobs, prompt, batch_size, resume, writer, progress):
+    total = len(jobs)
+    depth_params = {"upsample": DEPTH_UPSAMPLE}
+    mask_params = {} if SUBJECT_MASK else {"subject_mask": "empty"}
+    if DEPTH_TILE_SIZE:
+        # tile_upsample: 分块路径起初忽略 --depth-upsample，让那时的检查点与缓存条目失效
+        depth_params.update(tile_size=DEPTH_TILE_SIZE, tile_overlap=DEPTH_TILE_OVERLAP, tile_upsample=DEPTH_UPSAMPLE)
+    if EXPORT_DEPTH16:
+        # 16 位 PNG 只在开启时写出，开启后续跑需要补写 depth16.png / depth_bg16.png
+        depth_params["depth16"] = True
+    if parse_mode(INFERENCE_MODE):
+        depth_params["inference_mode"] = INFERENCE_MODE
+        if SUBJECT_MASK:
+            mask_params["inference_mode"] = INFERENCE_MODE
+    bg_params = {"prompt": prompt, "negative_prompt": NEGATIVE_PROMPT, "steps": SD_STEPS,
+                 "guidance": SD_GUIDANCE, "max_parallax_percent": MAX_PARALLAX_PERCENT,
+                 "inpaint_mode": INPAINT_MODE, "inpaint_backend": INPAINT_BACKEND, "device": get_device()}
+    occlusion = INPAINT_MASK_SOURCE == "depth"
+    if occlusion:
+        del bg_params["max_parallax_percent"]
+        # 遮罩由 config.json 推导，视差参数变化时检查点与缓存键随之失效
+        bg_params.update(mask_source="depth", height=CONFIG_HEIGHT, zoom=CONFIG_ZOOM, focus=CONFIG_FOCUS,
+                         max_offset=max_offset() if OCCLUSION_MAX_OFFSET is None else OCCLUSION_MAX_OFFSET)
+    # 缓存条目现在是数组 (.npy)，与旧的 8 位 PNG 条目区分开
+    depth_cache_params = {**{k: v for k, v in depth_params.items() if k != "depth16"}, "output": "float32"}
+    mask_cache_params = {**mask_params, "output": "uint8"}
+
+    def export_depth(depth, output_path, name, mark):
+        """浮点深度写入 .intermediate/，量化后的 PNG 在写入线程中生成"""
+        writer.submit(depth, store_path(output_path, name), save=save_array, group=output_path)
+        if EXPORT_DEPTH16:
+            writer.submit(depth, output_path / f"{name}16.png", save=lambda d, p: save_depth_atomic(d, p, 16))
+        writer.submit(depth, output_path / f"{name}.png", save=save_depth_atomic, then=mark)
+
+    def load_mask(output_path):
+        """优先零拷贝读取 .intermediate/ 中的 uint8 遮罩，缺失时 (例如旧输出续跑) 读 PNG"""
+        path = writer.ready(store_path(output_path, "subject_mask"))
+        if path.exists():
+            return load_array(path)
+        return np.asarray(Image.open(writer.ready(output_path / "subject_mask.png")).convert("L"))
+
+    def load_depth(output_path):
+        """.intermediate/ 中的浮点深度，缺失时读 8 位 depth.png"""
+        path = writer.ready(store_path(output_path, "depth"))
+        if path.exists():
+            return load_array(path)
+        return np.asarray(Image.open(writer.ready(output_path / "depth.png")).convert("L"), dtype=np.float32) / 255.0
+
+    def load_config(output_path):
+        with open(output_path / "config.json") as f:
+            return json.load(f)
+
+    def pending(stage, params):
+        if not resume:
+            return jobs
+        writer.wait()  # 前一阶段的检查点在后台写入，判断前先让它们落盘
+        todo = [(f, out) for f, out in jobs if not stage_done(out, f, stage, params)]
+        if len(todo) < total:
+            print(f"⏭️ Resume: {total - len(todo)}/{total} already finished")
+        return todo
+
+    # config.json 每次都按当前参数重写 (续跑时深度阶段可能被跳过)，只读取图片头获取尺寸
+    sizes = {}
+    for job in jobs:
+        input_file, output_path = job
+        output_path.mkdir(parents=True, exist_ok=True)
+        with Image.open(input_file) as im:
+            sizes[job] = im.size
+        write_config(output_path, sizes[job])
+
+    def tiled(job):
+        return bool(DEPTH_TILE_SIZE) and max(sizes[job]) > DEPTH_TILE_SIZE
+
+    def model_step(stage, todo, load, cache, run, export):
+        """
+        一个模型步骤作为一条连续的流水线执行: load(input_file, output_path) 在预处理线程中逐张读取图片，
+        解码与推理重叠；cache = (缓存阶段名, 模型路径, 参数)，命中的条目不进入模型。
+        run(items, deliver) 执行模型，结果经 deliver 交给 export(job, result)。
+        progress 在每张图开始读取前调用 (可在其中抛异常以取消)。
+        """
+        def items():
+            for done, job in enumerate(todo):
+                if progress is not None:
+                    progress(stage, done, len(todo))
+                print(f"  {job[0].name}")
+                yield job, load(*job)
+
+        if todo:
+            with span(f"stage.{stage}", images=len(todo)):
+                cache_stage, model_path, params = cache
+                misses, deliver = cached_stream(cache_stage, items(), model_path, params, export)
+                run(misses, deliver)
+        if progress is not None:
+            progress(stage, len(todo), len(todo))
+
+    def run_depth(items, deliver):
+        """整图走一条流水线；需要分块的大图排在最后，流水线结束后逐张分块推理"""
+        it = iter(items)
+        large = []
+
+        def whole():
+            for job, im in it:
+                if tiled(job):
+                    large.append((job, im))
+                    return
+                yield job, im
+
+        depth_stream(whole(), deliver, batch_size)
+        for job, im in itertools.chain(large, it):
+            deliver(job, estimate_depth_tiled(im, DEPTH_TILE_SIZE, DEPTH_TILE_OVERLAP, batch_size, as_array=True))
+
+    def depth_todo(stage):
+        # 同长宽比相邻以便凑批，分块的大图排在最后
+        return sorted(pending(stage, depth_params), key=lambda job: (tiled(job), sizes[job][0] / sizes[job][1]))
+
+    def depth_exporter(stage):
+        """depth / depth_bg 阶段的导出函数，文件名与阶段名相同"""
+        def export(job, depth):
+            input_file, output_path = job
+            export_depth(depth, output_path, stage,
+                         lambda: mark_stage_done(output_path, input_file, stage, depth_params))
+        return export
+
+    def load_input(input_file, output_path):
+        img = Image.open(input_file).convert("RGB")
+        writer.submit(img, output_path / "image.png")
+        return img
+
+    def export_mask(job, mask):
+        input_file, output_path = job
+        writer.submit(mask, store_path(output_path, "subject_mask"), save=save_array, group=output_path)
+        writer.submit(mask_to_image(mask), output_path / "subject_mask.png",
+                      then=lambda: mark_stage_done(output_path, input_file, "mask", mask_params))
+
+    print(f"\n--- Step 1: Foreground Depth ({total} images) ---")
+    model_step("depth", depth_todo("depth"), load_input, ("depth", PATH_DEPTH, depth_cache_params),
+               run_depth, depth_exporter("depth"))
+
+    print(f"\n--- Step 2: Segmentation (Mask) ({total} images) ---")
+    todo = pending("mask", mask_params)
+    if SUBJECT_MASK:
+        model_step("mask", todo,
+                   lambda _, output_path: Image.open(writer.ready(output_path / "image.png")).convert("RGB"),
+                   ("mask", PATH_SEG, mask_cache_params),
+                   lambda items, deliver: mask_stream(items, deliver, batch_size), export_mask)
+    else:
+        print("⏭️ Segmentation skipped, writing empty subject masks")
+        for [job] in _chunks(todo, 1, "mask", progress):
+            w, h = sizes[job]
+            export_mask(job, np.zeros((h, w), dtype=np.uint8))
+    # 有预算限制时，分割模型后续不再使用，主动释放给 SD 腾出空间 (否则 LRU 会先淘汰仍需使用的深度模型)
+    if MODEL_REGISTRY.budget_bytes is not None:
+        MODEL_REGISTRY.evict(_mode_key(KEY_SEG))
+
+    print(f"\n--- Step 3: Background Generation ({total} images) ---")
+    todo = pending("background", bg_params)
+    for idx, [(input_file, output_path)] in enumerate(_chunks(todo, 1, "background", progress), 1):
+        with span("stage.background", image=input_file.name):
+            print(f"[{idx}/{len(todo)}] {input_file.name}")
+            img = Image.open(writer.ready(output_path / "image.png")).convert("RGB")
+            if occlusion:
+                smart_mask = get_inpaint_mask(img.size, depth=load_depth(output_path),
+                                              config=load_config(output_path), max_offset=bg_params["max_offset"])
+            else:
+                smart_mask = get_inpaint_mask(img.size, load_mask(output_path))
+            # 缓存键只依赖最终遮罩与实际使用的后端: pyramid 的结果不随 SD 权重或 auto / pyramid 的设置失效
+            backend = select_inpaint_backend(inpaint_area_ratio(smart_mask))
+            cache_params = {"inpaint_mode": INPAINT_MODE, "inpaint_backend": backend}
+            if backend == "sd":
+                cache_params.update({k: bg_params[k] for k in ("prompt", "negative_prompt", "steps", "guidance",
+                                                               "device")})
+            img_bg, = cached_stage("background", [(img, smart_mask)], PATH_SD if backend == "sd" else None,
+                                   cache_params,
+                                   lambda items: [generate_background(i, None, prompt, smart_mask=m, backend=backend)
+                                                  for i, m in items])
+            writer.submit(img_bg, output_path / "image_bg.png",
+                          then=lambda o=output_path, f=input_file: mark_stage_done(o, f, "background", bg_params))
+    if MODEL_REGISTRY.budget_bytes is not None:
+        MODEL_REGISTRY.evict(KEY_SD)
+
+    print(f"\n--- Step 4: Background Depth ({total} images) ---")
+    model_step("depth_bg", depth_todo("depth_bg"),
+               lambda _, output_path: Image.open(writer.ready(output_path / "image_bg.png")).convert("RGB"),
+               ("depth", PATH_DEPTH, depth_cache_params), run_depth, depth_exporter("depth_bg"))
+
+
+def _export_extras(jobs, resume=False):
+    """
+    可选的导出步骤 (锥步进图、纹理包、LOD)，读取已全部落盘的 PNG。
+    与主阶段一样记录检查点，resume=True 时跳过参数一致、产物齐全的导出。
+    """
+    total = len(jobs)
+
+    def pending(stage, params):
+        if not resume:
+            return jobs
+        todo = [(f, out) for f, out in jobs if not stage_done(out, f, stage, params)]
+        if len(todo) < total:
+            print(f"⏭️ Resume: {total - len(todo)}/{total} already finished")
+        return todo
+
+    if EXPORT_CONE_MAPS:
+        print(f"\n--- Cone-Step Maps ({total} images) ---")
+        params = {"max_radius": CONE_MAX_RADIUS}
+        for input_file, output_path in pending("cone_maps", params):
+            print(f"  {input_file.name}")
+            with span("export.cone_maps", image=input_file.name):
+                export_cone_maps(output_path, CONE_MAX_RADIUS)
+            mark_stage_done(output_path, input_file, "cone_maps", params)
+
+    if EXPORT_BUNDLE:
+        print(f"\n--- Texture Bundle ({total} images) ---")
+        params = {"mips": BUNDLE_MIPS}
+        for input_file, output_path in pending("bundle", params):
+            with span("export.bundle", image=input_file.name) as sp:
+                path = export_bundle(output_path, mips=BUNDLE_MIPS)
+                sp.set(bytes=path.stat().st_size)
+            mark_stage_done(output_path, input_file, "bundle", params)
+            print(f"📦 {path} ({path.stat().st_size / 1024 ** 2:.1f} MB)")
+
+    if LOD_TIERS:
+        print(f"\n--- LOD Tiers ({total} images) ---")
+        params = {"tiers": sorted(set(LOD_TIERS), reverse=True), "bundle": EXPORT_BUNDLE, "mips": BUNDLE_MIPS}
+        for input_file, output_path in pending("lod_tiers", params):
+            with span("export.lod_tiers", image=input_file.name):
+                manifest = export_lod_tiers(output_path, LOD_TIERS, bundle=EXPORT_BUNDLE, mips=BUNDLE_MIPS)
+            mark_stage_done(output_path, input_file, "lod_tiers", params)
+            sizes = ", ".join(f"{t['name']} {t['resolution'][0]}x{t['resolution'][1]}" for t in manifest["tiers"])
+            print(f"🧩 {input_file.name}: {sizes}")
+
+
+def main(input_path, output_dir, prompt, batch_size=DEFAULT_BATCH_SIZE, resume=False):
     input_file = Path(input_path)
     if not input_file.exists():
         print(f"❌ Input file not found: {input_file}")
@@ -265,53 +1146,148 @@ def main(input_path, output_dir, prompt):
     output_path.mkdir(parents=True, exist_ok=True)
     print(f"🚀 Processing: {input_file.name}")
 
-    img = Image.open(input_file).convert("RGB")
-
-    print("\n--- Step 1: Foreground Depth ---")
-    depth_fg = estimate_depth(img)
-
-    print("\n--- Step 2: Segmentation (Mask) ---")
-    mask = generate_mask(img)
-
-    print("\n--- Step 3: Background Generation ---")
-    img_bg = generate_background(img, mask, prompt)
+    run_stages([(input_file, output_path)], prompt, batch_size, resume)
 
-    print("\n--- Step 4: Background Depth ---")
-    depth_bg = estimate_depth(img_bg)
+    print(f"✅ Success! Assets saved to: {output_path.absolute()}")
 
-    print("\n💾 Saving assets...")
-    assets = {
-        "image": img,
-        "depth": depth_fg,
-        "image_bg": img_bg,
-        "depth_bg": depth_bg,
-        "subject_mask": mask
-    }
 
-    for name, pil_obj in assets.items():
-        pil_obj.save(output_path / f"{name}.png")
+def batch_jobs(files, output_root):
+    """每张图片对应 output_root/<文件名>/，同名不同扩展名的文件加后缀区分"""
+    jobs = []
+    used_names = set()
+    for f in files:
+        name = f.stem
+        if name in used_names:
+            name = f"{f.stem}_{f.suffix.lstrip('.').lower()}"
+        used_names.add(name)
+        jobs.append((f, Path(output_root) / name))
+    return jobs
+
+
+def main_batch(input_spec, output_dir, prompt, batch_size=DEFAULT_BATCH_SIZE, resume=False):
+    """批处理目录或 glob 中的所有图片，每张图片输出到 output_dir/<文件名>/"""
+    files = collect_inputs(input_spec)
+    if not files:
+        print(f"❌ No input images found: {input_spec}")
+        return
 
-    config = {
-        "height": 0.20,
-        "steady": 0.0,
-        "focus": 0.0,
-        "zoom": 1.0,
-        "isometric": 0.0,
-        "offset_x": 0.0,
-        "offset_y": 0.0,
-        "resolution": img.size
-    }
-    with open(output_path / "config.json", "w") as f:
-        json.dump(config, f, indent=4)
+    output_root = Path(output_dir)
+    jobs = batch_jobs(files, output_root)
 
-    print(f"✅ Success! Assets saved to: {output_path.absolute()}")
+    print(f"🚀 Batch processing {len(jobs)} images -> {output_root.absolute()}")
+    run_stages(jobs, prompt, batch_size, resume)
+    print(f"✅ Success! {len(jobs)} asset sets saved to: {output_root.absolute()}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", required=True, help="Input image path")
+    parser.add_argument("-i", "--input", required=True, help="Input image path, directory or glob pattern")
     parser.add_argument("-o", "--output", default="output", help="Output directory")
     parser.add_argument("-p", "--prompt", default="background, nature, realistic, high quality")
+    parser.add_argument("--model-budget", type=float, default=None,
+                        help="Resident model memory budget in GB (default: $DEPTHFLOW_MODEL_BUDGET_GB or unlimited)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Images per forward pass for depth and segmentation models")
+    parser.add_argument("--inference-mode", default=INFERENCE_MODE,
+                        help="Depth/segmentation inference mode: fp32 or options joined with '+' from "
+                             "inference, channels_last, bf16, int8, compile (see inference_modes.py)")
+    parser.add_argument("--depth-tile-size", type=int, default=DEPTH_TILE_SIZE,
+                        help="Run depth estimation in overlapping tiles of this size for larger images (0 = off)")
+    parser.add_argument("--depth-tile-overlap", type=int, default=DEPTH_TILE_OVERLAP,
+                        help="Overlap in pixels between depth tiles")
+    parser.add_argument("--depth-upsample", choices=["guided", "bicubic"], default=DEPTH_UPSAMPLE,
+                        help="How low-resolution depth is upsampled to the image size")
+    parser.add_argument("--inpaint-mode", choices=["roi", "full"], default=INPAINT_MODE,
+                        help="Inpaint only crops around the subject rim at native resolution, or the whole frame")
+    parser.add_argument("--inpaint-mask", choices=["rim", "depth"], default=INPAINT_MASK_SOURCE,
+                        help="Inpaint a fixed rim around the segmentation mask, or only the background that "
+                             "depth discontinuities can reveal within the camera offset allowed by config.json")
+    parser.add_argument("--max-offset", type=float, default=OCCLUSION_MAX_OFFSET,
+                        help="Per-axis camera offset bound for --inpaint-mask depth (default: the app's drag limit, 1.3)")
+    parser.add_argument("--parallax-height", type=float, default=CONFIG_HEIGHT,
+                        help="Parallax height written to config.json")
+    parser.add_argument("--zoom", type=float, default=CONFIG_ZOOM, help="Zoom written to config.json")
+    parser.add_argument("--focus", type=float, default=CONFIG_FOCUS, help="Focus written to config.json")
+    parser.add_argument("--no-subject-mask", action="store_true",
+                        help="Skip the segmentation model and write an empty subject_mask.png "
+                             "(requires --inpaint-mask depth)")
+    parser.add_argument("--inpaint-backend", choices=["auto", "sd", "pyramid"], default=INPAINT_BACKEND,
+                        help="Inpainting backend; auto uses the fast pyramid fill for thin rims on CPU")
+    parser.add_argument("--bundle", action="store_true",
+                        help="Also export scene.dftb, a single GPU-ready texture bundle")
+    parser.add_argument("--no-bundle-mips", action="store_true", help="Skip colour mip chains in the bundle")
+    parser.add_argument("--cone-maps", action="store_true",
+                        help="Also precompute cone-step maps next to depth.png / depth_bg.png")
+    parser.add_argument("--cone-max-radius", type=int, default=CONE_MAX_RADIUS,
+                        help="Cone-step search radius in texels")
+    parser.add_argument("--lod-tiers", type=int, nargs="*", default=list(LOD_TIERS),
+                        help="Also emit downscaled asset sets with these long-edge sizes, e.g. 2048 1024")
+    parser.add_argument("--pipeline-depth", type=int, default=PIPELINE_DEPTH,
+                        help="Bounded queue length between preprocess, inference and postprocess (0 = serial)")
+    parser.add_argument("--depth16", action="store_true",
+                        help="Also write 16-bit depth16.png / depth_bg16.png (depth.png stays 8-bit)")
+    parser.add_argument("--keep-intermediates", action="store_true",
+                        help="Keep the float32 .npy intermediates in <output>/.intermediate after the run "
+                             "(LOD tiers and cone maps built later then read float depth instead of the 8-bit PNG)")
+    parser.add_argument("--png-level", type=int, choices=range(10), default=PNG_COMPRESS_LEVEL, metavar="0-9",
+                        help="PNG zlib compression level (lower is faster, larger files)")
+    parser.add_argument("--png-strategy", choices=sorted(PNG_STRATEGIES), default=PNG_STRATEGY,
+                        help="zlib strategy for PNG output ('rle' is fast and compact for depth maps and masks)")
+    parser.add_argument("--write-workers", type=int, default=WRITE_WORKERS,
+                        help="Background PNG encoding threads (0 writes synchronously)")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR), help="Stage result cache directory")
+    parser.add_argument("--cache-size", type=float, default=2.0, help="Stage cache size limit in GB")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the stage result cache")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip stages already checkpointed in the output directory")
+    parser.add_argument("--trace", default=None,
+                        help="Record nested timing spans and write a Chrome trace-event JSON to this path")
     args = parser.parse_args()
 
-    main(args.input, args.output, args.prompt)
\ No newline at end of file
+    try:
+        parse_mode(args.inference_mode)
+    except ValueError as e:
+        parser.error(str(e))
+    INFERENCE_MODE = args.inference_mode
+    DEPTH_TILE_SIZE = args.depth_tile_size
+    DEPTH_TILE_OVERLAP = args.depth_tile_overlap
+    DEPTH_UPSAMPLE = args.depth_upsample
+    if args.no_subject_mask and args.inpaint_mask != "depth":
+        parser.error("--no-subject-mask requires --inpaint-mask depth")
+    INPAINT_MODE = args.inpaint_mode
+    INPAINT_MASK_SOURCE = args.inpaint_mask
+    OCCLUSION_MAX_OFFSET = args.max_offset
+    CONFIG_HEIGHT = args.parallax_height
+    CONFIG_ZOOM = args.zoom
+    CONFIG_FOCUS = args.focus
+    SUBJECT_MASK = not args.no_subject_mask
+    INPAINT_BACKEND = args.inpaint_backend
+    EXPORT_BUNDLE = args.bundle
+    BUNDLE_MIPS = not args.no_bundle_mips
+    EXPORT_CONE_MAPS = args.cone_maps
+    CONE_MAX_RADIUS = args.cone_max_radius
+    LOD_TIERS = tuple(args.lod_tiers)
+    PIPELINE_DEPTH = args.pipeline_depth
+    EXPORT_DEPTH16 = args.depth16
+    KEEP_INTERMEDIATES = args.keep_intermediates
+    PNG_COMPRESS_LEVEL = args.png_level
+    PNG_STRATEGY = args.png_strategy
+    WRITE_WORKERS = args.write_workers
+    if not args.no_cache:
+        enable_stage_cache(args.cache_dir, args.cache_size)
+    if args.model_budget is not None:
+        MODEL_REGISTRY.set_budget_gb(args.model_budget)
+    if args.trace:
+        TRACER.enable()
+
+    try:
+        if Path(args.input).is_dir() or any(ch in args.input for ch in "*?["):
+            main_batch(args.input, args.output, args.prompt, args.batch_size, args.resume)
+        else:
+            main(args.input, args.output, args.prompt, args.batch_size, args.resume)
+    except FileNotFoundError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        if args.trace:
+            print(f"🧵 Trace written to {TRACER.export_chrome_trace(args.trace)}")
@@ -3,82 +3,97 @@ import sys
 import argparse
 import json
 import gc
-import torch
 import numpy as np
-import torch.nn.functional as F
 from pathlib import Path
 from PIL import Image, ImageFilter
-from torchvision.transforms.functional import normalize
-from transformers import AutoModelForImageSegmentation, AutoImageProcessor
-from diffusers import StableDiffusionInpaintPipeline
+
+# torch / transformers / diffusers 在用到的函数内部导入，--help 与导出等轻量路径无需加载它们
+from model_registry import MODEL_REGISTRY
+from texture_bundle import export_bundle
+from tracing import TRACER, span, nbytes
+from asset_writer import AssetWriter, PNG_STRATEGIES, png_options
 
 # --- 全局配置 ---
 # 通过环境变量 DEPTHFLOW_MODEL_DIR 指定模型存放路径，默认为 ./models
 MODEL_DIR = Path(os.environ.get("DEPTHFLOW_MODEL_DIR", "./models"))
-# 全局模型缓存
-_DEPTH_ESTIMATOR = None
-_SEG_MODEL = None
-_INPAINT_PIPE = None
 
 
 # --- 模型加载函数 ---
+# 模型缓存由共享的 MODEL_REGISTRY 管理 (与 depthflow_generator.py 同一套预算与 LRU 淘汰)
+
+def _device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
 
 def load_depth_estimator(model_name="depth-anything/Depth-Anything-V2-small-hf"):
     """加载深度估计模型"""
-    global _DEPTH_ESTIMATOR
-    if _DEPTH_ESTIMATOR is None:
+    def _load():
+        from transformers import AutoModelForImageSegmentation
+
         print(f"✨ Loading Depth Estimator: {model_name}...")
         try:
-            _DEPTH_ESTIMATOR = AutoModelForImageSegmentation.from_pretrained(
+            model = AutoModelForImageSegmentation.from_pretrained(
                 model_name,
                 trust_remote_code=True,
                 cache_dir=MODEL_DIR,
                 local_files_only=False
-            ).to("cuda" if torch.cuda.is_available() else "cpu")
-            _DEPTH_ESTIMATOR.eval()
+            ).to(_device())
+            model.eval()
         except Exception as e:
             print(f"❌ Failed to load depth estimator: {e}")
             raise
-    return _DEPTH_ESTIMATOR
+        return model
+
+    return MODEL_REGISTRY.get(f"depth:{model_name}", _load)
 
 
-def load_seg_model():
+def load_seg_model(device=None):
     """加载图像分割模型 (RMBG-1.4)"""
-    global _SEG_MODEL
-    if _SEG_MODEL is None:
+    device = device or _device()
+
+    def _load():
+        from transformers import AutoModelForImageSegmentation
+
         print("✨ Loading Segmentation Model (RMBG-1.4)...")
         try:
-            _SEG_MODEL = AutoModelForImageSegmentation.from_pretrained(
+            model = AutoModelForImageSegmentation.from_pretrained(
                 "briaai/RMBG-1.4",
                 trust_remote_code=True,
                 cache_dir=MODEL_DIR,
                 local_files_only=False
-            ).to("cuda" if torch.cuda.is_available() else "cpu")
-            _SEG_MODEL.eval()
+            ).to(device)
+            model.eval()
         except Exception as e:
             print(f"❌ Failed to load segmentation model: {e}")
             raise
-    return _SEG_MODEL
+        return model
+
+    return MODEL_REGISTRY.get("seg:briaai/RMBG-1.4", _load)
 
 
 def load_inpainting_pipeline():
     """加载Stable Diffusion图像修复模型"""
-    global _INPAINT_PIPE
-    if _INPAINT_PIPE is None:
+    def _load():
+        import torch
+        from diffusers import StableDiffusionInpaintPipeline
+
         print("✨ Loading Stable Diffusion Inpainting Pipeline...")
         try:
-            _INPAINT_PIPE = StableDiffusionInpaintPipeline.from_pretrained(
+            pipe = StableDiffusionInpaintPipeline.from_pretrained(
                 "runwayml/stable-diffusion-inpainting",
                 torch_dtype=torch.float16,
                 variant="fp16",
                 cache_dir=MODEL_DIR,
                 local_files_only=False
-            ).to("cuda" if torch.cuda.is_available() else "cpu")
-            _INPAINT_PIPE.enable_model_cpu_offload()
+            ).to(_device())
+            pipe.enable_model_cpu_offload()
         except Exception as e:
             print(f"❌ Failed to load inpainting pipeline: {e}")
             raise
-    return _INPAINT_PIPE
+        return pipe
+
+    return MODEL_REGISTRY.get("sd:runwayml/stable-diffusion-inpainting", _load)
 
 
 # --- 核心处理函数 ---
@@ -99,19 +114,27 @@ def normalize_and_convert_depth(depth_pil: Image.Image) -> Image.Image:
 
 def generate_background_ai(image_pil: Image.Image, prompt: str) -> tuple[Image.Image, Image.Image]:
     """生成AI背景并返回主体mask"""
+    import torch
+    from transformers import AutoImageProcessor
+
     print("🎨 Generating AI background and mask...")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    seg_model = load_seg_model(device)
-    pipe = load_inpainting_pipeline()
+    device = _device()
+    with span("model.get", model="seg"):
+        seg_model = load_seg_model(device)
+    with span("model.get", model="sd"):
+        pipe = load_inpainting_pipeline()
     orig_w, orig_h = image_pil.size
 
     # 1. 分割
-    processor = AutoImageProcessor.from_pretrained("briaai/RMBG-1.4")
-    inputs = processor(images=image_pil, return_tensors="pt").to(device)
-    with torch.no_grad():
+    with span("mask.preprocess"):
+        processor = AutoImageProcessor.from_pretrained("briaai/RMBG-1.4")
+        inputs = processor(images=image_pil, return_tensors="pt").to(device)
+    with span("mask.inference", shape=tuple(inputs["pixel_values"].shape)), torch.no_grad():
         outputs = seg_model(**inputs)
-    mask = processor.post_process_masks(outputs.pred, inputs["original_sizes"])[0][0]
-    mask = Image.fromarray((mask.numpy() * 255).astype('uint8')).convert("L")
+    with span("mask.interpolate", size=image_pil.size):
+        mask = processor.post_process_masks(outputs.pred, inputs["original_sizes"])[0][0]
+    with span("cpu_transfer", shape=tuple(mask.shape), bytes=nbytes(mask)):
+        mask = Image.fromarray((mask.numpy() * 255).astype('uint8')).convert("L")
 
     # 2. 面积检测
     mask_arr = np.array(mask)
@@ -121,17 +144,21 @@ def generate_background_ai(image_pil: Image.Image, prompt: str) -> tuple[Image.I
         return image_pil, mask
 
     # 3. 修复
-    mask = mask.filter(ImageFilter.MaxFilter(25))
+    with span("mask.dilate"):
+        mask = mask.filter(ImageFilter.MaxFilter(25))
 
     def align_8(x): return x - (x % 8)
 
     sd_w, sd_h = align_8(orig_w), align_8(orig_h)
-    sd_in_img = image_pil.resize((sd_w, sd_h), Image.Resampling.LANCZOS)
-    sd_in_mask = mask.resize((sd_w, sd_h), Image.Resampling.NEAREST)
+    with span("pil.resize", size=(sd_w, sd_h)):
+        sd_in_img = image_pil.resize((sd_w, sd_h), Image.Resampling.LANCZOS)
+        sd_in_mask = mask.resize((sd_w, sd_h), Image.Resampling.NEAREST)
 
-    result = \
-    pipe(prompt=prompt, image=sd_in_img, mask_image=sd_in_mask, num_inference_steps=20, guidance_scale=7.5).images[0]
-    result = result.resize((orig_w, orig_h), Image.Resampling.LANCZOS)
+    with span("sd.inference", size=(sd_w, sd_h), steps=20):
+        result = \
+        pipe(prompt=prompt, image=sd_in_img, mask_image=sd_in_mask, num_inference_steps=20, guidance_scale=7.5).images[0]
+    with span("pil.resize", size=(orig_w, orig_h)):
+        result = result.resize((orig_w, orig_h), Image.Resampling.LANCZOS)
 
     gc.collect()
     torch.cuda.empty_cache()
@@ -140,15 +167,21 @@ def generate_background_ai(image_pil: Image.Image, prompt: str) -> tuple[Image.I
 
 def estimate_depth(image_pil: Image.Image) -> Image.Image:
     """估计图像深度"""
+    import torch
+    from transformers import AutoImageProcessor
+
     print("🔍 Estimating depth...")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = load_depth_estimator()
-    processor = AutoImageProcessor.from_pretrained("depth-anything/Depth-Anything-V2-small-hf")
-    inputs = processor(images=image_pil, return_tensors="pt").to(device)
-    with torch.no_grad():
+    device = _device()
+    with span("model.get", model="depth"):
+        model = load_depth_estimator()
+    with span("depth.preprocess"):
+        processor = AutoImageProcessor.from_pretrained("depth-anything/Depth-Anything-V2-small-hf")
+        inputs = processor(images=image_pil, return_tensors="pt").to(device)
+    with span("depth.inference", shape=tuple(inputs["pixel_values"].shape)), torch.no_grad():
         outputs = model(**inputs)
         depth = outputs.predicted_depth
-    depth = Image.fromarray((depth.numpy() * 255 / depth.max()).astype('uint8'))
+    with span("cpu_transfer", shape=tuple(depth.shape), bytes=nbytes(depth)):
+        depth = Image.fromarray((depth.numpy() * 255 / depth.max()).astype('uint8'))
     gc.collect()
     torch.cuda.empty_cache()
     return depth
@@ -156,42 +189,49 @@ def estimate_depth(image_pil: Image.Image) -> Image.Image:
 
 # --- 主函数 ---
 
-def generate_assets(input_path: str, output_dir: str):
+def generate_assets(input_path: str, output_dir: str, bundle: bool = False,
+                    png_level: int = 6, png_strategy: str = "default", write_workers: int = 2):
     """主生成流程"""
     input_path = Path(input_path)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     print(f"📦 Assets will be exported to: {output_path.absolute()}")
 
-    # 1. 加载图像
-    print(f"📷 Loading image: {input_path}")
-    image_pil = Image.open(input_path).convert("RGB")
-
-    # 2. 估计前景深度
-    fg_depth_pil = estimate_depth(image_pil)
-    fg_depth_pil = normalize_and_convert_depth(fg_depth_pil)
-
-    # 3. 生成背景和遮罩
-    bg_pil, mask_pil = generate_background_ai(image_pil, "background, nature, realistic, high quality")
-
-    # 4. 估计背景深度
-    bg_depth_pil = estimate_depth(bg_pil)
-    bg_depth_pil = normalize_and_convert_depth(bg_depth_pil)
-
-    # 5. 保存资产
-    assets = {
-        "image": image_pil,
-        "depth": fg_depth_pil,
-        "image_bg": bg_pil,
-        "depth_bg": bg_depth_pil,
-        "subject_mask": mask_pil
-    }
-    for name, pil_img in assets.items():
-        mode = "L" if "depth" in name or "mask" in name else "RGB"
+    def save_png(pil_img, path):
+        mode = "L" if "depth" in path.name or "mask" in path.name else "RGB"
         if pil_img.mode != mode: pil_img = pil_img.convert(mode)
-        pil_img.save(output_path / f"{name}.png")
-
-    # 6. 导出配置
+        with span("png.encode", file=path.name, size=pil_img.size) as sp:
+            pil_img.save(path, format="PNG", **png_options(png_level, png_strategy))
+            sp.set(bytes=path.stat().st_size)
+
+    # 每个资产一产生就交给后台线程编码，与后续推理重叠；离开 with 时等待全部写完
+    writer = AssetWriter(save_png, write_workers)
+    with writer:
+        # 1. 加载图像
+        print(f"📷 Loading image: {input_path}")
+        image_pil = Image.open(input_path).convert("RGB")
+        writer.submit(image_pil, output_path / "image.png")
+
+        # 2. 估计前景深度
+        with span("stage.depth"):
+            fg_depth_pil = estimate_depth(image_pil)
+            fg_depth_pil = normalize_and_convert_depth(fg_depth_pil)
+        writer.submit(fg_depth_pil, output_path / "depth.png")
+
+        # 3. 生成背景和遮罩
+        with span("stage.background"):
+            bg_pil, mask_pil = generate_background_ai(image_pil, "background, nature, realistic, high quality")
+        writer.submit(bg_pil, output_path / "image_bg.png")
+        writer.submit(mask_pil, output_path / "subject_mask.png")
+
+        # 4. 估计背景深度
+        with span("stage.depth_bg"):
+            bg_depth_pil = estimate_depth(bg_pil)
+            bg_depth_pil = normalize_and_convert_depth(bg_depth_pil)
+        writer.submit(bg_depth_pil, output_path / "depth_bg.png")
+    print(writer.summary())
+
+    # 5. 导出配置
     config = {
         "height": 0.20, "steady": 0.0, "focus": 0.0, "zoom": 1.0,
         "isometric": 0.0, "offset_x": 0.0, "offset_y": 0.0,
@@ -200,6 +240,15 @@ def generate_assets(input_path: str, output_dir: str):
     with open(output_path / "config.json", "w") as f:
         json.dump(config, f, indent=4)
 
+    # 6. 可选: GPU 直传纹理包
+    if bundle:
+        with span("export.bundle"):
+            path = export_bundle(output_path)
+        print(f"📦 Texture bundle written: {path}")
+
+    print(MODEL_REGISTRY.summary())
+    if TRACER.enabled:
+        print(TRACER.summary())
     print("✅ Mobile assets generated successfully!")
 
 
@@ -207,10 +256,32 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate mobile assets for DepthFlow.")
     parser.add_argument("-i", "--input", required=True, help="Path to the input image.")
     parser.add_argument("-o", "--output", default="mobile_assets", help="Directory to save the assets.")
+    parser.add_argument("--model-budget", type=float, default=None,
+                        help="Resident model memory budget in GB (default: $DEPTHFLOW_MODEL_BUDGET_GB or unlimited).")
+    parser.add_argument("--bundle", action="store_true",
+                        help="Also export scene.dftb, a single GPU-ready texture bundle.")
+    parser.add_argument("--png-level", type=int, choices=range(10), default=6, metavar="0-9",
+                        help="PNG zlib compression level (lower is faster, larger files).")
+    parser.add_argument("--png-strategy", choices=sorted(PNG_STRATEGIES), default="default",
+                        help="zlib strategy for PNG output ('rle' is fast and compact for depth maps and masks).")
+    parser.add_argument("--write-workers", type=int, default=2,
+                        help="Background PNG encoding threads (0 writes synchronously).")
+    parser.add_argument("--trace", default=None,
+                        help="Record nested timing spans and write a Chrome trace-event JSON to this path.")
     args = parser.parse_args()
 
+    if args.model_budget is not None:
+        MODEL_REGISTRY.set_budget_gb(args.model_budget)
+
     if not Path(args.input).exists():
         print(f"❌ Error: Input file not found at {args.input}")
         sys.exit(1)
 
-    generate_assets(args.input, args.output)
+    if args.trace:
+        TRACER.enable()
+    try:
+        generate_assets(args.input, args.output, args.bundle,
+                        args.png_level, args.png_strategy, args.write_workers)
+    finally:
+        if args.trace:
+            print(f"🧵 Trace written to {TRACER.export_chrome_trace(args.trace)}")
@@ -0,0 +1,171 @@
+"""
+修补辅助函数 (纯 NumPy / PIL)
+ROI 模式: 找出 Rim Mask 的连通区域，按区域裁剪 (带上下文边距) 后以原分辨率修补，
+再羽化贴回原图，避免对整张图缩放到 1024 px 跑扩散而大部分结果被丢弃。
+"""
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from depth_tiling import feather_weights
+
+
+def _label_grid(grid):
+    """8 连通标记 (粗网格，单元数很少，BFS 即可)，返回每个连通块的 (ys, xs) 列表"""
+    gh, gw = grid.shape
+    seen = np.zeros_like(grid, dtype=bool)
+    components = []
+    for sy, sx in zip(*np.nonzero(grid)):
+        if seen[sy, sx]:
+            continue
+        seen[sy, sx] = True
+        queue = deque([(sy, sx)])
+        ys, xs = [], []
+        while queue:
+            y, x = queue.popleft()
+            ys.append(y)
+            xs.append(x)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    ny, nx = y + dy, x + dx
+                    if 0 <= ny < gh and 0 <= nx < gw and grid[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        queue.append((ny, nx))
+        components.append((np.array(ys), np.array(xs)))
+    return components
+
+
+def _fit_box(x0, y0, x1, y1, width, height, multiple):
+    """
+    把框的宽高向上取整到 multiple 的倍数，超出图像时向内平移。
+    取整后超过图像的边截断为整条边 (不再对齐): 推理尺寸由 crop_process_size 对齐到 8，
+    贴着图像边缘的遮罩因此总在框内。
+    """
+    def axis(lo, hi, limit):
+        size = min(-(-(hi - lo) // multiple) * multiple, limit)
+        lo = max(0, min(lo - (size - (hi - lo)) // 2, limit - size))
+        return lo, lo + size
+
+    x0, x1 = axis(x0, x1, width)
+    y0, y1 = axis(y0, y1, height)
+    return x0, y0, x1, y1
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def plan_roi_crops(mask_arr, context=64, cell=16, multiple=64, threshold=128):
+    """
+    根据 Rim Mask 规划修补裁剪框 [(x0, y0, x1, y1), ...]
+    1. 在 cell 大小的粗网格上做连通区域标记
+    2. 每个区域的包围框四周加 context 像素上下文，宽高取整到 multiple 的倍数 (便于同尺寸成批)
+    3. 相互重叠的框合并
+    """
+    h, w = mask_arr.shape
+    gh, gw = -(-h // cell), -(-w // cell)
+    active = np.zeros((gh * cell, gw * cell), dtype=bool)
+    active[:h, :w] = mask_arr > threshold
+    grid = active.reshape(gh, cell, gw, cell).any(axis=(1, 3))
+
+    boxes = []
+    for ys, xs in _label_grid(grid):
+        x0 = max(int(xs.min()) * cell - context, 0)
+        y0 = max(int(ys.min()) * cell - context, 0)
+        x1 = min((int(xs.max()) + 1) * cell + context, w)
+        y1 = min((int(ys.max()) + 1) * cell + context, h)
+        boxes.append(_fit_box(x0, y0, x1, y1, w, h, multiple))
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if _overlaps(boxes[i], boxes[j]):
+                    a, b = boxes[i], boxes[j]
+                    boxes[i] = _fit_box(min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]),
+                                        w, h, multiple)
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+def crop_process_size(box, max_side=1024):
+    """裁剪框的推理尺寸: 原分辨率，长边超过 max_side 时等比缩小，宽高对齐到 8"""
+    cw, ch = box[2] - box[0], box[3] - box[1]
+    scale = min(1.0, max_side / max(cw, ch))
+    return max(int(cw * scale) // 8 * 8, 8), max(int(ch * scale) // 8 * 8, 8)
+
+
+def paste_feathered(base_pil, patch_pil, box, feather=32):
+    """把修补结果贴回原图，裁剪框内部边缘 (非图像边界) 在 feather 像素内线性过渡"""
+    x0, y0, x1, y1 = box
+    W, H = base_pil.size
+    alpha = feather_weights(x1 - x0, y1 - y0, feather, x0 > 0, y0 > 0, x1 < W, y1 < H)
+    alpha_pil = Image.fromarray((alpha * 255.0).astype(np.uint8), mode="L")
+    region = base_pil.crop(box)
+    base_pil.paste(Image.composite(patch_pil, region, alpha_pil), box[:2])
+    return base_pil
+
+
+# === 经典快速修补 (非扩散) ===
+
+def _pull(color, weight):
+    """2x2 下采样: 按权重平均颜色，权重求和后截断到 1 (奇数边先复制最后一行 / 列补齐)"""
+    h, w = weight.shape
+    if h % 2:
+        color = np.concatenate([color, color[-1:]], axis=0)
+        weight = np.concatenate([weight, weight[-1:]], axis=0)
+    if w % 2:
+        color = np.concatenate([color, color[:, -1:]], axis=1)
+        weight = np.concatenate([weight, weight[:, -1:]], axis=1)
+
+    premult = color * weight[..., None]
+    wsum = weight[0::2, 0::2] + weight[1::2, 0::2] + weight[0::2, 1::2] + weight[1::2, 1::2]
+    csum = premult[0::2, 0::2] + premult[1::2, 0::2] + premult[0::2, 1::2] + premult[1::2, 1::2]
+    color = csum / np.maximum(wsum, 1e-6)[..., None]
+    return color, np.minimum(wsum, 1.0)
+
+
+def _sample_bilinear(arr, ys, xs, h, w):
+    """在 (h, w) 网格的像素 (ys, xs) 处对较粗的 arr (h0, w0, C) 做双线性采样 (align_corners=False)"""
+    h0, w0 = arr.shape[:2]
+    fy = np.clip((ys + 0.5) * (h0 / h) - 0.5, 0, h0 - 1).astype(np.float32)
+    fx = np.clip((xs + 0.5) * (w0 / w) - 0.5, 0, w0 - 1).astype(np.float32)
+    y0, x0 = np.floor(fy).astype(np.int64), np.floor(fx).astype(np.int64)
+    y1, x1 = np.minimum(y0 + 1, h0 - 1), np.minimum(x0 + 1, w0 - 1)
+    wy, wx = (fy - y0)[:, None], (fx - x0)[:, None]
+    top = arr[y0, x0] + (arr[y0, x1] - arr[y0, x0]) * wx
+    bottom = arr[y1, x0] + (arr[y1, x1] - arr[y1, x0]) * wx
+    return top + (bottom - top) * wy
+
+
+def pyramid_fill(image_pil, hole_pil, threshold=128):
+    """
+    多尺度 push-pull 填充: 逐级 2x2 下采样直到空洞被周围颜色覆盖，
+    再逐级放大，已知像素保留原色，只有权重不足 1 的像素才从更粗一级双线性插值补齐。
+    全部为向量化 NumPy 运算，适合只有细窄视差边缘需要修补的情况。
+    """
+    color = np.asarray(image_pil.convert("RGB"), dtype=np.float32)
+    weight = (np.asarray(hole_pil.convert("L")) <= threshold).astype(np.float32)
+    if weight.min() > 0:
+        return image_pil.convert("RGB")
+
+    levels = []
+    while min(weight.shape) > 1 and weight.min() <= 0:
+        levels.append((color, weight))
+        color, weight = _pull(color, weight)
+
+    for lvl_color, lvl_weight in reversed(levels):
+        h, w = lvl_weight.shape
+        ys, xs = np.nonzero(lvl_weight < 1.0)
+        coarse = _sample_bilinear(color, ys, xs, h, w)
+        lw = lvl_weight[ys, xs][:, None]
+        color = lvl_color.copy()
+        color[ys, xs] = lw * lvl_color[ys, xs] + (1.0 - lw) * coarse
+
+    return Image.fromarray(np.clip(color + 0.5, 0, 255).astype(np.uint8), mode="RGB")
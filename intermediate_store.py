@@ -0,0 +1,50 @@
+"""
+阶段中间结果存储 (.npy 内存映射)
+深度以 float32 [0, 1]、遮罩以 uint8 (0 / 255) 保存在输出目录的 .intermediate/ 下，
+后续阶段用 np.load(mmap_mode="r") 零拷贝读取，不再经过 PIL 8 位图像的往返与 dtype 转换。
+量化只在导出 PNG 时进行: depth.png 保持 8 位 (着色器与纹理包的约定)，可选额外输出 16 位的 depth16.png。
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from tracing import span
+
+INTERMEDIATE_DIR = ".intermediate"
+
+
+def store_path(output_path, name):
+    return Path(output_path) / INTERMEDIATE_DIR / f"{name}.npy"
+
+
+def save_array(array, path):
+    """原子写入 .npy (先写临时文件再替换)，签名与 save_image_atomic 一致，可直接交给 AssetWriter"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with span("npy.write", file=path.name, shape=array.shape, bytes=array.nbytes):
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp, path)
+
+
+def load_array(path):
+    """只读内存映射，不复制数据"""
+    return np.load(path, mmap_mode="r")
+
+
+def quantize_depth(depth, bits=8):
+    """[0, 1] 浮点深度 -> uint8 / uint16 (截断取整，与此前 8 位导出的数值一致)"""
+    dtype = np.uint16 if bits == 16 else np.uint8
+    return (np.clip(depth, 0.0, 1.0) * float(2 ** bits - 1)).astype(dtype)
+
+
+def depth_to_image(depth, bits=8):
+    """8 位为 "L" 模式，16 位为 "I;16" 模式 (PNG 原生支持)"""
+    return Image.fromarray(quantize_depth(depth, bits))
+
+
+def mask_to_image(mask):
+    return Image.fromarray(np.asarray(mask, dtype=np.uint8))
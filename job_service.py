@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+本地常驻资产生成服务
+一个 asyncio 进程在 localhost 上提供 HTTP/JSON 接口，模型加载一次后常驻 (MODEL_REGISTRY)，
+每个任务省去解释器启动、torch 导入与模型加载。流水线 (run_stages) 在单线程 executor 中执行，事件循环始终可以响应请求。
+
+  POST   /jobs        {"input": 图片/目录/glob, "output": 目录, "prompt": ..., "resume": false}
+                      202 返回任务；队列已满时 503 + Retry-After (背压)
+  GET    /jobs        全部任务
+  GET    /jobs/<id>   状态 (queued / running / done / failed / cancelled)、当前阶段与进度
+  DELETE /jobs/<id>   取消: 排队中的任务直接取消；运行中的任务在下一个分块边界停止，已完成的阶段保留检查点
+  GET    /health
+
+已结束的任务 (done / failed / cancelled) 只保留最近 --keep-finished 个，且超过 --finished-ttl 秒后移除，
+常驻进程的任务表不会无限增长。
+
+用法: python job_service.py serve [--port 8765] [--queue-size 8] [--keep-finished 100] [--finished-ttl 3600]
+                                  [--warm] [--standins]
+      python job_service.py submit -i <图片/目录/glob> -o <目录> [-p 提示词] [--resume] [--wait]
+      python job_service.py status [<id>]
+      python job_service.py cancel <id>
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_PROMPT = "background, nature, realistic, high quality"
+STAGES = ("depth", "mask", "background", "depth_bg")
+FINISHED = ("done", "failed", "cancelled")
+
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 503: "Service Unavailable"}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, input_spec, output, prompt=DEFAULT_PROMPT, resume=False):
+        self.id = f"job-{next(self._ids)}"
+        self.input = input_spec
+        self.output = output
+        self.prompt = prompt
+        self.resume = resume
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.error = None
+        self.created = time.time()
+        self.started = self.finished = None
+        self.cancel_event = threading.Event()
+
+    def report(self, stage, done, total):
+        """run_stages 的进度回调，在流水线线程中调用；取消请求在这里生效"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+        self.stage = stage
+        self.progress = (STAGES.index(stage) + (done / total if total else 1.0)) / len(STAGES)
+
+    def to_dict(self):
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else None
+        return {"id": self.id, "status": self.status, "stage": self.stage, "progress": round(self.progress, 3),
+                "input": self.input, "output": self.output, "error": self.error,
+                "elapsed_s": round(elapsed, 2) if elapsed is not None else None}
+
+
+def run_pipeline(job):
+    """默认的任务执行函数: 与 depthflow_generator 命令行相同的流水线"""
+    import depthflow_generator as g
+
+    files = g.collect_inputs(job.input)
+    if not files:
+        raise FileNotFoundError(f"No input images found: {job.input}")
+    if len(files) == 1 and Path(job.input).is_file():
+        jobs = [(files[0], Path(job.output))]
+    else:
+        jobs = g.batch_jobs(files, job.output)
+    g.run_stages(jobs, job.prompt, g.DEFAULT_BATCH_SIZE, job.resume, progress=job.report)
+
+
+class JobService:
+    """
+    queue_size: 最多排队 (未开始、未取消) 的任务数，超出时 submit 抛出 asyncio.QueueFull
+    run_job: 执行单个任务的同步函数 (默认 run_pipeline)，离线测试时可替换
+    keep_finished / finished_ttl: 已结束任务最多保留的个数与秒数，超出的从任务表中移除
+    """
+
+    def __init__(self, queue_size=8, run_job=run_pipeline, keep_finished=100, finished_ttl=3600.0):
+        self.queue = asyncio.Queue()
+        self.queue_size = queue_size
+        self.run_job = run_job
+        self.keep_finished = keep_finished
+        self.finished_ttl = finished_ttl
+        self.jobs = {}
+        self.current = None
+        # 模型与 depthflow_generator 的全局配置在进程内共享，任务串行执行
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+
+    def submit(self, spec):
+        if not spec.get("input") or not spec.get("output"):
+            raise ValueError("'input' and 'output' are required")
+        if self.queued() >= self.queue_size:
+            raise asyncio.QueueFull
+        self.prune()
+        job = Job(str(spec["input"]), str(spec["output"]), spec.get("prompt") or DEFAULT_PROMPT,
+                  bool(spec.get("resume", False)))
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        print(f"📥 {job.id} queued: {job.input} -> {job.output} ({self.queued()}/{self.queue_size})")
+        return job
+
+    def queued(self):
+        # 已取消但仍在 asyncio 队列中的任务不占名额
+        return sum(job.status == "queued" for job in self.jobs.values())
+
+    def prune(self, now=None):
+        """移除超过 finished_ttl 的已结束任务，并只保留最近结束的 keep_finished 个"""
+        now = time.time() if now is None else now
+        finished = sorted((j for j in self.jobs.values() if j.status in FINISHED), key=lambda j: j.finished)
+        excess = len(finished) - self.keep_finished
+        for i, job in enumerate(finished):
+            if i < excess or now - job.finished > self.finished_ttl:
+                del self.jobs[job.id]
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        if job.status == "queued":
+            # 仍留在 asyncio 队列中，worker 取到时跳过
+            job.status, job.finished = "cancelled", time.time()
+        elif job.status == "running":
+            job.cancel_event.set()
+        else:
+            return False
+        return True
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+                self.current, job.status, job.started = job, "running", time.time()
+                print(f"🚀 {job.id} started")
+                try:
+                    await loop.run_in_executor(self.executor, self.run_job, job)
+                    job.status, job.progress = "done", 1.0
+                except JobCancelled:
+                    job.status = "cancelled"
+                except Exception as e:
+                    job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+                job.finished = time.time()
+                print(f"🏁 {job.id} {job.status} in {job.finished - job.started:.1f}s"
+                      + (f" ({job.error})" if job.error else ""))
+                self.prune()
+            finally:
+                self.current = None
+                self.queue.task_done()
+
+    async def warm(self, loaders):
+        """在流水线线程中预先加载模型"""
+        loop = asyncio.get_running_loop()
+        for load in loaders:
+            await loop.run_in_executor(self.executor, load)
+
+    # === HTTP ===
+
+    def route(self, method, path, body):
+        """返回 (状态码, JSON 对象[, 额外响应头])"""
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if parts == ["health"] and method == "GET":
+            return 200, {"status": "ok", "queued": self.queued(), "queue_size": self.queue_size,
+                         "running": self.current.id if self.current else None}
+        if parts == ["jobs"]:
+            if method == "GET":
+                return 200, [j.to_dict() for j in self.jobs.values()]
+            if method == "POST":
+                try:
+                    job = self.submit(json.loads(body or b"{}"))
+                except (ValueError, AttributeError) as e:
+                    return 400, {"error": str(e)}
+                except asyncio.QueueFull:
+                    return 503, {"error": "queue is full, retry later"}, {"Retry-After": "5"}
+                return 202, job.to_dict()
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return 404, {"error": f"unknown job {parts[1]}"}
+            if method == "GET":
+                return 200, job.to_dict()
+            if method == "DELETE":
+                if not self.cancel(job.id):
+                    return 409, {"error": f"job already {job.status}"}
+                return 200, job.to_dict()
+        if parts in (["health"], ["jobs"]) or (len(parts) == 2 and parts[0] == "jobs"):
+            return 405, {"error": f"{method} not allowed"}
+        return 404, {"error": f"no route for {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if len(request_line) < 2:
+                result = (400, {"error": "malformed request"})
+            else:
+                result = self.route(request_line[0].upper(), request_line[1], body)
+            status, payload = result[:2]
+            extra = result[2] if len(result) > 2 else {}
+
+            data = json.dumps(payload, ensure_ascii=False).encode()
+            head = [f"HTTP/1.1 {status} {HTTP_REASONS[status]}", "Content-Type: application/json",
+                    f"Content-Length: {len(data)}", "Connection: close"]
+            head += [f"{k}: {v}" for k, v in extra.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, warm=()):
+        if warm:
+            print("🔥 Warming models...")
+            await self.warm(warm)
+        server = await asyncio.start_server(self.handle, host, port)
+        worker = asyncio.create_task(self.worker())
+        print(f"🛰️ Job service listening on http://{host}:{port} (queue size {self.queue_size})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# === 客户端 ===
+
+def request(method, path, payload=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """返回 (状态码, JSON)"""
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(f"http://{host}:{port}{path}", data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+
+
+def _format(job):
+    line = f"{job['id']:<8} {job['status']:<10} {job['stage'] or '-':<11} {job['progress']:>6.0%}  {job['input']}"
+    return line + (f"  ({job['error']})" if job["error"] else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local asset generation service with resident models.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the service")
+    serve.add_argument("--queue-size", type=int, default=8, help="Max queued jobs before submissions get 503")
+    serve.add_argument("--keep-finished", type=int, default=100, help="Finished jobs kept in the job list")
+    serve.add_argument("--finished-ttl", type=float, default=3600.0,
+                       help="Seconds a finished job stays in the job list")
+    serve.add_argument("--warm", action="store_true", help="Load the depth and segmentation models at startup")
+    serve.add_argument("--standins", action="store_true", help="Use random stand-in models (offline testing)")
+    serve.add_argument("--batch-size", type=int, default=None, help="Override depthflow_generator's batch size")
+    serve.add_argument("--inpaint-backend", choices=["auto", "sd", "pyramid"], default=None)
+
+    submit = sub.add_parser("submit", help="Submit a job")
+    submit.add_argument("-i", "--input", required=True, help="Input image path, directory or glob pattern")
+    submit.add_argument("-o", "--output", required=True, help="Output directory")
+    submit.add_argument("-p", "--prompt", default=DEFAULT_PROMPT)
+    submit.add_argument("--resume", action="store_true")
+    submit.add_argument("--wait", action="store_true", help="Poll until the job finishes")
+
+    status = sub.add_parser("status", help="Show one job or all jobs")
+    status.add_argument("job_id", nargs="?")
+
+    cancel = sub.add_parser("cancel", help="Cancel a queued or running job")
+    cancel.add_argument("job_id")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import depthflow_generator as g
+
+        if args.standins:
+            from bench_pipeline import install_standins
+            install_standins()
+        if args.batch_size:
+            g.DEFAULT_BATCH_SIZE = args.batch_size
+        if args.inpaint_backend:
+            g.INPAINT_BACKEND = args.inpaint_backend
+        service = JobService(args.queue_size, keep_finished=args.keep_finished, finished_ttl=args.finished_ttl)
+        warm = (g.get_depth_utils, g.get_seg_model) if args.warm else ()
+        try:
+            asyncio.run(service.serve(args.host, args.port, warm))
+        except KeyboardInterrupt:
+            print("👋 Job service stopped")
+        return
+
+    try:
+        if args.command == "submit":
+            code, job = request("POST", "/jobs", {"input": str(Path(args.input).absolute()),
+                                                  "output": str(Path(args.output).absolute()),
+                                                  "prompt": args.prompt, "resume": args.resume},
+                                args.host, args.port)
+            if code != 202:
+                print(f"❌ {code}: {job['error']}")
+                sys.exit(1)
+            print(_format(job))
+            while args.wait and job["status"] in ("queued", "running"):
+                time.sleep(1.0)
+                _, job = request("GET", f"/jobs/{job['id']}", host=args.host, port=args.port)
+                print(_format(job))
+            if job["status"] in ("failed", "cancelled"):
+                sys.exit(1)
+        elif args.command == "status":
+            code, result = request("GET", f"/jobs/{args.job_id}" if args.job_id else "/jobs",
+                                   host=args.host, port=args.port)
+            if code != 200:
+                print(f"❌ {code}: {result['error']}")
+                sys.exit(1)
+            for job in (result if isinstance(result, list) else [result]):
+                print(_format(job))
+        elif args.command == "cancel":
+            code, result = request("DELETE", f"/jobs/{args.job_id}", host=args.host, port=args.port)
+            print(_format(result) if code == 200 else f"❌ {code}: {result['error']}")
+            if code != 200:
+                sys.exit(1)
+    except urllib.error.URLError as e:
+        print(f"❌ Job service not reachable at {args.host}:{args.port}: {e.reason}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
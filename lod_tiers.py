@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+多档 LOD 资产集
+从全分辨率资产一次读入 (每张 PNG 只解码一次)，为不同档次的设备生成长边 2048 / 1024 ... 的缩小版本。
+深度优先读取 .intermediate/ 中的 float32 深度 (见 intermediate_store.py)，缩小后才量化为 8 位，缺失时读 PNG:
+  <asset_dir>/                 full 档 (原资产)
+  <asset_dir>/lod_2048/        image.png depth.png image_bg.png depth_bg.png subject_mask.png config.json
+  <asset_dir>/lod_1024/        ...
+  <asset_dir>/lod_manifest.json  每档的目录、分辨率、文件字节数与 GPU 纹理占用 (App 按设备能力据此选择目录)
+根目录的资产与 config.json 保持不变，每档目录各有自己的 config.json (resolution 与 lod 字段)。
+
+缩小规则:
+  颜色     LANCZOS
+  深度     边缘感知: 采样足迹内深度跨度小于 edge_threshold 时取面积平均，否则取足迹内最大值 (靠前的表面)，
+           避免前景 / 背景在轮廓处被平均成悬空的中间深度
+  背景深度 与前景深度使用同一足迹网格和同一规则，两张深度图保持逐纹素对齐
+  遮罩     面积平均；前景深度取最大值的纹素同样取足迹内遮罩最大值，使遮罩覆盖被保留下来的前景轮廓
+
+用法: python lod_tiers.py <asset_dir> [--tiers 2048 1024] [--bundle]
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from intermediate_store import depth_to_image, load_array, store_path
+from mask_morphology import dilate, erode
+from texture_bundle import BUNDLE_NAME, export_bundle
+
+DEFAULT_TIERS = (2048, 1024)
+LOD_MANIFEST = "lod_manifest.json"
+ASSET_FILES = ("image.png", "depth.png", "image_bg.png", "depth_bg.png", "subject_mask.png")
+# App 把每张纹理都上传为 R8G8B8A8 (stb_image 强制 4 通道)
+GPU_BYTES_PER_TEXEL = 4
+
+
+def tier_size(size, long_edge):
+    """按长边缩放后的 (宽, 高)，不放大"""
+    w, h = size
+    scale = min(1.0, long_edge / max(w, h))
+    return max(int(round(w * scale)), 1), max(int(round(h * scale)), 1)
+
+
+def _footprint_sample(arr, size):
+    """在每个输出纹素足迹中心取最近的全分辨率纹素"""
+    h, w = arr.shape
+    xs = np.minimum(((np.arange(size[0]) + 0.5) * w / size[0]).astype(np.int64), w - 1)
+    ys = np.minimum(((np.arange(size[1]) + 0.5) * h / size[1]).astype(np.int64), h - 1)
+    return arr[np.ix_(ys, xs)]
+
+
+def _box(arr, size):
+    mode = "F" if arr.dtype == np.float32 else "L"
+    return np.asarray(Image.fromarray(np.ascontiguousarray(arr), mode=mode).resize(size, Image.Resampling.BOX))
+
+
+def downsample_depth_pair(depth, depth_bg, mask, size, edge_threshold=24):
+    """
+    同一足迹网格下缩小前景深度、背景深度与遮罩 (H, W)，返回三个同类型数组。
+    深度为 uint8 (0-255) 或 float32 ([0, 1]，edge_threshold 仍按 0-255 刻度给出)，遮罩为 uint8。
+    足迹最大 / 最小值用 van Herk/Gil-Werman 滤波在全分辨率上求出后在足迹中心采样，
+    半径取缩放倍数的一半，代价与倍数无关。
+    """
+    h, w = depth.shape
+    r = max(int(np.ceil(max(w / size[0], h / size[1]) / 2.0)), 1)
+    threshold = edge_threshold / 255.0 if depth.dtype == np.float32 else edge_threshold
+
+    def edge_aware(d):
+        hi = _footprint_sample(dilate(d, r), size)
+        lo = _footprint_sample(erode(d, r), size)
+        edge = (hi.astype(np.float32) - lo) > threshold
+        return np.where(edge, hi, _box(d, size)), edge
+
+    depth_lr, edge = edge_aware(depth)
+    depth_bg_lr, _ = edge_aware(depth_bg)
+    mask_lr = np.where(edge, _footprint_sample(dilate(mask, r), size), _box(mask, size))
+    return depth_lr, depth_bg_lr, mask_lr
+
+
+def _save_png(arr_or_pil, path):
+    im = arr_or_pil if isinstance(arr_or_pil, Image.Image) else Image.fromarray(arr_or_pil)
+    tmp = path.with_name(f".{path.name}.tmp")
+    im.save(tmp, format="PNG")
+    os.replace(tmp, path)
+
+
+def _tier_entry(name, directory, root):
+    """manifest 中一档的记录: 分辨率、各文件字节数、PNG 总字节与 GPU 纹理占用"""
+    with Image.open(directory / "image.png") as im:
+        w, h = im.size
+    files = {f.name: f.stat().st_size for f in sorted(directory.iterdir())
+             if f.is_file() and (f.name in ASSET_FILES or f.name in ("config.json", BUNDLE_NAME))}
+    return {
+        "name": name,
+        "path": os.path.relpath(directory, root),
+        "resolution": [w, h],
+        "long_edge": max(w, h),
+        "files": files,
+        "png_bytes": sum(v for k, v in files.items() if k.endswith(".png")),
+        "gpu_bytes": len(ASSET_FILES) * w * h * GPU_BYTES_PER_TEXEL,
+    }
+
+
+def export_lod_tiers(asset_dir, tiers=DEFAULT_TIERS, bundle=False, mips=True, edge_threshold=24):
+    """生成所有档次并写入 lod_manifest.json，返回 manifest dict"""
+    asset_dir = Path(asset_dir)
+    image = Image.open(asset_dir / "image.png").convert("RGB")
+    size = image.size
+    image_bg = Image.open(asset_dir / "image_bg.png").convert("RGB")
+
+    def gray(name):
+        im = Image.open(asset_dir / name).convert("L")
+        if im.size != size:
+            im = im.resize(size, Image.Resampling.BILINEAR)
+        return np.asarray(im)
+
+    def float_depth(name):
+        path = store_path(asset_dir, name)
+        if path.exists():
+            arr = load_array(path)
+            if arr.shape == (size[1], size[0]) and arr.dtype == np.float32:
+                return arr
+        return None
+
+    # 两张深度需要同一类型，缺一张 (例如运行时未指定 --keep-intermediates) 就都读 8 位 PNG
+    depth, depth_bg = float_depth("depth"), float_depth("depth_bg")
+    if depth is None or depth_bg is None:
+        depth, depth_bg = gray("depth.png"), gray("depth_bg.png")
+    mask = gray("subject_mask.png")
+    config_path = asset_dir / "config.json"
+    config = json.loads(config_path.read_text()) if config_path.exists() else {}
+
+    entries = []
+    for long_edge in sorted(set(tiers), reverse=True):
+        target = tier_size(size, long_edge)
+        if target == size:
+            continue
+        name = f"lod_{long_edge}"
+        tier_dir = asset_dir / name
+        tier_dir.mkdir(exist_ok=True)
+
+        d, d_bg, m = downsample_depth_pair(depth, depth_bg, mask, target, edge_threshold)
+        _save_png(image.resize(target, Image.Resampling.LANCZOS), tier_dir / "image.png")
+        _save_png(image_bg.resize(target, Image.Resampling.LANCZOS), tier_dir / "image_bg.png")
+        if d.dtype == np.float32:
+            d, d_bg = depth_to_image(d), depth_to_image(d_bg)
+        _save_png(d, tier_dir / "depth.png")
+        _save_png(d_bg, tier_dir / "depth_bg.png")
+        _save_png(m, tier_dir / "subject_mask.png")
+
+        tier_config = dict(config, resolution=list(target), lod={"name": name, "long_edge": long_edge,
+                                                               "source_resolution": list(size)})
+        with open(tier_dir / "config.json", "w") as f:
+            json.dump(tier_config, f, indent=4)
+        if bundle:
+            export_bundle(tier_dir, mips=mips)
+        entries.append((name, tier_dir))
+
+    manifest = {"tiers": [_tier_entry("full", asset_dir, asset_dir)] +
+                         [_tier_entry(name, tier_dir, asset_dir) for name, tier_dir in entries]}
+
+    with open(asset_dir / LOD_MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate lower-resolution LOD tiers for an asset directory.")
+    parser.add_argument("asset_dir", help="Full-resolution asset directory")
+    parser.add_argument("--tiers", type=int, nargs="+", default=list(DEFAULT_TIERS), help="Long-edge sizes")
+    parser.add_argument("--bundle", action="store_true", help="Also export scene.dftb for each tier")
+    parser.add_argument("--edge-threshold", type=int, default=24,
+                        help="Depth range (0-255) within a footprint above which the nearest surface is kept")
+    args = parser.parse_args()
+
+    manifest = export_lod_tiers(args.asset_dir, args.tiers, args.bundle, edge_threshold=args.edge_threshold)
+    for tier in manifest["tiers"]:
+        w, h = tier["resolution"]
+        print(f"🧩 {tier['name']:<9} {w}x{h}  PNG {tier['png_bytes'] / 1024 ** 2:.1f} MB  "
+              f"GPU {tier['gpu_bytes'] / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
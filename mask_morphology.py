@@ -0,0 +1,65 @@
+"""
+全分辨率遮罩形态学 (纯 NumPy)
+van Herk / Gil-Werman 可分离最大 / 最小值滤波，每像素比较次数与半径无关 (O(1))，
+取代 PIL MaxFilter / MinFilter (复杂度随半径平方增长)，因此无需再缩小遮罩处理。
+方形结构元素与 PIL 的 MaxFilter(size=2r+1) 结果一致。
+"""
+import numpy as np
+
+
+def _vhgw_1d(arr, r, axis, op, fill):
+    """沿 axis 做窗口 2r+1 的滑动 max / min (op 为 np.maximum 或 np.minimum)"""
+    if r <= 0:
+        return arr.copy()
+    k = 2 * r + 1
+    a = np.moveaxis(arr, axis, -1)
+    n = a.shape[-1]
+
+    # 两端各补 r 个单位元 (等价于边缘复制)，再补齐到 k 的整数倍以便按块分组
+    padded_len = -(-(n + 2 * r) // k) * k
+    padded = np.full(a.shape[:-1] + (padded_len,), fill, dtype=a.dtype)
+    padded[..., r:r + n] = a
+    blocks = padded.reshape(a.shape[:-1] + (padded_len // k, k))
+
+    # 块内前缀极值 g 与后缀极值 h，任意窗口最多跨两个块: out[i] = op(h[i], g[i + k - 1])
+    g = op.accumulate(blocks, axis=-1).reshape(padded.shape)
+    h = op.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)
+    out = op(h[..., :n], g[..., k - 1:k - 1 + n])
+    return np.moveaxis(out, -1, axis)
+
+
+def dilate(mask, r, ry=None):
+    """方形窗口 (2r+1)x(2r+1) 最大值滤波，对应 PIL ImageFilter.MaxFilter；给出 ry 时纵向半径为 ry"""
+    fill = np.iinfo(mask.dtype).min if mask.dtype.kind in "iu" else -np.inf
+    ry = r if ry is None else ry
+    return _vhgw_1d(_vhgw_1d(mask, r, 1, np.maximum, fill), ry, 0, np.maximum, fill)
+
+
+def erode(mask, r, ry=None):
+    """方形窗口 (2r+1)x(2r+1) 最小值滤波，对应 PIL ImageFilter.MinFilter；给出 ry 时纵向半径为 ry"""
+    fill = np.iinfo(mask.dtype).max if mask.dtype.kind in "iu" else np.inf
+    ry = r if ry is None else ry
+    return _vhgw_1d(_vhgw_1d(mask, r, 1, np.minimum, fill), ry, 0, np.minimum, fill)
+
+
+def rim_mask(mask_arr, max_parallax_percent=0.04):
+    """
+    视差修补环形区域: 主体外扩 offset 像素减去内缩 1.5 * offset 像素的区域
+    mask_arr: uint8 主体遮罩 (H, W)，返回同尺寸 uint8 遮罩
+    """
+    h, w = mask_arr.shape
+    offset_px = int(min(w, h) * max_parallax_percent)
+
+    # 1. 外扩 (Dilation)
+    dilated = dilate(mask_arr, offset_px)
+
+    # 2. 内缩 (Erosion)
+    safe_zone_radius = int(offset_px * 1.5)
+    eroded = erode(mask_arr, safe_zone_radius)
+
+    # 特殊情况处理: 主体太小，内缩后消失，则整个外扩区域都需要修补
+    if np.sum(eroded, dtype=np.int64) < 100:
+        return dilated
+
+    # 3. 计算环形区域 (uint8 下 dilated >= eroded，直接相减不会下溢)
+    return dilated - eroded
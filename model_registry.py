@@ -0,0 +1,166 @@
+"""
+常驻模型注册表
+在可配置的内存预算内保留已加载的模型，新模型放不下时按 LRU 淘汰最久未使用的模型，
+并统计加载 / 命中 / 淘汰次数。depthflow_generator.py 与 generate_mobile_assets.py 共用同一个实例。
+"""
+import gc
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _loaded_torch():
+    """
+    只在 torch 已被导入时返回它: 注册表本身不触发 torch 导入 (约 2 秒)，
+    而缓存中存在 torch 模型就意味着 torch 已经加载
+    """
+    return sys.modules.get("torch")
+
+
+def _parse_budget_gb(value):
+    """把 GB 数值 (字符串或数字) 转为字节数，空值表示不限制"""
+    if value is None or value == "":
+        return None
+    gb = float(value)
+    if gb <= 0:
+        return None
+    return int(gb * (1024 ** 3))
+
+
+def estimate_model_bytes(obj):
+    """估算模型占用的字节数 (参数 + buffer)，支持 nn.Module / diffusers Pipeline / 元组"""
+    torch = _loaded_torch()
+    if obj is None or torch is None:
+        return 0
+
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_model_bytes(o) for o in obj)
+
+    if isinstance(obj, torch.nn.Module):
+        total = 0
+        for t in list(obj.parameters()) + list(obj.buffers()):
+            total += t.numel() * t.element_size()
+        return total
+
+    # diffusers Pipeline: components 中包含 unet / vae / text_encoder 等子模块
+    components = getattr(obj, "components", None)
+    if isinstance(components, dict):
+        return sum(estimate_model_bytes(c) for c in components.values())
+
+    return 0
+
+
+class ModelRegistry:
+    """带内存预算与 LRU 淘汰的模型缓存"""
+
+    def __init__(self, budget_bytes=None):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()   # key -> (model, size_bytes)
+        self._known_sizes = {}          # key -> 上次加载时测得的大小，用于加载前预先腾出空间
+        self._lock = threading.RLock()
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0, "load_seconds": 0.0}
+
+    # --- 查询 ---
+
+    @property
+    def used_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    # --- 配置 ---
+
+    def set_budget(self, budget_bytes):
+        """修改预算，立即淘汰超出部分"""
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict_until_fits(0)
+
+    def set_budget_gb(self, budget_gb):
+        self.set_budget(_parse_budget_gb(budget_gb))
+
+    # --- 核心接口 ---
+
+    def get(self, key, loader):
+        """
+        返回 key 对应的常驻模型，未命中时调用 loader() 加载。
+        loader 返回的对象 (模型、(模型, 处理器) 元组或 Pipeline) 原样缓存。
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key][0]
+
+            # 之前加载过则已知大小，先腾出空间再加载，避免峰值超出预算
+            self._evict_until_fits(self._known_sizes.get(key, 0))
+
+            start = time.perf_counter()
+            model = loader()
+            self.stats["load_seconds"] += time.perf_counter() - start
+            self.stats["loads"] += 1
+
+            size = estimate_model_bytes(model)
+            self._known_sizes[key] = size
+            self._evict_until_fits(size)
+            if self.budget_bytes is not None and size > self.budget_bytes:
+                print(f"⚠️ Model '{key}' ({size / 1024 ** 2:.0f} MB) exceeds the registry budget "
+                      f"({self.budget_bytes / 1024 ** 2:.0f} MB), keeping it resident alone.")
+
+            self._entries[key] = (model, size)
+            return model
+
+    def evict(self, key):
+        """手动淘汰指定模型"""
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                _release_memory()
+
+    def clear(self):
+        """淘汰所有模型"""
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._drop(key)
+            _release_memory()
+
+    def _drop(self, key):
+        del self._entries[key]
+        self.stats["evictions"] += 1
+        print(f"♻️ Evicted model: {key}")
+
+    def _evict_until_fits(self, incoming_bytes):
+        if self.budget_bytes is None:
+            return
+        freed = False
+        while self._entries and self.used_bytes + incoming_bytes > self.budget_bytes:
+            lru_key = next(iter(self._entries))
+            self._drop(lru_key)
+            freed = True
+        if freed:
+            _release_memory()
+
+    # --- 报告 ---
+
+    def summary(self):
+        budget = "unlimited" if self.budget_bytes is None else f"{self.budget_bytes / 1024 ** 2:.0f} MB"
+        return (f"📊 Model registry: loads={self.stats['loads']} hits={self.stats['hits']} "
+                f"evictions={self.stats['evictions']} load_time={self.stats['load_seconds']:.1f}s "
+                f"resident={self.used_bytes / 1024 ** 2:.0f} MB / {budget}")
+
+
+def _release_memory():
+    gc.collect()
+    torch = _loaded_torch()
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+# 全局共享实例，预算由环境变量 DEPTHFLOW_MODEL_BUDGET_GB 指定 (默认不限制)
+MODEL_REGISTRY = ModelRegistry(_parse_budget_gb(os.environ.get("DEPTHFLOW_MODEL_BUDGET_GB")))
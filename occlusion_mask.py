@@ -0,0 +1,89 @@
+"""
+由深度不连续与 config.json 视差参数推导的去遮挡修补遮罩 (纯 NumPy，不调用模型)
+着色器从高度 1 沿 delta = rayDir * height * 0.5 步进，命中 ray_h < depth 处，
+深度为 d 的表面在纹理中平移 (1 - d) * |delta|。近处 d_n 与远处 d_f 相邻时，
+相机偏移会让视线落到近处表面之后、宽度为 (d_n - d_f) * |delta| 的一条背景上，
+这条背景位于近侧、紧贴不连续边缘 —— 只有这里需要修补。
+
+与固定 4% 的 Rim Mask 相比: 半径随深度跳变、config.json 的视差参数与 App 允许的最大偏移缩放，只覆盖近侧，
+没有深度跳变的主体轮廓不修补，也不需要分割模型。
+
+    mask = occlusion_mask(depth, config)   # depth: float32 [0, 1] (H, W)，返回 uint8 0 / 255
+"""
+import math
+
+import numpy as np
+
+from mask_morphology import dilate, erode
+
+# MainActivity 的拖动范围: 每轴 |offset| <= (INITIAL_ZOOM - 1) * 1.5 + 1.0，
+# INITIAL_ZOOM 为常量 1.2，与当前缩放和 config.json 的 zoom 无关，即每轴 1.3
+APP_INITIAL_ZOOM = 1.2
+OFFSET_ZOOM_GAIN = 1.5
+OFFSET_MARGIN = 1.0
+
+
+def max_offset():
+    """App 允许的每轴最大相机偏移"""
+    return (APP_INITIAL_ZOOM - 1.0) * OFFSET_ZOOM_GAIN + OFFSET_MARGIN
+
+
+def max_ray_shift(config, offset=None):
+    """
+    每轴最大纹理平移 |delta| (uv 单位)
+    rayDir = -offset + uv * focus * 0.1，屏幕 uv 在 ±0.5 / zoom 之内；zoom 只缩放屏幕，不影响纹理中的平移。
+    isometric 目前不参与着色器计算，这里不据此缩小 (保守估计)。
+    """
+    offset = max_offset() if offset is None else offset
+    zoom = max(float(config.get("zoom", 1.0)), 1.0)
+    ray = abs(offset) + abs(float(config.get("focus", 0.0))) * 0.1 * 0.5 / zoom
+    return ray * abs(float(config.get("height", 0.2))) * 0.5
+
+
+def occlusion_mask(depth, config, offset=None, min_jump=0.05, edge_radius=3, bins=8, margin=2):
+    """
+    depth: float32 [0, 1] 深度 (H, W)，可以是 .intermediate/depth.npy 的内存映射
+    config: config.json 内容 (height / zoom / focus)
+    offset: 覆盖每轴最大相机偏移，默认见 max_offset
+    min_jump: 小于该深度差的变化视为连续表面
+    edge_radius: 检测窗口半径，渐变过渡 (导向滤波放大后约数个像素) 也能测出完整跳变
+    bins: 按跳变幅度分档，每档用该档上限的半径做一次 O(1) 形态学
+    margin: 额外的像素余量 (抗锯齿边缘与背景深度估计误差)
+    """
+    depth = np.asarray(depth, dtype=np.float32)
+    h, w = depth.shape
+    shift = max_ray_shift(config, offset)
+
+    # 近侧边缘: 比窗口内最远处高出 min_jump 以上的像素，跳变幅度即为可揭示的深度差
+    jump = depth - erode(depth, edge_radius)
+    edges = jump > min_jump
+    out = np.zeros((h, w), dtype=bool)
+    if not edges.any() or shift <= 0:
+        return out.view(np.uint8) * np.uint8(255)
+
+    levels = np.linspace(min_jump, float(jump[edges].max()), bins + 1)
+    levels[-1] = np.nextafter(levels[-1], np.float32(np.inf))
+    for lo, hi in zip(levels[:-1], levels[1:]):
+        band = edges & (jump > lo) & (jump <= hi)
+        if not band.any():
+            continue
+        rx = math.ceil(hi * shift * w) + margin
+        ry = math.ceil(hi * shift * h) + margin
+        # 只在该档边缘的包围盒 (外扩 reach 与 near 判断所需的半径) 内计算
+        win = _window(band, 2 * rx + edge_radius, 2 * ry + edge_radius)
+        reach = dilate(band[win].view(np.uint8), rx, ry).view(bool)
+        # 只保留近侧: 高出该范围内最远处至少半个跳变的像素
+        near = depth[win] - erode(depth[win], rx + edge_radius, ry + edge_radius) > lo * 0.5
+        out[win] |= reach & near
+
+    # 边缘本身的过渡像素两侧都修补，避免前景颜色残留在背景层中
+    out |= dilate(edges.view(np.uint8), margin).view(bool)
+    return out.view(np.uint8) * np.uint8(255)
+
+
+def _window(mask, rx, ry):
+    """mask 中非零像素的包围盒四周外扩 (rx, ry) 后的切片"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    return (slice(max(rows[0] - ry, 0), rows[-1] + ry + 1),
+            slice(max(cols[0] - rx, 0), cols[-1] + rx + 1))
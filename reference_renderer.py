@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+depthflow.frag 的 NumPy 参考实现 (CPU 无头渲染)
+逐行对应 app/src/main/shaders/depthflow.frag: 镜像采样 gtexture、RayMarch (线性搜索 + 5 次二分 + 中心差分梯度)、
+前景 / 背景 / 遮罩混合以及 sat 颜色字段。整帧 (以及一批相机参数) 一次性向量化计算，像素按块处理以限制内存。
+用于服务器端预览、生成回归测试的基准帧，以及评估步数与画质的取舍。
+
+采样器与 native-lib.cpp 中的 loadTex 一致: 线性过滤、mip 0，VkSamplerCreateInfo 未设置寻址模式，
+即默认的 REPEAT (纹理边缘的双线性采样与对边的纹素混合)。
+颜色字段: depthflow.frag 只实现了 sat；vig / con / bri / gam / sep / gray 在 UBO 中保留但不参与渲染，这里同样忽略。
+
+用法: python reference_renderer.py <asset_dir> [-o preview.png] [--width 1080 --height 1920] [--offset 0.3 0.0 ...]
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# UBO 字段默认值: 与 native-lib.cpp 初始化及 MainActivity 的初始状态一致
+DEFAULT_PARAMS = {
+    "height": 0.05, "steady": 0.5, "focus": 0.0, "zoom": 1.2,
+    "isometric": 0.0, "dolly": 0.0, "invert": 0.0, "mirror": 0.0,
+    "offset_x": 0.0, "offset_y": 0.0,
+    "inpaint": 0.01, "quality": 0.5,
+    "vig": 0.0, "sat": 0.0, "con": 0.0, "bri": 0.0, "gam": 0.0, "sep": 0.0, "gray": 0.0,
+}
+
+# 着色器中线性搜索的步数上限与二分次数
+MAX_STEPS = 80
+BINARY_STEPS = 5
+
+
+# === 资产 ===
+
+def load_scene(asset_dir):
+    """读取资产目录，返回 float32 纹理 (0-1) 与 config.json 内容"""
+    asset_dir = Path(asset_dir)
+
+    def rgb(name):
+        return np.asarray(Image.open(asset_dir / name).convert("RGB"), dtype=np.float32) / 255.0
+
+    def gray(name, size):
+        im = Image.open(asset_dir / name).convert("L")
+        if im.size != size:
+            im = im.resize(size, Image.Resampling.BILINEAR)
+        return np.asarray(im, dtype=np.float32) / 255.0
+
+    image = rgb("image.png")
+    size = (image.shape[1], image.shape[0])
+    scene = {
+        "image": image,
+        "image_bg": rgb("image_bg.png"),
+        "depth": gray("depth.png", size),
+        "depth_bg": gray("depth_bg.png", size),
+        "mask": gray("subject_mask.png", size),
+        "config": {},
+    }
+    config_path = asset_dir / "config.json"
+    if config_path.exists():
+        scene["config"] = json.loads(config_path.read_text())
+    return scene
+
+
+def params_from_config(config, **overrides):
+    """用 config.json 中的字段覆盖默认 UBO 参数，再应用 overrides"""
+    params = dict(DEFAULT_PARAMS)
+    for key in params:
+        if key in config:
+            params[key] = float(config[key])
+    params.update(overrides)
+    return params
+
+
+# === 采样 ===
+
+def _mirror(uv):
+    """gtexture / getDepth 中的镜像坐标: abs(fract(uv * 0.5 + 0.5) * 2 - 1)"""
+    t = uv * 0.5 + 0.5
+    return np.abs((t - np.floor(t)) * 2.0 - 1.0)
+
+
+def sample(tex, u, v):
+    """
+    线性过滤采样 (纹素中心在 (i + 0.5) / N)，u / v 为已镜像到 [0, 1] 的一维坐标数组。
+    寻址模式为 REPEAT: 越过边缘的相邻纹素取自对边，与设备上的采样器一致。
+    """
+    h, w = tex.shape[:2]
+    x = u * w - 0.5
+    y = v * h - 0.5
+    x0 = np.floor(x).astype(np.int32)
+    y0 = np.floor(y).astype(np.int32)
+    fx = (x - x0).astype(np.float32)
+    fy = (y - y0).astype(np.float32)
+    # 坐标在 [0, 1] 内，下标只会越界一个纹素: -1 -> N - 1，N -> 0
+    x0[x0 < 0] += w
+    y0[y0 < 0] += h
+    x1 = x0 + 1
+    y1 = y0 + 1
+    x1[x1 >= w] -= w
+    y1[y1 >= h] -= h
+    if tex.ndim == 3:
+        fx, fy = fx[:, None], fy[:, None]
+    top = tex[y0, x0] + (tex[y0, x1] - tex[y0, x0]) * fx
+    bottom = tex[y1, x0] + (tex[y1, x1] - tex[y1, x0]) * fx
+    return top + (bottom - top) * fy
+
+
+def gtexture(tex, uv):
+    m = _mirror(uv)
+    return sample(tex, m[:, 0], m[:, 1])
+
+
+def get_depth(depth, uv, invert):
+    d = gtexture(depth, uv)
+    return np.where(invert > 0.5, 1.0 - d, d)
+
+
+def smoothstep(e0, e1, x):
+    t = np.clip((x - e0) / (e1 - e0), 0.0, 1.0)
+    return t * t * (3.0 - 2.0 * t)
+
+
+# === RayMarch ===
+
+def ray_march(uv, direction, depth, height, invert, offset_len, quality, img_size):
+    """
+    向量化 RayMarch。所有参数按像素展开 (N,) / (N, 2)，同一批中可以混合不同相机参数。
+    返回 (uv, val, steep)
+    """
+    steps = np.minimum((30.0 + (80.0 - 30.0) * quality + np.minimum(offset_len, 2.0) * 40.0).astype(np.int32),
+                       MAX_STEPS)
+    step_size = (1.0 / steps).astype(np.float32)
+    delta = direction * (height * 0.5)[:, None]
+
+    n = uv.shape[0]
+    curr_uv = uv.copy()
+    curr_h = np.ones(n, dtype=np.float32)
+    prev_h = np.ones(n, dtype=np.float32)
+    curr_d = np.zeros(n, dtype=np.float32)
+    hit = np.zeros(n, dtype=bool)
+
+    # 1. 线性搜索: 只对尚未命中且未走完步数的像素继续前进
+    active = np.arange(n)
+    for i in range(int(steps.max())):
+        active = active[steps[active] > i]
+        if active.size == 0:
+            break
+        d = get_depth(depth, curr_uv[active], invert[active])
+        ray_h = 1.0 - i * step_size[active]
+        curr_d[active] = d
+        curr_h[active] = ray_h
+
+        is_hit = ray_h < d
+        hit[active[is_hit]] = True
+        go = active[~is_hit]
+        prev_h[go] = ray_h[~is_hit]
+        curr_uv[go] += delta[go] * step_size[go, None]
+        active = go
+
+    res_uv = curr_uv.copy()
+    res_val = curr_d.copy()
+
+    # 2. 二分查找
+    idx = np.nonzero(hit)[0]
+    if idx.size:
+        before = curr_uv[idx] - delta[idx] * step_size[idx, None]
+        after = curr_uv[idx].copy()
+        h_before = prev_h[idx].copy()
+        h_after = curr_h[idx].copy()
+        final_uv = after.copy()
+        final_d = curr_d[idx].copy()
+        for _ in range(BINARY_STEPS):
+            mid = (before + after) * 0.5
+            mid_h = (h_before + h_after) * 0.5
+            mid_d = get_depth(depth, mid, invert[idx])
+            below = mid_h < mid_d
+            after[below] = mid[below]
+            h_after[below] = mid_h[below]
+            final_uv[below] = mid[below]
+            final_d[below] = mid_d[below]
+            before[~below] = mid[~below]
+            h_before[~below] = mid_h[~below]
+        res_uv[idx] = final_uv
+        res_val[idx] = final_d
+
+    # 3. 中心差分梯度
+    px = 1.0 / img_size
+    zero = np.zeros(n, dtype=np.float32)
+    dx = np.stack([np.full(n, px[0], dtype=np.float32), zero], axis=1)
+    dy = np.stack([zero, np.full(n, px[1], dtype=np.float32)], axis=1)
+    grad_x = np.abs(get_depth(depth, res_uv - dx, invert) - get_depth(depth, res_uv + dx, invert))
+    grad_y = np.abs(get_depth(depth, res_uv - dy, invert) - get_depth(depth, res_uv + dy, invert))
+    steep = np.maximum(grad_x, grad_y) * np.minimum(offset_len, 1.0) * 25.0
+    return res_uv, res_val, steep
+
+
+# === 颜色 ===
+
+def apply_color(color, sat):
+    """
+    depthflow.frag 中唯一的颜色字段 sat: 0.1 < sat != 1 时向灰度插值。
+    sat 为逐像素 (N,) 数组，同一批中不同帧的片元各自取自己的值。
+    """
+    on = (sat > 0.1) & (sat != 1.0)
+    if not on.any():
+        return color
+    gray = (color @ np.array([0.299, 0.587, 0.114], dtype=np.float32))[:, None]
+    return np.where(on[:, None], gray + (color - gray) * sat[:, None], color)
+
+
+# === 主渲染 ===
+
+def _shade(scene, frag, p, img_size, screen_size):
+    """对一组片元 (frag: (N, 2) 屏幕 uv) 按 depthflow.frag 的 main() 着色，p 中每个字段为 (N,) 数组"""
+    n = frag.shape[0]
+    scr_ratio = screen_size[0] / screen_size[1]
+    img_ratio = img_size[0] / img_size[1]
+    fit_ratio = scr_ratio / img_ratio
+
+    uv = frag - 0.5
+    uv[:, 1] /= fit_ratio
+    uv /= p["zoom"][:, None]
+    base_uv = uv + 0.5
+
+    out = np.zeros((n, 3), dtype=np.float32)
+    inside = np.all((base_uv >= 0.0) & (base_uv <= 1.0), axis=1)
+    idx = np.nonzero(inside)[0]
+    if idx.size == 0:
+        return out
+
+    q = {k: v[idx] for k, v in p.items()}
+    base = base_uv[idx]
+    offset = np.stack([q["offset_x"], q["offset_y"]], axis=1)
+    offset_len = np.linalg.norm(offset, axis=1)
+    ray_dir = -offset + uv[idx] * (q["focus"] * 0.1)[:, None]
+
+    fg_uv, _, fg_steep = ray_march(base, ray_dir, scene["depth"], q["height"], q["invert"],
+                                   offset_len, q["quality"], img_size)
+    bg_uv, _, _ = ray_march(base, ray_dir, scene["depth_bg"], q["height"], q["invert"],
+                            offset_len, q["quality"], img_size)
+
+    c_fg = gtexture(scene["image"], fg_uv)
+    c_bg = gtexture(scene["image_bg"], bg_uv)
+
+    # 混合遮罩
+    subj = smoothstep(0.1, 0.6, np.maximum(gtexture(scene["mask"], base), gtexture(scene["mask"], fg_uv)))
+    inpaint = np.maximum(q["inpaint"], 0.15)
+    base_m = smoothstep(inpaint, inpaint + 0.2, fg_steep)
+    safe = inpaint + 0.35
+    subj_m = smoothstep(safe, safe + 0.5, fg_steep)
+
+    # 额外的拉伸保护
+    stretch = np.linalg.norm(fg_uv - base, axis=1)
+    limit = offset_len * q["height"] * 2.0
+    over = (limit > 0.0) & (stretch > limit)
+    subj_m = np.where(over, 1.0, subj_m)
+    base_m = np.where(over, 1.0, base_m)
+
+    m = (base_m + (subj_m - base_m) * subj)[:, None]
+    color = c_fg + (c_bg - c_fg) * m
+    out[idx] = apply_color(color, q["sat"])
+    return out
+
+
+def render_frames(scene, params_list, size=None, chunk_pixels=1 << 15):
+    """
+    渲染一批帧。params_list: UBO 参数 dict 列表 (缺省字段取 DEFAULT_PARAMS)；
+    size: 输出 (宽, 高)，默认与原图相同。返回 uint8 数组 (B, H, W, 3)。
+    所有帧的像素展开后按 chunk_pixels 分块，每块 (可以包含多帧) 一次着色，UBO 参数逐像素展开。
+    """
+    img_h, img_w = scene["depth"].shape
+    img_size = np.array([img_w, img_h], dtype=np.float32)
+    width, height = size or (img_w, img_h)
+
+    params_list = [dict(DEFAULT_PARAMS, **p) for p in params_list]
+    batch = len(params_list)
+    total = batch * width * height
+    frames = np.empty((total, 3), dtype=np.uint8)
+
+    # 片元坐标取像素中心，与光栅化一致
+    fx = (np.arange(width, dtype=np.float32) + 0.5) / width
+    fy = (np.arange(height, dtype=np.float32) + 0.5) / height
+    table = {k: np.array([p[k] for p in params_list], dtype=np.float32) for k in DEFAULT_PARAMS}
+
+    for start in range(0, total, chunk_pixels):
+        flat = np.arange(start, min(start + chunk_pixels, total))
+        frame_idx, pix = np.divmod(flat, width * height)
+        py, px = np.divmod(pix, width)
+        frag = np.stack([fx[px], fy[py]], axis=1)
+        p = {k: v[frame_idx] for k, v in table.items()}
+        color = _shade(scene, frag, p, img_size, (width, height))
+        frames[flat] = (np.clip(color, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+    return frames.reshape(batch, height, width, 3)
+
+
+def render_frame(scene, size=None, **params):
+    return render_frames(scene, [params], size)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render DepthFlow frames on the CPU.")
+    parser.add_argument("asset_dir", help="Asset directory (image.png, depth.png, ..., config.json)")
+    parser.add_argument("-o", "--output", default="preview.png",
+                        help="Output image; with several offsets a frame index is appended")
+    parser.add_argument("--width", type=int, default=None, help="Output width (default: image width)")
+    parser.add_argument("--height", type=int, default=None, help="Output height (default: image height)")
+    parser.add_argument("--offset", type=float, nargs=2, action="append", metavar=("X", "Y"),
+                        help="Camera offset; repeat to render several frames in one batch")
+    parser.add_argument("--zoom", type=float, default=None, help="Override zoom")
+    parser.add_argument("--quality", type=float, default=None, help="Override quality (0-1)")
+    args = parser.parse_args()
+
+    scene = load_scene(args.asset_dir)
+    img_h, img_w = scene["depth"].shape
+    size = (args.width or img_w, args.height or img_h)
+
+    overrides = {k: v for k, v in (("zoom", args.zoom), ("quality", args.quality)) if v is not None}
+    offsets = args.offset or [(scene["config"].get("offset_x", 0.0), scene["config"].get("offset_y", 0.0))]
+    params = [params_from_config(scene["config"], offset_x=x, offset_y=y, **overrides) for x, y in offsets]
+
+    frames = render_frames(scene, params, size)
+    output = Path(args.output)
+    for i, frame in enumerate(frames):
+        path = output if len(frames) == 1 else output.with_name(f"{output.stem}_{i:03d}{output.suffix}")
+        Image.fromarray(frame, mode="RGB").save(path)
+        print(f"🖼️ Rendered {path}")
+
+
+if __name__ == "__main__":
+    main()
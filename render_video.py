@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+视差视频 / 帧序列导出
+读取生成好的资产目录，按相机路径 (offset / zoom / height / focus 关键帧，字段与 UBO 一致) 用
+reference_renderer 在进程池中逐帧渲染，渲染结果经有界生成器按顺序流向编码器:
+  *.mp4 / *.webm / *.mov  通过管道写入 ffmpeg (需要 PATH 中有 ffmpeg)
+  *.gif                   逐帧量化后立即写入文件 (不经过 Pillow 的多帧保存，后者会保留全部帧做差分比较)
+  目录                    编号 PNG 序列 frame_00000.png ...
+同一时刻最多只有 2 x workers 帧在内存中，整段视频不会一次性驻留。
+场景纹理 (约 5 张全分辨率 float32) 在父进程中读取一次，支持 fork 的平台上工作进程写时复制共享同一份，
+内存不随 --workers 线性增长；其他平台退回到每个工作进程各自读取。
+
+相机路径 JSON:
+  {"fps": 30, "duration": 4.0, "ease": "smooth",
+   "keyframes": [{"t": 0.0, "offset_x": -0.3}, {"t": 0.5, "offset_x": 0.3}, {"t": 1.0, "offset_x": -0.3}]}
+t 为归一化时间 (0-1)，关键帧中未给出的字段沿用 config.json 的值。
+dolly / isometric 不参与参考渲染器与着色器的计算，关键帧中给出非默认值会报错，而不是静默输出不同的视频。
+
+用法: python render_video.py <asset_dir> -o parallax.mp4 [--path camera.json] [--workers N] [--width 720]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import GifImagePlugin, Image
+
+import reference_renderer
+
+# 关键帧可以插值的 UBO 字段
+PATH_FIELDS = ("offset_x", "offset_y", "zoom", "height", "focus")
+# UBO 中存在但渲染器不使用的字段 -> 默认值
+UNSUPPORTED_FIELDS = {"dolly": 0.0, "isometric": 0.0}
+
+# 默认相机路径: 与 App 的左右摆动一致的水平往返
+DEFAULT_PATH = {
+    "fps": 30,
+    "duration": 4.0,
+    "ease": "smooth",
+    "keyframes": [
+        {"t": 0.0, "offset_x": -0.3},
+        {"t": 0.5, "offset_x": 0.3},
+        {"t": 1.0, "offset_x": -0.3},
+    ],
+}
+
+VIDEO_SUFFIXES = {".mp4", ".webm", ".mov", ".mkv"}
+
+
+# === 相机路径 ===
+
+def _ease(t, mode):
+    if mode == "smooth":
+        return t * t * (3.0 - 2.0 * t)
+    return t
+
+
+def camera_params(path, base, index, count):
+    """第 index 帧 (共 count 帧) 的 UBO 参数: 在相邻关键帧之间逐字段插值"""
+    keys = sorted(path["keyframes"], key=lambda k: k["t"])
+    t = index / max(count - 1, 1)
+    params = dict(base)
+
+    for field in PATH_FIELDS:
+        points = [(k["t"], k[field]) for k in keys if field in k]
+        if not points:
+            continue
+        if t <= points[0][0]:
+            params[field] = points[0][1]
+            continue
+        if t >= points[-1][0]:
+            params[field] = points[-1][1]
+            continue
+        for (t0, v0), (t1, v1) in zip(points, points[1:]):
+            if t0 <= t <= t1:
+                a = _ease((t - t0) / (t1 - t0) if t1 > t0 else 1.0, path.get("ease", "linear"))
+                params[field] = v0 + (v1 - v0) * a
+                break
+    return params
+
+
+def validate_camera_path(path):
+    """关键帧把 UNSUPPORTED_FIELDS 设为非默认值时抛出 ValueError"""
+    for key in path["keyframes"]:
+        for field, default in UNSUPPORTED_FIELDS.items():
+            if field in key and key[field] != default:
+                raise ValueError(f"keyframe t={key.get('t')}: '{field}' is not supported by the renderer "
+                                 f"(got {key[field]}, only {default} is allowed)")
+    return path
+
+
+def load_camera_path(path_file=None, fps=None, duration=None):
+    path = dict(DEFAULT_PATH)
+    if path_file:
+        path.update(json.loads(Path(path_file).read_text()))
+    if fps:
+        path["fps"] = fps
+    if duration:
+        path["duration"] = duration
+    return path
+
+
+# === 进程池渲染 ===
+
+_WORKER_SCENE = None
+
+
+def _init_worker(asset_dir):
+    """没有 fork 时每个工作进程读取一次资产 (约 5 张全分辨率 float32 纹理)"""
+    global _WORKER_SCENE
+    _WORKER_SCENE = reference_renderer.load_scene(asset_dir)
+
+
+def _pool_options(asset_dir):
+    """
+    ProcessPoolExecutor 的参数: 有 fork 时在父进程读取场景，工作进程继承只读的纹理页 (写时复制，只占一份内存)；
+    fork 模式下 ProcessPoolExecutor 在启动管理线程之前一次创建全部工作进程
+    """
+    global _WORKER_SCENE
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return {"initializer": _init_worker, "initargs": (str(asset_dir),)}
+    _WORKER_SCENE = reference_renderer.load_scene(asset_dir)
+    return {"mp_context": multiprocessing.get_context("fork")}
+
+
+def _render_one(args):
+    params, size = args
+    return reference_renderer.render_frame(_WORKER_SCENE, size, **params)
+
+
+def stream_frames(asset_dir, params_list, size, workers=None):
+    """
+    有界生成器: 按顺序产出 uint8 (H, W, 3) 帧。
+    最多同时提交 2 x workers 个渲染任务，消费者 (编码器) 变慢时渲染自动暂停。
+    """
+    global _WORKER_SCENE
+    workers = workers or os.cpu_count()
+    inflight = deque()
+    tasks = iter(params_list)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, **_pool_options(asset_dir)) as pool:
+            for params in tasks:
+                inflight.append(pool.submit(_render_one, (params, size)))
+                if len(inflight) >= 2 * workers:
+                    break
+            while inflight:
+                frame = inflight.popleft().result()
+                params = next(tasks, None)
+                if params is not None:
+                    inflight.append(pool.submit(_render_one, (params, size)))
+                yield frame
+    finally:
+        _WORKER_SCENE = None
+
+
+# === 编码 ===
+
+def write_sequence(frames, output):
+    output.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for count, frame in enumerate(frames, 1):
+        Image.fromarray(frame, mode="RGB").save(output / f"frame_{count - 1:05d}.png")
+    return count
+
+
+def write_video(frames, output, fps, size):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg not found in PATH; write a .gif or a frame directory instead")
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+           "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+           "-pix_fmt", "yuv420p", str(output)]
+    if output.suffix.lower() in (".mp4", ".mov", ".mkv"):
+        cmd[-1:-1] = ["-c:v", "libx264", "-crf", "18", "-movflags", "+faststart"]
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    count = 0
+    try:
+        for count, frame in enumerate(frames, 1):
+            proc.stdin.write(frame.tobytes())
+    finally:
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {proc.returncode}")
+    return count
+
+
+def write_gif(frames, output, fps):
+    """
+    逐帧写入 GIF: 全局头取第一帧的调色板，每帧带自己的局部调色板，写完即释放。
+    Image.save(save_all=True) 会为帧间差分保留之前的帧，整段动画因此全部驻留内存。
+    """
+    duration = round(1000 / fps)
+    count = 0
+    tmp = output.with_name(f".{output.name}.tmp")
+    with open(tmp, "wb") as f:
+        for count, frame in enumerate(frames, 1):
+            im = Image.fromarray(frame, mode="RGB").quantize(256)
+            if count == 1:
+                header, _ = GifImagePlugin.getheader(im, info={"loop": 0, "duration": duration})
+                f.writelines(header)
+            f.writelines(GifImagePlugin.getdata(im, duration=duration, include_color_table=True))
+        f.write(b";")
+    if count == 0:
+        tmp.unlink()
+        raise RuntimeError("no frames to write")
+    os.replace(tmp, output)
+    return count
+
+
+def peak_rss_mb():
+    """主进程与已结束子进程的峰值 RSS (MB)；fork 共享的场景纹理页计入每个进程的 RSS，但只占一份物理内存"""
+    # ru_maxrss: Linux 为 KB，macOS 为字节
+    scale = 1024 ** 2 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def render_video(asset_dir, output, path=None, size=None, workers=None):
+    """渲染整段视频，返回统计信息 dict"""
+    asset_dir = Path(asset_dir)
+    output = Path(output)
+    path = validate_camera_path(path or DEFAULT_PATH)
+    config_path = asset_dir / "config.json"
+    config = json.loads(config_path.read_text()) if config_path.exists() else {}
+    base = reference_renderer.params_from_config(config)
+
+    if size is None:
+        with Image.open(asset_dir / "image.png") as im:
+            size = im.size
+    # yuv420p 要求偶数宽高
+    size = (size[0] // 2 * 2, size[1] // 2 * 2)
+
+    count = max(int(round(path["fps"] * path["duration"])), 1)
+    params_list = [camera_params(path, base, i, count) for i in range(count)]
+    frames = stream_frames(asset_dir, params_list, size, workers)
+
+    start = time.perf_counter()
+    suffix = output.suffix.lower()
+    if suffix in VIDEO_SUFFIXES:
+        written = write_video(frames, output, path["fps"], size)
+    elif suffix == ".gif":
+        written = write_gif(frames, output, path["fps"])
+    else:
+        written = write_sequence(frames, output)
+    elapsed = time.perf_counter() - start
+
+    own, children = peak_rss_mb()
+    return {
+        "frames": written,
+        "size": list(size),
+        "seconds": elapsed,
+        "fps": written / elapsed if elapsed > 0 else 0.0,
+        "workers": workers or os.cpu_count(),
+        "peak_rss_main_mb": own,
+        "peak_rss_worker_mb": children,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a parallax clip from a DepthFlow asset directory.")
+    parser.add_argument("asset_dir", help="Asset directory (image.png, depth.png, ..., config.json)")
+    parser.add_argument("-o", "--output", default="parallax.mp4",
+                        help="Output: .mp4/.webm/.mov/.mkv (ffmpeg), .gif, or a directory for a PNG sequence")
+    parser.add_argument("--path", default=None, help="Camera path JSON (keyframes); default is a horizontal sway")
+    parser.add_argument("--fps", type=int, default=None, help="Override the camera path fps")
+    parser.add_argument("--duration", type=float, default=None, help="Override the camera path duration (s)")
+    parser.add_argument("--width", type=int, default=None, help="Output width (default: image width)")
+    parser.add_argument("--height", type=int, default=None, help="Output height (default: keep aspect)")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: all cores)")
+    args = parser.parse_args()
+
+    size = None
+    if args.width or args.height:
+        with Image.open(Path(args.asset_dir) / "image.png") as im:
+            w, h = im.size
+        width = args.width or round(w * args.height / h)
+        height = args.height or round(h * width / w)
+        size = (width, height)
+
+    path = load_camera_path(args.path, args.fps, args.duration)
+    try:
+        validate_camera_path(path)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"🎬 Rendering {args.asset_dir} -> {args.output}")
+    stats = render_video(args.asset_dir, args.output, path, size, args.workers)
+    print(f"✅ {stats['frames']} frames {stats['size'][0]}x{stats['size'][1]} in {stats['seconds']:.1f}s "
+          f"({stats['fps']:.2f} fps, {stats['workers']} workers)")
+    print(f"📊 Peak RSS: main {stats['peak_rss_main_mb']:.0f} MB, worker {stats['peak_rss_worker_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+多进程分片批处理 (CPU 节点)
+父进程先加载模型再 fork 出 N 个 worker: 权重以写时复制的方式在进程间共享，只占一份物理内存。
+每个 worker 绑定到互不重叠的一组 CPU 核 (sched_setaffinity)，并把 torch 线程数设为所分到的核数，
+避免多个进程各自按默认线程数运行而超额占用 CPU；图片按像素数均衡地分配给各 worker，各自完整执行 run_stages。
+
+--sweep 依次用不同的 worker 数跑同一批图片，报告吞吐量，帮助选择合适的设置。
+CUDA 不能在 fork 之后继续使用，GPU 上退化为单进程。
+
+用法: python shard_runner.py -i <目录/glob> -o <输出目录> [--workers 4] [--threads-per-worker N]
+      python shard_runner.py -i <目录/glob> -o <输出目录> --sweep 1 2 4 8 [--standins]
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+
+from PIL import Image
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_cores(workers, cores, threads_per_worker=None):
+    """把核均分给 worker，返回每个 worker 的核列表；worker 多于核时轮流共享"""
+    per = threads_per_worker or max(1, len(cores) // workers)
+    return [[cores[(i * per + j) % len(cores)] for j in range(per)] for i in range(workers)]
+
+
+def shard_jobs(jobs, workers):
+    """按图片像素数做最长处理时间优先 (LPT) 分配，使各 worker 的工作量接近"""
+    pixels = {}
+    for job in jobs:
+        with Image.open(job[0]) as im:
+            pixels[job[0]] = im.width * im.height
+
+    shards = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for job in sorted(jobs, key=lambda j: pixels[j[0]], reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(job)
+        loads[i] += pixels[job[0]]
+    return [s for s in shards if s]
+
+
+def preload_backend():
+    """
+    与 select_inpaint_backend 相同的规则下事先能确定的修补后端: "sd" / "pyramid"，无法确定时为 None
+    (CPU 上的 auto 按每张图的修补面积选择)
+    """
+    import depthflow_generator as g
+
+    backend = g.INPAINT_BACKEND or "auto"
+    if backend == "auto":
+        return "sd" if g.get_device() != "cpu" else None
+    return backend
+
+
+def preload_models():
+    """fork 之前在父进程加载模型，worker 继承已加载的权重；SD 只在确定会用到时预加载"""
+    import depthflow_generator as g
+
+    g.get_depth_utils()
+    if g.SUBJECT_MASK:
+        g.get_seg_model()
+    if preload_backend() == "sd":
+        g.get_inpainting_pipe()
+
+
+def _worker(index, jobs, cores, prompt, batch_size, quiet, results):
+    import depthflow_generator as g
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch = g._import_torch()
+    torch.set_num_threads(len(cores))
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            g.run_stages(jobs, prompt, batch_size)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    results.put({"worker": index, "images": len(jobs), "cores": cores, "error": error,
+                 "wall_s": time.perf_counter() - start, "cpu_s": time.process_time() - cpu_start})
+
+
+def run_sharded(jobs, prompt, workers, threads_per_worker=None, batch_size=None, quiet=False):
+    """用 workers 个进程处理 jobs，返回汇总统计"""
+    import depthflow_generator as g
+
+    batch_size = batch_size or g.DEFAULT_BATCH_SIZE
+    if g.get_device() == "cuda" and workers > 1:
+        print("⚠️ CUDA cannot be used after fork, running a single process")
+        workers = 1
+
+    preload_models()
+    shards = shard_jobs(jobs, workers)
+    core_plan = plan_cores(len(shards), available_cores(), threads_per_worker)
+
+    ctx = mp.get_context("fork")
+    results = ctx.Queue()
+    start = time.perf_counter()
+    procs = [ctx.Process(target=_worker, args=(i, shard, cores, prompt, batch_size, quiet, results))
+             for i, (shard, cores) in enumerate(zip(shards, core_plan))]
+    sys.stdout.flush()  # 否则缓冲区中的输出会被每个子进程重复打印
+    for p in procs:
+        p.start()
+    per_worker = []
+    while len(per_worker) < len(procs):
+        try:
+            per_worker.append(results.get(timeout=1.0))
+        except queue.Empty:
+            if not any(p.is_alive() for p in procs) and results.empty():
+                break  # worker 异常退出 (如被 OOM 杀掉)，没有结果可等
+    per_worker.sort(key=lambda r: r["worker"])
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - start
+
+    errors = [r["error"] for r in per_worker if r["error"]]
+    errors += [f"worker {i} exited with {p.exitcode}" for i, p in enumerate(procs) if p.exitcode]
+    return {"workers": len(procs), "threads": len(core_plan[0]), "images": len(jobs), "wall_s": wall,
+            "images_per_s": len(jobs) / wall if wall else 0.0, "per_worker": per_worker, "errors": errors}
+
+
+def print_stats(stats):
+    print(f"🧵 {stats['workers']} worker(s) x {stats['threads']} thread(s): {stats['images']} images in "
+          f"{stats['wall_s']:.1f}s ({stats['images_per_s']:.2f} img/s)")
+    for r in stats["per_worker"]:
+        util = r["cpu_s"] / (r["wall_s"] * len(r["cores"])) if r["wall_s"] else 0.0
+        print(f"   worker {r['worker']}: {r['images']} images, cores {r['cores']}, "
+              f"{r['wall_s']:.1f}s, CPU utilisation {util:.0%}" + (f"  ❌ {r['error']}" if r["error"] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded multi-process batch runner for CPU nodes.")
+    parser.add_argument("-i", "--input", required=True, help="Input directory or glob pattern")
+    parser.add_argument("-o", "--output", default="output", help="Output directory")
+    parser.add_argument("-p", "--prompt", default="background, nature, realistic, high quality")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per 4 available cores)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch threads / pinned cores per worker (default: cores // workers)")
+    parser.add_argument("--sweep", type=int, nargs="+", default=None,
+                        help="Run the batch once per worker count and report throughput")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--inpaint-backend", choices=["auto", "sd", "pyramid"], default=None)
+    parser.add_argument("--standins", action="store_true", help="Use random stand-in models (offline dry run)")
+    args = parser.parse_args()
+
+    import depthflow_generator as g
+
+    if args.standins:
+        from bench_pipeline import install_standins
+        install_standins()
+    if args.inpaint_backend:
+        g.INPAINT_BACKEND = args.inpaint_backend
+
+    files = g.collect_inputs(args.input)
+    if not files:
+        print(f"❌ No input images found: {args.input}")
+        return
+    jobs = g.batch_jobs(files, args.output)
+    cores = available_cores()
+    print(f"🚀 {len(jobs)} images, {len(cores)} available cores")
+
+    if not args.sweep:
+        workers = args.workers or max(1, len(cores) // 4)
+        stats = run_sharded(jobs, args.prompt, workers, args.threads_per_worker, args.batch_size)
+        print_stats(stats)
+        if stats["errors"]:
+            print(f"❌ {len(stats['errors'])} worker(s) failed")
+            raise SystemExit(1)
+        print(f"✅ Success! {len(jobs)} asset sets saved to: {args.output}")
+        return
+
+    rows = []
+    for workers in args.sweep:
+        stats = run_sharded(jobs, args.prompt, workers, args.threads_per_worker, args.batch_size, quiet=True)
+        print_stats(stats)
+        rows.append(stats)
+
+    base = rows[0]["images_per_s"]
+    print(f"\n{'workers':>8} {'threads':>8} {'wall (s)':>9} {'img/s':>8} {'speedup':>8}")
+    for r in rows:
+        print(f"{r['workers']:>8} {r['threads']:>8} {r['wall_s']:>9.1f} {r['images_per_s']:>8.2f} "
+              f"{r['images_per_s'] / base if base else 0:>7.2f}x" + ("  ❌" if r["errors"] else ""))
+    best = max((r for r in rows if not r["errors"]), key=lambda r: r["images_per_s"], default=None)
+    if best:
+        print(f"\n🏁 Best throughput: --workers {best['workers']} --threads-per-worker {best['threads']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+按内容寻址的阶段结果缓存
+缓存键 = 输入像素哈希 + 模型身份 (本地路径 + 权重校验和) + 该阶段使用的参数，
+因此只改 --prompt 重跑时，前景深度与分割会直接命中缓存。
+缓存目录有容量上限，超出时按最近使用时间 (LRU) 淘汰到上限的 EVICT_TARGET，并统计命中 / 未命中次数。
+目录总大小只在第一次写入与需要淘汰时扫描，其余写入只累加条目大小。
+条目是无损 PNG (PIL 图像) 或 .npy (numpy 数组，例如 float32 深度)。
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+WEIGHT_SUFFIXES = {".safetensors", ".bin", ".pt", ".pth", ".ckpt", ".onnx"}
+# 超出上限时淘汰到上限的该比例，避免之后每次写入都重新扫描目录
+EVICT_TARGET = 0.9
+
+
+def image_digest(image_pil):
+    """图像像素内容的哈希 (包含模式与尺寸)；也接受 numpy 数组 (包含 dtype 与形状)"""
+    h = hashlib.sha256()
+    if isinstance(image_pil, np.ndarray):
+        h.update(f"{image_pil.dtype}:{'x'.join(map(str, image_pil.shape))}".encode())
+        h.update(np.ascontiguousarray(image_pil))
+        return h.hexdigest()
+    h.update(f"{image_pil.mode}:{image_pil.size[0]}x{image_pil.size[1]}".encode())
+    h.update(image_pil.tobytes())
+    return h.hexdigest()
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class StageCache:
+    """磁盘缓存，每个条目是一张无损 PNG 或一个 .npy 数组"""
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self.stats = {}  # stage -> {"hits": n, "misses": n}
+        self.evictions = 0
+        self._total = None  # 目录中条目的总字节数，第一次写入时扫描
+
+    # --- 缓存键 ---
+
+    def model_fingerprint(self, model_path):
+        """
+        模型身份 = 本地路径 + 权重文件 SHA256。
+        完整哈希只在权重文件 (大小, 修改时间) 变化时重算，结果记录在缓存目录的 fingerprints.json 中。
+        """
+        model_path = Path(model_path)
+        key = str(model_path.resolve())
+        if key in self._fingerprints:
+            return self._fingerprints[key]
+
+        index_file = self.cache_dir / "fingerprints.json"
+        try:
+            index = json.loads(index_file.read_text())
+        except (OSError, ValueError):
+            index = {}
+
+        weights = sorted(p for p in model_path.rglob("*") if p.is_file() and p.suffix in WEIGHT_SUFFIXES)
+        h = hashlib.sha256(key.encode())
+        changed = False
+        for p in weights:
+            st = p.stat()
+            stamp = f"{st.st_size}:{st.st_mtime_ns}"
+            entry = index.get(str(p))
+            if entry is None or entry["stamp"] != stamp:
+                entry = {"stamp": stamp, "sha256": _file_sha256(p)}
+                index[str(p)] = entry
+                changed = True
+            h.update(p.relative_to(model_path).as_posix().encode())
+            h.update(entry["sha256"].encode())
+
+        if changed:
+            _atomic_write_text(index_file, json.dumps(index, indent=2))
+
+        self._fingerprints[key] = h.hexdigest()
+        return self._fingerprints[key]
+
+    def make_key(self, stage, images, model_path=None, params=None):
+        """由阶段名、输入图像、模型与参数生成缓存键"""
+        h = hashlib.sha256(stage.encode())
+        for im in images:
+            h.update(image_digest(im).encode())
+        if model_path is not None:
+            h.update(self.model_fingerprint(model_path).encode())
+        h.update(json.dumps(params or {}, sort_keys=True).encode())
+        return h.hexdigest()
+
+    # --- 读写 ---
+
+    def _entry_path(self, key, suffix=".png"):
+        return self.cache_dir / key[:2] / f"{key}{suffix}"
+
+    def get(self, stage, key):
+        """命中则返回 PIL 图像 (或 numpy 数组) 并刷新其 LRU 时间，否则返回 None"""
+        counters = self.stats.setdefault(stage, {"hits": 0, "misses": 0})
+        path = self._entry_path(key, ".npy")
+        try:
+            if path.exists():
+                result = np.load(path)
+            else:
+                path = self._entry_path(key)
+                with Image.open(path) as im:
+                    im.load()
+                    result = im.copy()
+        except (OSError, ValueError):
+            counters["misses"] += 1
+            return None
+
+        counters["hits"] += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, image_pil):
+        is_array = isinstance(image_pil, np.ndarray)
+        path = self._entry_path(key, ".npy" if is_array else ".png")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        if is_array:
+            with open(tmp, "wb") as f:
+                np.save(f, image_pil)
+        else:
+            image_pil.save(tmp, format="PNG")
+        size = tmp.stat().st_size
+        with self._lock:
+            try:
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp, path)
+            if self._total is not None:
+                self._total += size - replaced
+        self._enforce_limit()
+
+    def _scan(self):
+        """[(修改时间, 字节数, 路径), ...] 与总字节数"""
+        entries = []
+        for p in [*self.cache_dir.glob("*/*.png"), *self.cache_dir.glob("*/*.npy")]:
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        return entries, sum(size for _, size, _ in entries)
+
+    def _enforce_limit(self):
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self._total is None:
+                _, self._total = self._scan()
+            if self._total <= self.max_bytes:
+                return
+
+            # 超出上限才重新扫描 (其他进程也可能写入同一目录)，按 LRU 淘汰到 EVICT_TARGET
+            entries, total = self._scan()
+            target = self.max_bytes * EVICT_TARGET
+            entries.sort()
+            for _, size, p in entries:
+                if total <= target:
+                    break
+                try:
+                    p.unlink()
+                    total -= size
+                    self.evictions += 1
+                except OSError:
+                    pass
+            self._total = total
+
+    # --- 报告 ---
+
+    def summary(self):
+        parts = [f"{stage}={c['hits']}/{c['hits'] + c['misses']}" for stage, c in self.stats.items()]
+        hits = sum(c["hits"] for c in self.stats.values())
+        total = sum(c["hits"] + c["misses"] for c in self.stats.values())
+        return (f"📊 Stage cache: hits={hits} misses={total - hits} evictions={self.evictions} "
+                f"({' '.join(parts) or 'no lookups'})")
+
+
+def _atomic_write_text(path, text):
+    tmp = Path(f"{path}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
@@ -0,0 +1,189 @@
+"""
+推理内部的三段流水线
+预处理 (解码、缩放、归一化、传到设备) → 推理 → 后处理 (插值、传回 CPU、转 PIL) 原本串行执行，
+这里把预处理放到生产线程、后处理放到消费线程，推理留在调用线程，阶段之间用有界队列连接:
+第 N+1 批在预处理时，第 N 批在推理，第 N-1 批在后处理。队列长度 (depth) 限制了同时驻留内存的批数。
+
+每次运行把各阶段的忙碌时间与等待时间累加到 STATS，summary() 输出利用率报告:
+  idle    等待上游 (队列空)，说明上游是瓶颈
+  blocked 等待下游 (队列满)，说明下游是瓶颈
+
+    results = run_pipeline("depth", units(), infer, post, depth=2)
+"""
+import queue
+import threading
+import time
+
+_DONE = object()
+
+# name -> {stage: {"busy": 秒, "idle": 秒, "blocked": 秒}, "wall": 秒, "units": 个数}
+STATS = {}
+_stats_lock = threading.Lock()
+
+
+class _Failed:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop, timing):
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            continue
+    timing["blocked"] += time.perf_counter() - start
+
+
+def _get(q, timing, stop=None):
+    """stop 被设置时放弃等待并返回 _DONE"""
+    start = time.perf_counter()
+    while True:
+        try:
+            item = q.get(timeout=0.1)
+            break
+        except queue.Empty:
+            if stop is not None and stop.is_set():
+                item = _DONE
+                break
+    timing["idle"] += time.perf_counter() - start
+    return item
+
+
+def _new_timing():
+    return {"busy": 0.0, "idle": 0.0, "blocked": 0.0}
+
+
+def run_pipeline(name, source, infer, post, depth=2):
+    """
+    source: 可迭代对象，每次产出一个预处理完成的单元 (在生产线程中惰性求值，预处理即发生在迭代中)
+    infer(unit) -> out: 在调用线程执行 (模型前向)，out 中带上后处理需要的信息，unit 随即可以释放
+    post(out) -> result: 在消费线程执行
+    返回按 source 顺序排列的 post 结果列表；任一阶段抛出的异常会在调用线程重新抛出。
+    depth <= 0 时全部在调用线程中串行执行。
+    """
+    timings = {"preprocess": _new_timing(), "inference": _new_timing(), "postprocess": _new_timing()}
+    wall_start = time.perf_counter()
+
+    if depth <= 0:
+        results = []
+        it = iter(source)
+        while True:
+            start = time.perf_counter()
+            unit = next(it, _DONE)
+            timings["preprocess"]["busy"] += time.perf_counter() - start
+            if unit is _DONE:
+                break
+            start = time.perf_counter()
+            out = infer(unit)
+            timings["inference"]["busy"] += time.perf_counter() - start
+            start = time.perf_counter()
+            results.append(post(out))
+            timings["postprocess"]["busy"] += time.perf_counter() - start
+        _record(name, timings, time.perf_counter() - wall_start, len(results))
+        return results
+
+    pre_q = queue.Queue(maxsize=depth)
+    post_q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    results = []
+    errors = []
+
+    def produce():
+        timing = timings["preprocess"]
+        it = iter(source)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                unit = next(it, _DONE)
+                timing["busy"] += time.perf_counter() - start
+                if unit is _DONE:
+                    break
+                _put(pre_q, unit, stop, timing)
+        except BaseException as e:
+            _put(pre_q, _Failed(e), stop, timing)
+            return
+        _put(pre_q, _DONE, stop, timing)
+
+    def consume():
+        timing = timings["postprocess"]
+        while True:
+            item = _get(post_q, timing)
+            if item is _DONE:
+                return
+            if errors:
+                continue  # 已失败，只排空队列让推理线程不被阻塞
+            start = time.perf_counter()
+            try:
+                results.append(post(item))
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            timing["busy"] += time.perf_counter() - start
+
+    producer = threading.Thread(target=produce, name=f"{name}-preprocess", daemon=True)
+    consumer = threading.Thread(target=consume, name=f"{name}-postprocess", daemon=True)
+    producer.start()
+    consumer.start()
+
+    timing = timings["inference"]
+    try:
+        while not stop.is_set():
+            unit = _get(pre_q, timing, stop)
+            if unit is _DONE:
+                break
+            if isinstance(unit, _Failed):
+                errors.append(unit.exc)
+                break
+            start = time.perf_counter()
+            out = infer(unit)
+            timing["busy"] += time.perf_counter() - start
+            del unit
+            _put(post_q, out, stop, timing)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        if errors:
+            stop.set()
+        post_q.put(_DONE)  # 消费线程会一直取到 _DONE，这里不会永久阻塞
+        consumer.join()
+        stop.set()  # 释放可能阻塞在 pre_q 上的生产线程
+        producer.join()
+
+    if errors:
+        raise errors[0]
+    _record(name, timings, time.perf_counter() - wall_start, len(results))
+    return results
+
+
+def _record(name, timings, wall, units):
+    with _stats_lock:
+        entry = STATS.setdefault(name, {"wall": 0.0, "units": 0, "stages": {}})
+        entry["wall"] += wall
+        entry["units"] += units
+        for stage, t in timings.items():
+            acc = entry["stages"].setdefault(stage, _new_timing())
+            for key, value in t.items():
+                acc[key] += value
+
+
+def reset():
+    with _stats_lock:
+        STATS.clear()
+
+
+def summary():
+    with _stats_lock:
+        if not STATS:
+            return "⏱️ Pipeline: no runs recorded"
+        lines = ["⏱️ Pipeline utilisation",
+                 f"{'pipeline':<10} {'stage':<12} {'busy (s)':>9} {'idle (s)':>9} {'blocked (s)':>12} {'util':>6}"]
+        for name, entry in STATS.items():
+            for stage, t in entry["stages"].items():
+                util = t["busy"] / entry["wall"] if entry["wall"] else 0.0
+                lines.append(f"{name:<10} {stage:<12} {t['busy']:>9.2f} {t['idle']:>9.2f} "
+                             f"{t['blocked']:>12.2f} {util:>6.0%}")
+            lines.append(f"{name:<10} {'wall':<12} {entry['wall']:>9.2f}   ({entry['units']} batches)")
+        return "\n".join(lines)
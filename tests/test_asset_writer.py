@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from asset_writer import AssetWriter
+
+
+def _slow_save(delays, written):
+    """按文件名延迟的假写入函数，记录落盘顺序"""
+    lock = threading.Lock()
+
+    def save(image, path):
+        time.sleep(delays.get(path.name, 0.0))
+        with lock:
+            written.append(path.name)
+    return save
+
+
+def test_callbacks_run_in_submit_order_within_a_group(tmp_path):
+    written, order = [], []
+    save = _slow_save({"a.png": 0.2}, written)
+    with AssetWriter(save, workers=3) as writer:
+        writer.submit(None, tmp_path / "a.png", then=lambda: order.append("a"))
+        writer.submit(None, tmp_path / "b.png", then=lambda: order.append("b"))
+        writer.submit(None, tmp_path / "c.png", then=lambda: order.append("c"))
+    assert written[0] != "a.png"            # 写入本身确实是并行、乱序完成的
+    assert order == ["a", "b", "c"]
+
+
+def test_write_without_callback_keeps_the_chain(tmp_path):
+    written, order = [], []
+    save = _slow_save({"b.png": 0.2}, written)
+    with AssetWriter(save, workers=3) as writer:
+        writer.submit(None, tmp_path / "a.png", then=lambda: order.append(("a", list(written))))
+        writer.submit(None, tmp_path / "b.png")
+        writer.submit(None, tmp_path / "c.png", then=lambda: order.append(("c", list(written))))
+    assert [name for name, _ in order] == ["a", "c"]
+    assert "b.png" in order[1][1]           # c 的回调必须等中间无回调的 b 落盘
+
+
+def test_callback_after_uncallbacked_write_waits_for_earlier_callbacks(tmp_path):
+    written, order = [], []
+    save = _slow_save({"a.png": 0.2}, written)
+    with AssetWriter(save, workers=3) as writer:
+        writer.submit(None, tmp_path / "a.png", then=lambda: order.append("a"))
+        writer.submit(None, tmp_path / "b.png")
+        writer.submit(None, tmp_path / "c.png", then=lambda: order.append("c"))
+    assert order == ["a", "c"]
+
+
+def test_group_orders_subdirectory_files_with_output_dir(tmp_path):
+    written, order = [], []
+    save = _slow_save({"tile.png": 0.2}, written)
+    with AssetWriter(save, workers=2) as writer:
+        writer.submit(None, tmp_path / "lod" / "tile.png", group=tmp_path)
+        writer.submit(None, tmp_path / "depth.png", then=lambda: order.append(list(written)))
+    assert "tile.png" in order[0]
+
+
+def test_separate_groups_do_not_wait_for_each_other(tmp_path):
+    gate = threading.Event()
+    done = []
+
+    def save(image, path):
+        if path.parent.name == "slow":
+            gate.wait(5)
+
+    with AssetWriter(save, workers=2) as writer:
+        writer.submit(None, tmp_path / "slow" / "a.png")
+        fast = writer.submit(None, tmp_path / "fast" / "b.png", then=lambda: done.append("b"))
+        fast.result(timeout=5)
+        assert done == ["b"]
+        gate.set()
+
+
+def test_ready_waits_for_pending_write(tmp_path):
+    written = []
+    save = _slow_save({"a.png": 0.1}, written)
+    with AssetWriter(save, workers=1) as writer:
+        writer.submit(None, tmp_path / "a.png")
+        assert writer.ready(tmp_path / "a.png") == tmp_path / "a.png"
+        assert written == ["a.png"]
+
+
+def test_wait_raises_first_error(tmp_path):
+    def save(image, path):
+        if path.name == "bad.png":
+            raise OSError("disk full")
+
+    writer = AssetWriter(save, workers=2)
+    writer.submit(None, tmp_path / "ok.png")
+    writer.submit(None, tmp_path / "bad.png")
+    with pytest.raises(OSError, match="disk full"):
+        writer.close()
+
+
+def test_synchronous_mode_runs_inline(tmp_path):
+    order = []
+    writer = AssetWriter(lambda image, path: order.append(path.name), workers=0)
+    assert writer.submit(None, tmp_path / "a.png", then=lambda: order.append("then")) is None
+    assert order == ["a.png", "then"]
+    writer.close()
@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import depthflow_generator as g
+
+
+@pytest.fixture
+def job(tmp_path):
+    input_file = tmp_path / "photo.jpg"
+    Image.new("RGB", (8, 6), (100, 50, 20)).save(input_file)
+    output_path = tmp_path / "out"
+    output_path.mkdir()
+    return input_file, output_path
+
+
+def _touch(output_path, stage):
+    for name in g.STAGE_FILES[stage]:
+        (output_path / name).write_bytes(b"x")
+
+
+def test_stage_done_requires_params_outputs_and_same_input(job):
+    input_file, output_path = job
+    _touch(output_path, "depth")
+    assert not g.stage_done(output_path, input_file, "depth", {"upsample": "guided"})
+
+    g.mark_stage_done(output_path, input_file, "depth", {"upsample": "guided"})
+    assert g.stage_done(output_path, input_file, "depth", {"upsample": "guided"})
+    assert not g.stage_done(output_path, input_file, "depth", {"upsample": "bilinear"})
+
+    (output_path / "depth.png").unlink()
+    assert not g.stage_done(output_path, input_file, "depth", {"upsample": "guided"})
+    _touch(output_path, "depth")
+
+    # 输入文件被替换后签名变化，所有阶段失效
+    Image.new("RGB", (9, 6)).save(input_file)
+    assert not g.stage_done(output_path, input_file, "depth", {"upsample": "guided"})
+
+
+def test_rerunning_a_stage_invalidates_later_stages_and_extras(job):
+    input_file, output_path = job
+    for stage in g.STAGE_ORDER + g.EXTRA_STAGES:
+        _touch(output_path, stage)
+        g.mark_stage_done(output_path, input_file, stage, {})
+    assert all(g.stage_done(output_path, input_file, s, {}) for s in g.STAGE_ORDER + g.EXTRA_STAGES)
+
+    g.mark_stage_done(output_path, input_file, "mask", {"subject_mask": "empty"})
+    stages = json.loads((output_path / g.CHECKPOINT_FILE).read_text())["stages"]
+    assert list(stages) == ["depth", "mask"]
+
+    # 导出之间互不影响
+    for stage in ["background", "depth_bg", "cone_maps", "bundle"]:
+        g.mark_stage_done(output_path, input_file, stage, {})
+    g.mark_stage_done(output_path, input_file, "cone_maps", {"max_radius": 32})
+    assert g.stage_done(output_path, input_file, "bundle", {})
+
+
+def test_resume_skips_finished_extras(job, monkeypatch):
+    input_file, output_path = job
+    calls = []
+
+    def fake_export(asset_dir, mips=True):
+        calls.append(mips)
+        path = asset_dir / "scene.dftb"
+        path.write_bytes(np.zeros(4, np.uint8).tobytes())
+        return path
+
+    monkeypatch.setattr(g, "export_bundle", fake_export)
+    monkeypatch.setattr(g, "EXPORT_BUNDLE", True)
+    monkeypatch.setattr(g, "EXPORT_CONE_MAPS", False)
+    monkeypatch.setattr(g, "LOD_TIERS", ())
+
+    g._export_extras([(input_file, output_path)], resume=True)
+    g._export_extras([(input_file, output_path)], resume=True)
+    assert calls == [True]
+
+    # 参数变化或产物缺失时重新导出；不续跑时总是导出
+    monkeypatch.setattr(g, "BUNDLE_MIPS", False)
+    g._export_extras([(input_file, output_path)], resume=True)
+    (output_path / "scene.dftb").unlink()
+    g._export_extras([(input_file, output_path)], resume=True)
+    g._export_extras([(input_file, output_path)], resume=False)
+    assert calls == [True, False, False, False]
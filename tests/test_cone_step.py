@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from cone_step import build_cone_map, cone_ratios, decode_cone_map, encode_cone_map, export_cone_maps
+from intermediate_store import quantize_depth, save_array, store_path
+
+
+def _depth(w=48, h=40, seed=0):
+    """平滑起伏加上单像素宽的细柱与细墙"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    d = 0.3 + 0.2 * np.sin(xx / 7.0) * np.cos(yy / 5.0)
+    for _ in range(6):
+        d[rng.integers(0, h), rng.integers(0, w)] = rng.uniform(0.7, 1.0)
+    d[:, w // 3] = 0.9
+    return np.clip(d + rng.normal(0, 0.004, d.shape), 0, 1).astype(np.float32)
+
+
+def _violations(cone, surface, max_radius):
+    """
+    以每个纹素为顶点的圆锥内不能有表面: 切比雪夫距离 t (1 <= t <= max_radius) 处的深度
+    不超过 d + t / c，更远处 (深度最多为 1) 要求 1 <= d + max_radius / c
+    """
+    h, w = surface.shape
+    worst = 0.0
+    for dy in range(-max_radius, max_radius + 1):
+        for dx in range(-max_radius, max_radius + 1):
+            t = max(abs(dx), abs(dy))
+            if t == 0:
+                continue
+            ys, xs = slice(max(-dy, 0), h - max(dy, 0)), slice(max(-dx, 0), w - max(dx, 0))
+            qs, qx = slice(max(dy, 0), h - max(-dy, 0)), slice(max(dx, 0), w - max(-dx, 0))
+            reach = surface[ys, xs] + t / cone[ys, xs]
+            worst = max(worst, float((surface[qs, qx] - reach).max()))
+    worst = max(worst, float((1.0 - (surface + max_radius / cone)).max()))
+    return worst
+
+
+@pytest.mark.parametrize("source", ["float32", "uint8"])
+def test_decoded_cones_never_overshoot_float_or_8bit_surface(source):
+    depth = _depth()
+    depth_u8 = quantize_depth(depth)
+    max_radius = 8
+    src = depth if source == "float32" else depth_u8
+    cone = decode_cone_map(encode_cone_map(build_cone_map(src, max_radius, tile=16), 2 * max_radius),
+                           2 * max_radius)
+
+    assert _violations(cone, depth_u8.astype(np.float32) / 255.0, max_radius) <= 1e-6
+    if source == "float32":
+        assert _violations(cone, depth, max_radius) <= 1e-6
+
+
+def test_tiled_build_matches_single_block():
+    depth = _depth(seed=1)
+    assert np.array_equal(build_cone_map(depth, 6, tile=13), cone_ratios(depth, 6))
+
+
+def test_flat_regions_get_large_steps():
+    cone = cone_ratios(np.full((20, 20), 0.5, np.float32), 8)
+    assert cone.min() > 8  # 只受 max_radius / (1 - d) 与量化余量限制
+
+
+def test_export_prefers_float_intermediate(tmp_path):
+    depth = _depth()
+    Image.fromarray(quantize_depth(depth)).save(tmp_path / "depth.png")
+    meta = export_cone_maps(tmp_path, max_radius=4, workers=1)
+    assert meta["sources"] == {"depth": "png"}
+
+    save_array(depth, store_path(tmp_path, "depth"))
+    meta = export_cone_maps(tmp_path, max_radius=4, workers=1)
+    assert meta["sources"] == {"depth": "float32"}
+    assert (tmp_path / "depth_cone.png").exists()
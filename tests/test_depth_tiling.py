@@ -0,0 +1,42 @@
+import numpy as np
+
+from depth_tiling import TileAccumulator, plan_tiles
+
+
+def _smooth_depth(w, h):
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    return 0.5 + 0.3 * np.sin(xx / w * 3.0) * np.cos(yy / h * 2.0) + 0.1 * xx / w
+
+
+def test_tiles_cover_image_with_overlap():
+    tiles = plan_tiles(1000, 700, 256, 64)
+    covered = np.zeros((700, 1000), dtype=np.int32)
+    for x0, y0, x1, y1 in tiles:
+        assert x1 - x0 <= 256 and y1 - y0 <= 256
+        covered[y0:y1, x0:x1] += 1
+    assert covered.min() >= 1
+    xs = sorted({t[0] for t in tiles})
+    assert all(b - a <= 256 - 64 for a, b in zip(xs, xs[1:]))
+
+
+def test_tiled_matches_untiled_on_smooth_input():
+    w, h, tile, overlap = 640, 480, 192, 48
+    depth = _smooth_depth(w, h)
+    rng = np.random.default_rng(0)
+
+    acc = TileAccumulator(w, h, overlap)
+    for box in plan_tiles(w, h, tile, overlap):
+        x0, y0, x1, y1 = box
+        # 每块的预测与整图只差一个未知的仿射变换 (相对深度)
+        a, b = rng.uniform(0.5, 2.0), rng.uniform(-1.0, 1.0)
+        acc.add(box, a * depth[y0:y1, x0:x1] + b, depth[y0:y1, x0:x1])
+
+    assert np.abs(acc.result() - depth).max() < 1e-4
+
+
+def test_single_tile_is_identity():
+    depth = _smooth_depth(100, 80)
+    acc = TileAccumulator(100, 80, 16)
+    [box] = plan_tiles(100, 80, 128, 16)
+    acc.add(box, depth, depth)
+    assert np.allclose(acc.result(), depth, atol=1e-5)
@@ -0,0 +1,75 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from guided_upsample import box_filter, guided_upsample
+
+
+def _naive_box(img, r):
+    h, w = img.shape
+    out = np.empty((h, w), dtype=np.float64)
+    for y in range(h):
+        for x in range(w):
+            out[y, x] = img[max(y - r, 0):y + r + 1, max(x - r, 0):x + r + 1].mean()
+    return out
+
+
+def _reference(depth_lr, guide_pil, radius=2, eps=1e-3):
+    """整图一次性计算的快速导向滤波: 系数用 torch 双线性 (align_corners=False) 放大"""
+    lh, lw = depth_lr.shape
+    W, H = guide_pil.size
+    p = (depth_lr - depth_lr.min()) / (depth_lr.max() - depth_lr.min())
+    I = np.asarray(guide_pil.resize((lw, lh), Image.Resampling.BILINEAR).convert("L"), np.float64) / 255.0
+
+    mean_I, mean_p = _naive_box(I, radius), _naive_box(p, radius)
+    a = (_naive_box(I * p, radius) - mean_I * mean_p) / (_naive_box(I * I, radius) - mean_I * mean_I + eps)
+    b = mean_p - a * mean_I
+    coef = torch.from_numpy(np.stack([_naive_box(a, radius), _naive_box(b, radius)]))[None]
+    up = F.interpolate(coef, size=(H, W), mode="bilinear", align_corners=False)[0].numpy()
+
+    q = up[0] * np.asarray(guide_pil.convert("L"), np.float64) / 255.0 + up[1]
+    return (q - q.min()) / (q.max() - q.min())
+
+
+def _scene(w=97, h=61):
+    """左暗右亮的引导图，低分辨率深度在同一位置有一个模糊的跳变"""
+    rng = np.random.default_rng(0)
+    guide = np.full((h, w, 3), 40, dtype=np.uint8)
+    guide[:, w // 2:] = 210
+    guide = np.clip(guide + rng.integers(-10, 10, guide.shape), 0, 255).astype(np.uint8)
+    lw, lh = 24, 15
+    xs = np.linspace(-1, 1, lw)
+    depth_lr = np.tile(1.0 / (1.0 + np.exp(-xs * 4.0)), (lh, 1)).astype(np.float32) * 3.0 + 5.0
+    return depth_lr, Image.fromarray(guide)
+
+
+def test_box_filter_matches_naive():
+    img = np.random.default_rng(1).random((13, 17)).astype(np.float32)
+    for r in (0, 1, 3, 20):
+        assert np.allclose(box_filter(img, r), _naive_box(img, r), atol=1e-5)
+
+
+def test_matches_full_frame_reference_across_strips():
+    depth_lr, guide = _scene()
+    ref = _reference(depth_lr.astype(np.float64), guide)
+    for strip_rows in (7, 256):
+        out = guided_upsample(depth_lr, guide, strip_rows=strip_rows, dtype=np.float32)
+        assert out.dtype == np.float32 and out.shape == ref.shape
+        assert np.abs(out - ref).max() < 2e-4
+
+    out8 = guided_upsample(depth_lr, guide, dtype=np.uint8)
+    assert out8.dtype == np.uint8
+    assert np.abs(out8.astype(np.int16) - (ref * 255).astype(np.int16)).max() <= 1
+
+
+def test_output_spans_full_range_and_follows_guide_edge():
+    depth_lr, guide = _scene()
+    out = guided_upsample(depth_lr, guide, dtype=np.float32)
+    assert out.min() == 0.0 and out.max() == 1.0
+
+    bilinear = np.asarray(Image.fromarray(depth_lr).resize(guide.size, Image.Resampling.BILINEAR))
+    bilinear = (bilinear - bilinear.min()) / (bilinear.max() - bilinear.min())
+    mid = guide.size[0] // 2
+    # 引导图边缘两侧各 3 像素内的深度差大于直接双线性放大
+    assert (out[:, mid + 2] - out[:, mid - 3]).mean() > (bilinear[:, mid + 2] - bilinear[:, mid - 3]).mean()
@@ -0,0 +1,92 @@
+import numpy as np
+from PIL import Image
+
+from inpainting import crop_process_size, paste_feathered, plan_roi_crops, pyramid_fill
+
+
+def _covered(boxes, shape):
+    covered = np.zeros(shape, dtype=bool)
+    for x0, y0, x1, y1 in boxes:
+        covered[y0:y1, x0:x1] = True
+    return covered
+
+
+def test_roi_crops_cover_mask_and_align():
+    mask = np.zeros((300, 500), dtype=np.uint8)
+    mask[40:60, 30:90] = 255
+    mask[200:260, 380:470] = 255
+    boxes = plan_roi_crops(mask, context=16, multiple=64)
+
+    assert len(boxes) == 2
+    for x0, y0, x1, y1 in boxes:
+        assert 0 <= x0 < x1 <= 500 and 0 <= y0 < y1 <= 300
+        assert (x1 - x0) % 64 == 0 and (y1 - y0) % 64 == 0
+    assert _covered(boxes, mask.shape)[mask > 0].all()
+
+
+def test_mask_touching_unaligned_border_stays_inside_crop():
+    # 宽 500、高 301 都不是 8 的倍数，遮罩贴着右边与下边
+    mask = np.zeros((301, 500), dtype=np.uint8)
+    mask[40:301, 300:500] = 255
+    mask[0:10, 0:500] = 255
+    boxes = plan_roi_crops(mask)
+
+    assert _covered(boxes, mask.shape)[mask > 0].all()
+    for box in boxes:
+        w, h = crop_process_size(box)
+        assert w % 8 == 0 and h % 8 == 0
+
+
+def test_overlapping_regions_merge():
+    mask = np.zeros((256, 256), dtype=np.uint8)
+    mask[100:110, 50:60] = 255
+    mask[100:110, 120:130] = 255
+    assert len(plan_roi_crops(mask, context=64)) == 1
+
+
+def test_crop_process_size_keeps_small_crops_and_caps_long_side():
+    assert crop_process_size((0, 0, 256, 128)) == (256, 128)
+    assert crop_process_size((0, 0, 500, 301)) == (496, 296)
+    w, h = crop_process_size((0, 0, 2048, 1024))
+    assert (w, h) == (1024, 512)
+
+
+def test_paste_feathered_keeps_border_edges_opaque():
+    base = Image.new("RGB", (64, 64), (0, 0, 0))
+    patch = Image.new("RGB", (32, 32), (255, 255, 255))
+    out = np.asarray(paste_feathered(base, patch, (32, 32, 64, 64), feather=8))
+    # 贴着图像边界的边不羽化，内部边从 0 渐变
+    assert (out[63, 63] == 255).all()
+    assert out[63, 32, 0] < out[63, 40, 0] == 255
+    assert (out[:32] == 0).all()
+
+
+def test_pyramid_fill_keeps_known_pixels_and_fills_holes():
+    rng = np.random.default_rng(0)
+    arr = np.zeros((67, 93, 3), dtype=np.uint8)
+    arr[:, :46] = (200, 30, 30)
+    arr[:, 46:] = (30, 30, 200)
+    arr[::7, ::5] = rng.integers(0, 256, arr[::7, ::5].shape, dtype=np.uint8)
+    hole = np.zeros((67, 93), dtype=np.uint8)
+    hole[20:40, 10:30] = 255
+
+    out = np.asarray(pyramid_fill(Image.fromarray(arr), Image.fromarray(hole)))
+    known = hole <= 128
+    assert np.array_equal(out[known], arr[known])
+    # 空洞在左侧红色区域内部，填充颜色应接近红色
+    filled = out[25:35, 15:25].reshape(-1, 3).astype(np.int32).mean(axis=0)
+    assert filled[0] > 120 and filled[2] < 110
+
+
+def test_pyramid_fill_hole_touching_border():
+    arr = np.full((30, 41, 3), 90, dtype=np.uint8)
+    hole = np.zeros((30, 41), dtype=np.uint8)
+    hole[:, 35:] = 255
+    out = np.asarray(pyramid_fill(Image.fromarray(arr), Image.fromarray(hole)))
+    assert np.abs(out.astype(np.int16) - 90).max() <= 1
+
+
+def test_pyramid_fill_without_hole_is_identity():
+    img = Image.fromarray(np.random.default_rng(1).integers(0, 256, (16, 16, 3), dtype=np.uint8))
+    out = pyramid_fill(img, Image.new("L", img.size, 0))
+    assert np.array_equal(np.asarray(out), np.asarray(img))
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from job_service import JobCancelled, JobService
+
+
+class StubPipeline:
+    """替代 run_pipeline: 报告一次进度后阻塞，直到测试放行；取消请求通过 job.report 生效"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, job):
+        job.report("depth", 1, 2)
+        self.started.set()
+        while not self.release.wait(0.01):
+            job.report("depth", 1, 2)
+        if job.input == "broken":
+            raise RuntimeError("boom")
+
+
+async def _until(predicate, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def _run(scenario, **kwargs):
+    """在事件循环中启动 worker，运行 scenario(service, stub)"""
+    async def main():
+        stub = StubPipeline()
+        service = JobService(run_job=stub, **kwargs)
+        worker = asyncio.create_task(service.worker())
+        try:
+            await scenario(service, stub)
+        finally:
+            stub.release.set()
+            worker.cancel()
+            service.executor.shutdown(wait=True)
+    asyncio.run(main())
+
+
+def _post(service, **spec):
+    return service.route("POST", "/jobs", json.dumps(spec).encode())
+
+
+def test_submit_runs_job_and_reports_progress():
+    async def scenario(service, stub):
+        status, job = _post(service, input="a.png", output="out")
+        assert status == 202 and job["status"] == "queued"
+
+        await _until(stub.started.is_set)
+        status, running = service.route("GET", f"/jobs/{job['id']}", b"")
+        assert status == 200
+        assert running["status"] == "running" and running["stage"] == "depth"
+        assert running["progress"] == pytest.approx(0.5 / 4, abs=1e-3)
+
+        stub.release.set()
+        await _until(lambda: service.jobs[job["id"]].status == "done")
+        assert service.route("GET", f"/jobs/{job['id']}", b"")[1]["progress"] == 1.0
+    _run(scenario)
+
+
+def test_failed_job_records_error():
+    async def scenario(service, stub):
+        _, job = _post(service, input="broken", output="out")
+        stub.release.set()
+        await _until(lambda: service.jobs[job["id"]].status == "failed")
+        assert service.jobs[job["id"]].error == "RuntimeError: boom"
+    _run(scenario)
+
+
+def test_full_queue_returns_503_with_retry_after():
+    async def scenario(service, stub):
+        _post(service, input="running.png", output="out")
+        await _until(stub.started.is_set)          # 第一个任务已出队，不占名额
+        assert _post(service, input="a.png", output="out")[0] == 202
+        assert _post(service, input="b.png", output="out")[0] == 202
+
+        result = _post(service, input="c.png", output="out")
+        assert result[0] == 503
+        assert result[2]["Retry-After"]
+
+        # 取消排队中的任务后释放名额
+        queued = [j for j in service.jobs.values() if j.status == "queued"]
+        assert service.route("DELETE", f"/jobs/{queued[0].id}", b"")[0] == 200
+        assert _post(service, input="c.png", output="out")[0] == 202
+    _run(scenario, queue_size=2)
+
+
+def test_cancel_running_job_stops_at_next_report():
+    async def scenario(service, stub):
+        _, job = _post(service, input="a.png", output="out")
+        await _until(stub.started.is_set)
+        status, body = service.route("DELETE", f"/jobs/{job['id']}", b"")
+        assert status == 200
+        await _until(lambda: service.jobs[job["id"]].status == "cancelled")
+        # 已取消的任务不能再次取消
+        assert service.route("DELETE", f"/jobs/{job['id']}", b"")[0] == 409
+    _run(scenario)
+
+
+def test_bad_requests():
+    async def scenario(service, stub):
+        assert _post(service, input="a.png")[0] == 400
+        assert service.route("GET", "/jobs/job-missing", b"")[0] == 404
+        assert service.route("PUT", "/jobs", b"")[0] == 405
+    _run(scenario)
+
+
+def test_report_raises_once_cancelled():
+    service = JobService(run_job=lambda job: None)
+    job = service.submit({"input": "a.png", "output": "out"})
+    job.cancel_event.set()
+    with pytest.raises(JobCancelled):
+        job.report("mask", 0, 1)
+    service.executor.shutdown()
+
+
+def test_prune_caps_finished_jobs_and_expires_old_ones():
+    service = JobService(queue_size=100, run_job=lambda job: None, keep_finished=2, finished_ttl=60.0)
+    jobs = [service.submit({"input": f"{i}.png", "output": "out"}) for i in range(5)]
+    for i, job in enumerate(jobs[:4]):
+        job.status, job.finished = "done", 1000.0 + i
+    service.prune(now=1010.0)
+    # 只保留最近结束的 2 个；排队中的任务不受影响
+    assert set(service.jobs) == {jobs[2].id, jobs[3].id, jobs[4].id}
+
+    service.prune(now=1062.5)
+    assert set(service.jobs) == {jobs[3].id, jobs[4].id}
+    service.executor.shutdown()
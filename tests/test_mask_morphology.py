@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from mask_morphology import dilate, erode
+
+
+def _naive(arr, rx, ry, op):
+    """逐像素在裁剪到图像内的 (2ry+1)x(2rx+1) 窗口上取极值"""
+    h, w = arr.shape
+    out = np.empty_like(arr)
+    for y in range(h):
+        for x in range(w):
+            out[y, x] = op(arr[max(y - ry, 0):y + ry + 1, max(x - rx, 0):x + rx + 1])
+    return out
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+@pytest.mark.parametrize("rx, ry", [(0, 0), (1, 1), (3, 3), (2, 5), (7, 1), (40, 40)])
+def test_matches_naive_reference(dtype, rx, ry):
+    rng = np.random.default_rng(rx * 100 + ry)
+    arr = rng.integers(0, 256, (31, 45)).astype(dtype)
+    assert np.array_equal(dilate(arr, rx, ry), _naive(arr, rx, ry, np.max))
+    assert np.array_equal(erode(arr, rx, ry), _naive(arr, rx, ry, np.min))
+
+
+def test_square_default_and_dtype():
+    arr = (np.random.default_rng(1).random((20, 20)) > 0.9).astype(np.uint8) * 255
+    out = dilate(arr, 2)
+    assert out.dtype == np.uint8
+    assert np.array_equal(out, _naive(arr, 2, 2, np.max))
@@ -0,0 +1,80 @@
+import torch
+
+from model_registry import ModelRegistry, _parse_budget_gb, estimate_model_bytes
+
+
+def _model(n):
+    """n 个 float32 参数 (4n 字节) 的模块"""
+    return torch.nn.Linear(n, 1, bias=False)
+
+
+def _loader(n, calls):
+    def load():
+        calls.append(n)
+        return _model(n)
+    return load
+
+
+def test_hit_returns_same_object_without_reloading():
+    reg = ModelRegistry()
+    calls = []
+    a = reg.get("a", _loader(10, calls))
+    assert reg.get("a", _loader(10, calls)) is a
+    assert calls == [10]
+    assert reg.stats["loads"] == 1 and reg.stats["hits"] == 1
+    assert reg.used_bytes == estimate_model_bytes(a) == 40
+
+
+def test_budget_evicts_least_recently_used():
+    reg = ModelRegistry(budget_bytes=100)
+    calls = []
+    reg.get("a", _loader(10, calls))
+    reg.get("b", _loader(10, calls))
+    reg.get("a", _loader(10, calls))   # a 变为最近使用
+    reg.get("c", _loader(10, calls))   # 120 > 100，淘汰 LRU 的 b
+    assert reg.keys() == ["a", "c"]
+    assert reg.stats["evictions"] == 1
+    assert reg.used_bytes <= 100
+
+
+def test_known_size_frees_space_before_reload():
+    reg = ModelRegistry(budget_bytes=100)
+    calls = []
+    reg.get("big", _loader(20, calls))
+    reg.get("small", _loader(5, calls))   # 80 + 20 = 100，仍在预算内
+    reg.evict("big")
+    reg.get("other", _loader(15, calls))
+    resident = []
+
+    def load_big():
+        # 重新加载前已按上次测得的大小腾出空间
+        resident.append(reg.used_bytes)
+        return _model(20)
+
+    reg.get("big", load_big)
+    assert resident[0] + 80 <= 100
+    assert "big" in reg and reg.used_bytes <= 100
+
+
+def test_oversized_model_stays_resident_alone():
+    reg = ModelRegistry(budget_bytes=50)
+    reg.get("a", _loader(5, []))
+    reg.get("huge", _loader(100, []))
+    assert reg.keys() == ["huge"]
+
+
+def test_set_budget_and_clear():
+    reg = ModelRegistry()
+    for key in "abc":
+        reg.get(key, _loader(10, []))
+    reg.set_budget(80)
+    assert reg.keys() == ["b", "c"]
+    reg.clear()
+    assert reg.keys() == [] and reg.used_bytes == 0
+
+
+def test_parse_budget_gb():
+    assert _parse_budget_gb(None) is None
+    assert _parse_budget_gb("") is None
+    assert _parse_budget_gb("0") is None
+    assert _parse_budget_gb("1.5") == int(1.5 * 1024 ** 3)
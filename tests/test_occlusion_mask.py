@@ -0,0 +1,36 @@
+import math
+
+import numpy as np
+
+from occlusion_mask import max_offset, max_ray_shift, occlusion_mask
+
+CONFIG = {"height": 0.2, "zoom": 1.0, "focus": 0.0}
+
+
+def test_max_offset_uses_app_constant():
+    assert math.isclose(max_offset(), 1.3)
+    assert math.isclose(max_ray_shift(CONFIG), 1.3 * 0.2 * 0.5)
+
+
+def test_step_marks_only_near_side():
+    w, h, edge, near, far = 400, 64, 200, 0.8, 0.2
+    depth = np.full((h, w), far, dtype=np.float32)
+    depth[:, edge:] = near
+    margin, edge_radius = 2, 3
+    mask = occlusion_mask(depth, CONFIG, edge_radius=edge_radius, margin=margin) > 0
+
+    reach = math.ceil((near - far) * max_ray_shift(CONFIG) * w)
+    # 远侧只有边缘过渡的余量像素
+    assert not mask[:, :edge - margin].any()
+    # 近侧紧贴边缘的一条被修补，宽度由深度跳变与最大相机偏移决定 (边缘带宽 edge_radius 加余量)
+    assert mask[:, edge:edge + reach].all()
+    assert not mask[:, edge + edge_radius + reach + margin:].any()
+
+
+def test_flat_depth_and_zero_height_need_no_inpainting():
+    flat = np.full((32, 48), 0.5, dtype=np.float32)
+    assert not occlusion_mask(flat, CONFIG).any()
+
+    step = flat.copy()
+    step[:, 24:] = 0.9
+    assert occlusion_mask(step, dict(CONFIG, height=0.0)).max() == 0
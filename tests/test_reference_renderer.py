@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from reference_renderer import apply_color, params_from_config, render_frame, render_frames, sample
+
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(0)
+    h, w = 24, 32
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    depth = 0.3 + 0.4 * ((xx - 16) ** 2 + (yy - 12) ** 2 < 40)
+    return {
+        "image": rng.random((h, w, 3)).astype(np.float32),
+        "image_bg": rng.random((h, w, 3)).astype(np.float32),
+        "depth": depth.astype(np.float32),
+        "depth_bg": np.full((h, w), 0.3, np.float32),
+        "mask": (depth > 0.5).astype(np.float32),
+        "config": {},
+    }
+
+
+def test_sampler_repeats_across_edges():
+    tex = np.array([[0.0, 1.0, 2.0, 3.0]], dtype=np.float32)
+    # 纹素中心在 (i + 0.5) / 4；u = 0 处在纹素 3 与纹素 0 之间 (REPEAT)
+    assert np.allclose(sample(tex, np.array([0.125, 0.0, 1.0]), np.array([0.5, 0.5, 0.5])), [0.0, 1.5, 1.5])
+
+
+def test_batched_frames_match_single_frames(scene):
+    params = [params_from_config({}, offset_x=x, offset_y=-x / 2, sat=s)
+              for x, s in ((0.0, 0.0), (0.3, 0.5), (-0.6, 1.0), (0.9, 1.6))]
+    batch = render_frames(scene, params, size=(20, 30), chunk_pixels=777)
+    for frame, p in zip(batch, params):
+        assert np.array_equal(frame, render_frame(scene, (20, 30), **p))
+
+
+def test_only_saturation_changes_colour():
+    color = np.array([[0.2, 0.5, 0.9], [0.2, 0.5, 0.9]], dtype=np.float32)
+    out = apply_color(color, np.array([0.0, 0.5], dtype=np.float32))
+    assert np.array_equal(out[0], color[0])
+    gray = color[1] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    assert np.allclose(out[1], gray + (color[1] - gray) * 0.5)
+
+
+def test_unimplemented_ubo_fields_do_not_affect_output(scene):
+    base = render_frame(scene, (16, 12), offset_x=0.2)
+    extra = render_frame(scene, (16, 12), offset_x=0.2, vig=1.0, con=2.0, bri=0.5, gam=2.2, sep=1.0, gray=1.0)
+    assert np.array_equal(base, extra)
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+import reference_renderer
+from render_video import camera_params, stream_frames, validate_camera_path, write_gif
+
+
+def _frames(n, size=(40, 30)):
+    for i in range(n):
+        f = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        f[..., 0] = i * 20
+        f[:, i:i + 5] = (0, 255, 0)
+        f[::3, ::4] = np.random.default_rng(i).integers(0, 256, f[::3, ::4].shape)
+        yield f
+
+
+def test_gif_is_written_frame_by_frame(tmp_path):
+    out = tmp_path / "clip.gif"
+    assert write_gif(_frames(12), out, fps=20) == 12
+
+    with Image.open(out) as im:
+        assert im.n_frames == 12
+        assert im.info["loop"] == 0 and im.info["duration"] == 50
+        for got, frame in zip(ImageSequence.Iterator(im), _frames(12)):
+            want = Image.fromarray(frame).quantize(256).convert("RGB")
+            assert np.array_equal(np.asarray(got.convert("RGB")), np.asarray(want))
+
+
+def test_stream_frames_matches_direct_render(tmp_path):
+    rng = np.random.default_rng(0)
+    for name in ("image.png", "image_bg.png"):
+        Image.fromarray(rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)).save(tmp_path / name)
+    for name in ("depth.png", "depth_bg.png", "subject_mask.png"):
+        Image.fromarray(rng.integers(0, 256, (24, 32), dtype=np.uint8)).save(tmp_path / name)
+    (tmp_path / "config.json").write_text(json.dumps({"height": 0.2}))
+
+    scene = reference_renderer.load_scene(tmp_path)
+    base = reference_renderer.params_from_config(scene["config"])
+    path = {"keyframes": [{"t": 0.0, "offset_x": -0.3}, {"t": 1.0, "offset_x": 0.3}]}
+    params = [camera_params(path, base, i, 5) for i in range(5)]
+
+    frames = list(stream_frames(tmp_path, params, (16, 12), workers=2))
+    assert len(frames) == 5
+    for frame, p in zip(frames, params):
+        assert np.array_equal(frame, reference_renderer.render_frame(scene, (16, 12), **p))
+
+
+def test_unsupported_keyframe_fields_are_rejected():
+    validate_camera_path({"keyframes": [{"t": 0.0, "isometric": 0.0}]})
+    with pytest.raises(ValueError, match="dolly"):
+        validate_camera_path({"keyframes": [{"t": 0.5, "dolly": 0.5}]})
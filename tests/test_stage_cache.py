@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+from stage_cache import StageCache
+
+
+def _image(seed, size=(16, 12)):
+    arr = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    return Image.fromarray(arr)
+
+
+def test_miss_then_hit_round_trips_png_and_npy(tmp_path):
+    cache = StageCache(tmp_path)
+    img = _image(0)
+    key = cache.make_key("depth", [img], params={"size": 518})
+    assert cache.get("depth", key) is None
+
+    depth = np.random.default_rng(1).random((12, 16)).astype(np.float32)
+    cache.put(key, depth)
+    got = cache.get("depth", key)
+    assert got.dtype == np.float32 and np.array_equal(got, depth)
+
+    key_img = cache.make_key("background", [img])
+    cache.put(key_img, img)
+    assert np.array_equal(np.asarray(cache.get("background", key_img)), np.asarray(img))
+    assert cache.stats == {"depth": {"hits": 1, "misses": 1}, "background": {"hits": 1, "misses": 0}}
+
+
+def test_key_changes_with_input_params_stage_and_weights(tmp_path):
+    model = tmp_path / "model"
+    model.mkdir()
+    weights = model / "model.safetensors"
+    weights.write_bytes(b"v1")
+    cache = StageCache(tmp_path / "cache")
+    img = _image(0)
+
+    base = cache.make_key("depth", [img], model, {"size": 518})
+    assert cache.make_key("depth", [img.copy()], model, {"size": 518}) == base
+    assert cache.make_key("depth", [_image(1)], model, {"size": 518}) != base
+    assert cache.make_key("depth", [img], model, {"size": 1024}) != base
+    assert cache.make_key("mask", [img], model, {"size": 518}) != base
+    assert cache.make_key("depth", [img], None, {"size": 518}) != base
+    assert cache.make_key("depth", [np.asarray(img)], model, {"size": 518}) != base
+
+    # 权重内容变化后，新实例 (指纹不在内存中) 得到不同的键
+    time.sleep(0.01)
+    weights.write_bytes(b"v2")
+    assert StageCache(tmp_path / "cache").make_key("depth", [img], model, {"size": 518}) != base
+
+
+def test_limit_evicts_least_recently_used(tmp_path):
+    entry = np.zeros((32, 32), dtype=np.float32)
+    cache = StageCache(tmp_path, max_bytes=None)
+    cache.put("00" * 32, entry)
+    size = next(tmp_path.glob("*/*.npy")).stat().st_size
+
+    cache = StageCache(tmp_path, max_bytes=4 * size)
+    keys = [f"{i:02x}" * 32 for i in range(1, 6)]
+    for key in keys[:3]:
+        time.sleep(0.01)
+        cache.put(key, entry)
+    time.sleep(0.01)
+    assert cache.get("s", "00" * 32) is not None   # 刷新最早条目的 LRU 时间
+    for key in keys[3:]:
+        time.sleep(0.01)
+        cache.put(key, entry)
+
+    assert cache.evictions > 0
+    assert cache.get("s", "00" * 32) is not None
+    assert cache.get("s", keys[0]) is None
+    assert cache.get("s", keys[-1]) is not None
+    assert sum(p.stat().st_size for p in tmp_path.glob("*/*.npy")) <= 4 * size
@@ -0,0 +1,70 @@
+import itertools
+import threading
+
+import pytest
+
+import stage_pipeline
+from stage_pipeline import run_pipeline
+
+
+def _pipeline_threads(name):
+    return [t for t in threading.enumerate() if t.name.startswith(f"{name}-") and t.is_alive()]
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_results_keep_source_order(depth):
+    results = run_pipeline("order", range(20), lambda x: x * 2, lambda x: x + 1, depth=depth)
+    assert results == [x * 2 + 1 for x in range(20)]
+
+
+@pytest.mark.parametrize("stage", ["preprocess", "inference", "postprocess"])
+def test_error_in_any_stage_is_raised_and_threads_stop(stage):
+    name = f"err-{stage}"
+
+    def source():
+        for i in itertools.count():          # 无限来源: 生产线程必须被 stop 释放，而不是自然结束
+            if stage == "preprocess" and i == 3:
+                raise ValueError("bad input")
+            yield i
+
+    def infer(x):
+        if stage == "inference" and x == 3:
+            raise ValueError("bad batch")
+        return x
+
+    def post(x):
+        if stage == "postprocess" and x == 3:
+            raise ValueError("bad output")
+        return x
+
+    with pytest.raises(ValueError, match="bad"):
+        run_pipeline(name, source(), infer, post, depth=2)
+    assert _pipeline_threads(name) == []
+
+
+def test_producer_is_bounded_by_queue_depth_after_failure():
+    pulled = []
+
+    def source():
+        for i in itertools.count():
+            pulled.append(i)
+            yield i
+
+    def infer(x):
+        raise RuntimeError("model crashed")
+
+    with pytest.raises(RuntimeError):
+        run_pipeline("bounded", source(), infer, lambda x: x, depth=2)
+    # 队列长度 2 + 推理中的 1 + 生产线程手上的 1
+    assert len(pulled) <= 5
+
+
+def test_stats_record_units_and_stages():
+    stage_pipeline.reset()
+    run_pipeline("stats", range(4), lambda x: x, lambda x: x, depth=2)
+    entry = stage_pipeline.STATS["stats"]
+    assert entry["units"] == 4
+    assert set(entry["stages"]) == {"preprocess", "inference", "postprocess"}
+    assert "stats" in stage_pipeline.summary()
+    stage_pipeline.reset()
+    assert stage_pipeline.summary().endswith("no runs recorded")
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+from PIL import Image
+
+from texture_bundle import build_mip_chain, export_bundle, pack_maps, read_bundle, verify_bundle
+
+
+def _write_assets(asset_dir, w=37, h=23):
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(asset_dir / "image.png")
+    Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(asset_dir / "image_bg.png")
+    gray = {name: rng.integers(0, 256, (h, w), dtype=np.uint8) for name in ("depth", "depth_bg", "subject_mask")}
+    for name, arr in gray.items():
+        Image.fromarray(arr).save(asset_dir / f"{name}.png")
+    config = {"height": 0.2, "zoom": 1.0, "resolution": [w, h]}
+    (asset_dir / "config.json").write_text(json.dumps(config))
+    return gray, config
+
+
+def test_pack_unpack_round_trip(tmp_path):
+    gray, config = _write_assets(tmp_path)
+    path = export_bundle(tmp_path)
+    bundle = read_bundle(path)
+
+    color = np.asarray(Image.open(tmp_path / "image.png").convert("RGBA"))
+    expected_color = build_mip_chain(color)
+    assert len(bundle["color"]) == len(expected_color)
+    for got, want in zip(bundle["color"], expected_color):
+        assert got.tobytes() == want.tobytes()
+    assert bundle["color"][-1].shape == (1, 1, 4)
+
+    maps = pack_maps(gray["depth"], gray["depth_bg"], gray["subject_mask"])
+    assert bundle["maps"][0].tobytes() == maps.tobytes()
+    assert bundle["config"] == config
+    assert verify_bundle(path, tmp_path) == []
+
+
+def test_round_trip_without_mips(tmp_path):
+    _write_assets(tmp_path)
+    path = export_bundle(tmp_path, mips=False)
+    bundle = read_bundle(path)
+    color_bg = np.asarray(Image.open(tmp_path / "image_bg.png").convert("RGBA"))
+    assert len(bundle["color_bg"]) == 1
+    assert bundle["color_bg"][0].tobytes() == color_bg.tobytes()
+    assert verify_bundle(path, tmp_path) == []
+
+
+def test_mip_level_is_a_single_rounded_box_average():
+    rgba = np.random.default_rng(2).integers(0, 256, (34, 20, 4), dtype=np.uint8)
+    level1 = build_mip_chain(rgba)[1]
+    block = rgba.astype(np.float64).reshape(17, 2, 10, 2, 4).mean(axis=(1, 3))
+    assert np.array_equal(level1, np.floor(block + 0.5).astype(np.uint8))
+
+    # 1/4 覆盖的纹素块: 单次取整为 0，分轴两次向上取整会得到 1
+    assert build_mip_chain(np.array([[[0], [0]], [[0], [1]]], dtype=np.uint8))[1].item() == 0
+
+
+def test_mip_chain_does_not_drift_brighter():
+    rgba = np.random.default_rng(3).integers(0, 256, (256, 256, 4), dtype=np.uint8)
+    levels = build_mip_chain(rgba)
+    assert levels[-1].shape == (1, 1, 4)
+    assert np.abs(levels[-1].astype(np.float64) - rgba.mean(axis=(0, 1))).max() < 2.0
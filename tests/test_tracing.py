@@ -0,0 +1,44 @@
+import json
+import threading
+
+from tracing import Tracer
+
+
+def _thread_names(path):
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    return {e["name"]: names[e["tid"]] for e in events if e["ph"] == "X"}
+
+
+def _span_in_thread(tracer, name):
+    def run():
+        with tracer.span(name):
+            pass
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    worker.join()
+
+
+def test_main_thread_named_by_identity_not_order(tmp_path):
+    tracer = Tracer()
+    tracer.enable()
+
+    # worker 的 span 先记录，主线程的 span 后记录
+    _span_in_thread(tracer, "worker_span")
+    with tracer.span("main_span"):
+        pass
+
+    names = _thread_names(tracer.export_chrome_trace(str(tmp_path / "trace.json")))
+    assert names["main_span"] == "main"
+    assert names["worker_span"].startswith("worker-")
+
+
+def test_no_main_label_without_main_thread_spans(tmp_path):
+    tracer = Tracer()
+    tracer.enable()
+    _span_in_thread(tracer, "only_worker")
+
+    names = _thread_names(tracer.export_chrome_trace(str(tmp_path / "trace.json")))
+    assert names["only_worker"] != "main"
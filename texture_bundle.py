@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+GPU 直传纹理包 (.dftb)
+把一个场景的五张 PNG 打包成单个二进制文件，加载端按头部索引直接 memcpy 到 staging buffer，无需 PNG 解码:
+  color     image.png            R8G8B8A8_UNORM，可选完整 mip 链
+  color_bg  image_bg.png         R8G8B8A8_UNORM，可选完整 mip 链
+  maps      R=depth  G=depth_bg  B=subject_mask  A=深度梯度   R8G8B8A8_UNORM，单层
+  config    config.json 原文     (vk_format = 0，原始字节)
+单通道的深度 / 遮罩合并进一张 4 通道纹理，每个纹素从 3 x 4 字节降到 4 字节。
+
+文件布局 (小端):
+  Header  32 字节: magic "DFTB" | version u32 | record_count u32 | data_offset u32 | 16 字节保留
+  Record  64 字节 x record_count:
+          name 24s | vk_format u32 | channels u32 | level u32 | width u32 | height u32 | 保留 u32 |
+          offset u64 | size u64
+  Data    每条记录的像素数据，紧密排列 (row pitch = width * channels)，起始地址按 16 字节对齐
+
+用法:
+  python texture_bundle.py pack   <asset_dir> [-o scene.dftb] [--no-mips]
+  python texture_bundle.py info   <bundle>
+  python texture_bundle.py verify <bundle> <asset_dir>
+"""
+import argparse
+import json
+import mmap
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+MAGIC = b"DFTB"
+VERSION = 1
+HEADER = struct.Struct("<4sIII16x")
+RECORD = struct.Struct("<24sIIIII4xQQ")
+ALIGN = 16
+
+VK_FORMAT_UNDEFINED = 0
+VK_FORMAT_R8_UNORM = 9
+VK_FORMAT_R8G8B8A8_UNORM = 37
+
+BUNDLE_NAME = "scene.dftb"
+
+
+# === 打包前的像素处理 ===
+
+def depth_gradient(depth_u8):
+    """
+    与 depthflow.frag 中 RayMarch 的梯度一致: 1 像素中心差分，取 x / y 方向绝对差的最大值
+    (镜像边界)，结果按 0-255 量化
+    """
+    d = np.pad(depth_u8.astype(np.int16), 1, mode="reflect")
+    gx = np.abs(d[1:-1, :-2] - d[1:-1, 2:])
+    gy = np.abs(d[:-2, 1:-1] - d[2:, 1:-1])
+    return np.maximum(gx, gy).astype(np.uint8)
+
+
+def build_mip_chain(rgba):
+    """
+    2x2 盒式滤波逐级缩小到 1x1 (奇数边复制最后一行 / 列)，返回 [level0, level1, ...]
+    每级只做一次四舍五入: (a + b + c + d + 2) // 4 (只剩一行 / 一列时为两个纹素的平均)，
+    分轴各取整一次会让每级偏亮。每级都从上一级的 uint8 结果计算，与 GPU 生成 mip 的方式一致。
+    """
+    levels = [rgba]
+    cur = rgba
+    while cur.shape[0] > 1 or cur.shape[1] > 1:
+        cur = cur.astype(np.uint16)
+        if cur.shape[0] % 2 and cur.shape[0] > 1:
+            cur = np.concatenate([cur, cur[-1:]], axis=0)
+        if cur.shape[1] % 2 and cur.shape[1] > 1:
+            cur = np.concatenate([cur, cur[:, -1:]], axis=1)
+        if cur.shape[0] > 1 and cur.shape[1] > 1:
+            cur = (cur[0::2, 0::2] + cur[1::2, 0::2] + cur[0::2, 1::2] + cur[1::2, 1::2] + 2) // 4
+        elif cur.shape[0] > 1:
+            cur = (cur[0::2] + cur[1::2] + 1) // 2
+        else:
+            cur = (cur[:, 0::2] + cur[:, 1::2] + 1) // 2
+        cur = cur.astype(np.uint8)
+        levels.append(cur)
+    return levels
+
+
+def _load_gray(path, size):
+    im = Image.open(path).convert("L")
+    if im.size != size:
+        im = im.resize(size, Image.Resampling.BILINEAR)
+    return np.asarray(im)
+
+
+def pack_maps(depth, depth_bg, mask):
+    """depth / depth_bg / mask 为同尺寸 uint8 数组，返回 RGBA 打包纹理"""
+    return np.dstack([depth, depth_bg, mask, depth_gradient(depth)])
+
+
+def scene_layers(asset_dir, mips=True):
+    """从资产目录读取并组织所有层: {name: (vk_format, [level arrays] 或 bytes)}"""
+    asset_dir = Path(asset_dir)
+    image = Image.open(asset_dir / "image.png").convert("RGBA")
+    image_bg = Image.open(asset_dir / "image_bg.png").convert("RGBA")
+    size = image.size
+    if image_bg.size != size:
+        image_bg = image_bg.resize(size, Image.Resampling.LANCZOS)
+
+    color = np.asarray(image)
+    color_bg = np.asarray(image_bg)
+    maps = pack_maps(_load_gray(asset_dir / "depth.png", size),
+                     _load_gray(asset_dir / "depth_bg.png", size),
+                     _load_gray(asset_dir / "subject_mask.png", size))
+
+    layers = {
+        "color": (VK_FORMAT_R8G8B8A8_UNORM, build_mip_chain(color) if mips else [color]),
+        "color_bg": (VK_FORMAT_R8G8B8A8_UNORM, build_mip_chain(color_bg) if mips else [color_bg]),
+        "maps": (VK_FORMAT_R8G8B8A8_UNORM, [maps]),
+    }
+    config = asset_dir / "config.json"
+    if config.exists():
+        layers["config"] = (VK_FORMAT_UNDEFINED, config.read_bytes())
+    return layers
+
+
+# === 读写 ===
+
+def write_bundle(layers, path):
+    """layers: {name: (vk_format, [levels] 或 bytes)}，原子写入 path"""
+    records = []
+    for name, (vk_format, payload) in layers.items():
+        if isinstance(payload, (bytes, bytearray)):
+            records.append((name, vk_format, 1, 0, len(payload), 1, bytes(payload)))
+            continue
+        for level, arr in enumerate(payload):
+            arr = np.ascontiguousarray(arr, dtype=np.uint8)
+            channels = 1 if arr.ndim == 2 else arr.shape[2]
+            records.append((name, vk_format, channels, level, arr.shape[1], arr.shape[0], arr))
+
+    offset = _align(HEADER.size + RECORD.size * len(records))
+    data_offset = offset
+    index = []
+    for name, vk_format, channels, level, w, h, data in records:
+        size = len(data) if isinstance(data, bytes) else data.nbytes
+        index.append(RECORD.pack(name.encode()[:24], vk_format, channels, level, w, h, offset, size))
+        offset = _align(offset + size)
+
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), data_offset))
+        f.writelines(index)
+        for (_, _, _, _, _, _, data), rec in zip(records, index):
+            rec_offset = RECORD.unpack(rec)[6]
+            f.write(b"\0" * (rec_offset - f.tell()))
+            f.write(data if isinstance(data, bytes) else data.tobytes())
+    tmp.replace(path)
+    return path
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def read_index(buf):
+    """解析头部与索引，返回记录列表 (dict)"""
+    magic, version, count, data_offset = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a DepthFlow texture bundle")
+    if version != VERSION:
+        raise ValueError(f"Unsupported bundle version {version}")
+
+    records = []
+    for i in range(count):
+        name, vk_format, channels, level, w, h, offset, size = RECORD.unpack_from(buf, HEADER.size + i * RECORD.size)
+        records.append({"name": name.rstrip(b"\0").decode(), "vk_format": vk_format, "channels": channels,
+                        "level": level, "width": w, "height": h, "offset": offset, "size": size})
+    return records
+
+
+def read_bundle(path):
+    """
+    读取纹理包，返回 {name: [level 数组...]} (config 为 dict)。
+    像素数组是内存映射上的零拷贝视图，文件在返回对象存活期间保持映射。
+    """
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    layers = {}
+    for rec in read_index(buf):
+        if rec["vk_format"] == VK_FORMAT_UNDEFINED:
+            raw = bytes(buf[rec["offset"]:rec["offset"] + rec["size"]])
+            layers[rec["name"]] = json.loads(raw) if rec["name"] == "config" else raw
+            continue
+        shape = (rec["height"], rec["width"]) + ((rec["channels"],) if rec["channels"] > 1 else ())
+        arr = np.frombuffer(buf, dtype=np.uint8, count=rec["size"], offset=rec["offset"]).reshape(shape)
+        layers.setdefault(rec["name"], []).append(arr)
+    return layers
+
+
+def export_bundle(asset_dir, output=None, mips=True):
+    """资产目录 -> 纹理包，默认写到 asset_dir/scene.dftb"""
+    asset_dir = Path(asset_dir)
+    return write_bundle(scene_layers(asset_dir, mips), output or asset_dir / BUNDLE_NAME)
+
+
+# === 校验 ===
+
+def verify_bundle(bundle_path, asset_dir):
+    """把纹理包与源 PNG 逐像素比较，返回问题列表 (空列表表示一致)"""
+    problems = []
+    bundle = read_bundle(bundle_path)
+    expected = scene_layers(asset_dir, mips=len(bundle.get("color", [])) > 1)
+
+    for name, (vk_format, payload) in expected.items():
+        if name not in bundle:
+            problems.append(f"missing layer '{name}'")
+            continue
+        got = bundle[name]
+        if isinstance(payload, bytes):
+            if got != json.loads(payload):
+                problems.append(f"layer '{name}' differs")
+            continue
+        if len(got) != len(payload):
+            problems.append(f"layer '{name}': {len(got)} mip levels, expected {len(payload)}")
+            continue
+        for level, (a, b) in enumerate(zip(got, payload)):
+            if a.shape != b.shape:
+                problems.append(f"layer '{name}' level {level}: shape {a.shape} != {b.shape}")
+            elif not np.array_equal(a, b):
+                problems.append(f"layer '{name}' level {level}: {int(np.count_nonzero(a != b))} texels differ")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack, inspect and verify DepthFlow texture bundles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_pack = sub.add_parser("pack", help="Pack an asset directory into a bundle")
+    p_pack.add_argument("asset_dir")
+    p_pack.add_argument("-o", "--output", help=f"Output path (default: <asset_dir>/{BUNDLE_NAME})")
+    p_pack.add_argument("--no-mips", action="store_true", help="Skip colour mip chains")
+
+    p_info = sub.add_parser("info", help="Print the bundle index")
+    p_info.add_argument("bundle")
+
+    p_verify = sub.add_parser("verify", help="Compare a bundle against its source PNGs")
+    p_verify.add_argument("bundle")
+    p_verify.add_argument("asset_dir")
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        path = export_bundle(args.asset_dir, args.output, mips=not args.no_mips)
+        print(f"📦 Bundle written: {path} ({path.stat().st_size / 1024 ** 2:.1f} MB)")
+    elif args.command == "info":
+        with open(args.bundle, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            for rec in read_index(buf):
+                print(f"{rec['name']:<10} level={rec['level']:<2} {rec['width']}x{rec['height']}x{rec['channels']} "
+                      f"vk_format={rec['vk_format']} offset={rec['offset']} size={rec['size']}")
+    else:
+        problems = verify_bundle(args.bundle, args.asset_dir)
+        for p in problems:
+            print(f"❌ {p}")
+        if problems:
+            sys.exit(1)
+        print("✅ Bundle matches source assets")
+
+
+if __name__ == "__main__":
+    main()
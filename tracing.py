@@ -0,0 +1,180 @@
+"""
+轻量级结构化追踪
+用嵌套的 span 记录各阶段耗时 (模型加载、预处理、推理、插值、CPU 传输、PIL 缩放、PNG 编码 ...)，
+以及传输字节数与张量形状；导出为 Chrome trace-event JSON (chrome://tracing 或 Perfetto 打开) 并打印汇总表。
+
+默认关闭: span() 直接返回共享的空对象，开销只有一次函数调用和一次全局判断。
+
+    from tracing import TRACER, span
+    TRACER.enable()
+    with span("inference", model="depth") as sp:
+        out = model(x)
+        sp.set(shape=out.shape, bytes=nbytes(out))
+    TRACER.export_chrome_trace("trace.json")
+    print(TRACER.summary())
+"""
+import json
+import os
+import threading
+import time
+
+
+def nbytes(obj):
+    """torch 张量 / numpy 数组 / PIL 图像 / bytes 的字节数，无法识别时返回 0"""
+    if obj is None:
+        return 0
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if hasattr(obj, "element_size") and hasattr(obj, "numel"):
+        return int(obj.element_size() * obj.numel())
+    if hasattr(obj, "size") and hasattr(obj, "mode") and hasattr(obj, "getbands"):
+        w, h = obj.size
+        return w * h * len(obj.getbands())
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(o) for o in obj)
+    return 0
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)) or type(value).__name__ == "Size":
+        return [_jsonable(v) for v in value]
+    return str(value)
+
+
+class _NullSpan:
+    """追踪关闭时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        self.child_ns = 0
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.tracer._stack().pop()
+        duration = end - self.start
+        if self.parent is not None:
+            self.parent.child_ns += duration
+        self.tracer._record(self, duration)
+        return False
+
+    def set(self, **args):
+        """在 span 内补充属性，如 bytes / shape"""
+        self.args.update(args)
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+        self._origin = time.perf_counter_ns()
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, args)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, span, duration):
+        event = {"name": span.name, "start_ns": span.start - self._origin, "dur_ns": duration,
+                 "self_ns": duration - span.child_ns, "depth": span.depth, "tid": threading.get_ident(),
+                 "args": {k: _jsonable(v) for k, v in span.args.items()}}
+        with self._lock:
+            self.events.append(event)
+
+    # --- 导出 ---
+
+    def export_chrome_trace(self, path):
+        """写出 Chrome trace-event 格式 (完整事件 "ph": "X"，时间单位微秒)"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        # 主线程按线程标识判断，而不是取第一个出现的线程 (worker 的 span 可能先结束、先被记录)
+        main_ident = threading.main_thread().ident
+        tids = {}
+        trace = [{"name": e["name"], "ph": "X", "pid": pid, "tid": tids.setdefault(e["tid"], len(tids)),
+                  "ts": e["start_ns"] / 1000.0, "dur": e["dur_ns"] / 1000.0, "args": e["args"]}
+                 for e in events]
+        trace += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                   "args": {"name": "main" if ident == main_ident else f"worker-{tid}"}}
+                  for ident, tid in tids.items()]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, path)
+        return path
+
+    def summary(self):
+        """按 span 名汇总: 次数、总耗时、自身耗时 (不含子 span)、平均耗时、字节数"""
+        with self._lock:
+            events = list(self.events)
+        if not events:
+            return "📊 Trace: no spans recorded"
+
+        rows = {}
+        for e in events:
+            r = rows.setdefault(e["name"], [0, 0, 0, 0])
+            r[0] += 1
+            r[1] += e["dur_ns"]
+            r[2] += e["self_ns"]
+            r[3] += e["args"].get("bytes", 0) if isinstance(e["args"].get("bytes"), int) else 0
+
+        lines = ["📊 Trace summary",
+                 f"{'span':<32} {'count':>6} {'total (s)':>10} {'self (s)':>10} {'mean (ms)':>10} {'MB':>9}"]
+        for name, (count, total, own, moved) in sorted(rows.items(), key=lambda kv: -kv[1][2]):
+            lines.append(f"{name:<32} {count:>6} {total / 1e9:>10.3f} {own / 1e9:>10.3f} "
+                         f"{total / count / 1e6:>10.2f} {moved / 1024 ** 2:>9.1f}")
+        return "\n".join(lines)
+
+
+# 全局共享实例
+TRACER = Tracer()
+
+
+def span(name, **args):
+    return TRACER.span(name, **args)